@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import setup, find_packages
 
 requires=[
     'python-openid',
@@ -34,7 +34,7 @@ setup(name='velruse',
       maintainer='Michael Merickel',
       maintainer_email='oss@m.merickel.org',
       url='velruse.readthedocs.org',
-      packages=['velruse'],
+      packages=find_packages(exclude=['tests', 'tests.*']),
       include_package_data=True,
       zip_safe=False,
       install_requires=requires,
@@ -44,5 +44,14 @@ setup(name='velruse',
       entry_points="""
       [paste.app_factory]
       main = velruse.app:make_velruse_app
+
+      [paste.filter_app_factory]
+      main = velruse.middleware:make_velruse_middleware
+
+      [anykeystore.backends]
+      shm = velruse.store.shm:SharedMemoryStore
+      sqlite = velruse.store.sqlite:SQLiteStore
+      pipelined = velruse.store.pipeline:PipelinedStore
+      tiered = velruse.store.tiered:TieredStore
       """,
       )
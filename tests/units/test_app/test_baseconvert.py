@@ -4,21 +4,34 @@ import unittest2 as unittest
 class TestBaseEncoding(unittest.TestCase):
 
     def test_encode(self):
-        from velruse.baseconvert import base_encode
+        from velruse.app.baseconvert import base_encode
         self.assertEqual(base_encode(42), 'L')
         self.assertEqual(base_encode(425242), '4rBC')
         self.assertEqual(base_encode(0), '2')
 
     def test_bad_encode(self):
-        from velruse.baseconvert import base_encode
+        from velruse.app.baseconvert import base_encode
         self.assertRaises(TypeError, base_encode, 'fred')
 
     def test_decode(self):
-        from velruse.baseconvert import base_decode
+        from velruse.app.baseconvert import base_decode
         self.assertEqual(base_decode('L'), 42)
         self.assertEqual(base_decode('4rBC'), 425242)
         self.assertEqual(base_decode('2'), 0)
 
     def test_bad_decode(self):
-        from velruse.baseconvert import base_decode
+        from velruse.app.baseconvert import base_decode
         self.assertRaises(ValueError, base_decode, '381')
+        self.assertRaises(ValueError, base_decode, '3810')
+
+    def test_roundtrip(self):
+        from velruse.app.baseconvert import base_decode
+        from velruse.app.baseconvert import base_encode
+        for num in (55, 56, 57, 3135, 3136, 3137, 2 ** 128 - 1):
+            self.assertEqual(base_decode(base_encode(num)), num)
+
+    def test_other_alphabet(self):
+        from velruse.app.baseconvert import base_encode
+        from velruse.app.baseconvert import base_n_decoder
+        self.assertEqual(base_encode(255, '01'), '11111111')
+        self.assertEqual(base_n_decoder('01')('11111111'), 255)
@@ -0,0 +1,93 @@
+import unittest2 as unittest
+
+
+class TestRedirectDelivery(unittest.TestCase):
+
+    def _makeOne(self, endpoint, fragment=False):
+        from velruse.app.delivery import RedirectDelivery
+        return RedirectDelivery(endpoint, fragment)
+
+    def test_query(self):
+        response = self._makeOne('http://example.com/done')('a b/c')
+        self.assertEqual(response.status_int, 302)
+        self.assertEqual(response.location,
+                         'http://example.com/done?token=a%20b%2Fc')
+        self.assertEqual(response.cache_control.no_store, True)
+
+    def test_query_existing_params(self):
+        delivery = self._makeOne('http://example.com/done?next=/x#top')
+        self.assertEqual(delivery('abc').location,
+                         'http://example.com/done?next=/x&token=abc#top')
+
+    def test_fragment(self):
+        delivery = self._makeOne('http://example.com/done', fragment=True)
+        self.assertEqual(delivery('abc').location,
+                         'http://example.com/done#token=abc')
+
+    def test_fragment_existing_anchor(self):
+        delivery = self._makeOne('http://example.com/done?a=1#view=x',
+                                 fragment=True)
+        self.assertEqual(delivery('abc').location,
+                         'http://example.com/done?a=1#view=x&token=abc')
+
+
+class TestPostMessageDelivery(unittest.TestCase):
+
+    def _makeOne(self, origin='https://app.example.com'):
+        from velruse.app.delivery import PostMessageDelivery
+        return PostMessageDelivery(origin)
+
+    def test_origin(self):
+        response = self._makeOne()('abc')
+        self.assertEqual(response.content_type, 'text/html')
+        self.assertEqual(response.cache_control.no_store, True)
+        self.assertTrue(
+            b'postMessage({type: "velruse", token: "abc"}, '
+            b'"https://app.example.com");' in response.body)
+
+    def test_token_escaped(self):
+        body = self._makeOne()('a"</script><b>&x').body
+        self.assertTrue(
+            b'token: "a\\"\\u003c/script\\u003e\\u003cb\\u003e'
+            b'\\u0026x"}' in body)
+        self.assertEqual(body.count(b'</script>'), 1)
+        self.assertFalse(b'<b>' in body)
+
+    def test_origin_escaped(self):
+        body = self._makeOne('https://x.com"</script><script>')('abc').body
+        self.assertTrue(
+            b'"https://x.com\\"\\u003c/script\\u003e'
+            b'\\u003cscript\\u003e");' in body)
+        self.assertEqual(body.count(b'<script>'), 1)
+
+
+class TestDeliverySetting(unittest.TestCase):
+
+    def _makeApp(self, **settings):
+        from velruse.app import make_app
+        settings.setdefault('endpoint', 'http://example.com/done')
+        settings.setdefault('session.secret', 'seekrit')
+        return make_app(**settings)
+
+    def test_redirect(self):
+        from velruse.app.delivery import RedirectDelivery
+        app = self._makeApp(delivery='fragment')
+        self.assertTrue(isinstance(app.registry.velruse_delivery,
+                                   RedirectDelivery))
+        self.assertEqual(app.registry.velruse_delivery('abc').location,
+                         'http://example.com/done#token=abc')
+
+    def test_postmessage(self):
+        app = self._makeApp(delivery='postmessage',
+                            postmessage_origin='https://app.example.com')
+        body = app.registry.velruse_delivery('abc').body
+        self.assertTrue(b'"https://app.example.com");' in body)
+
+    def test_postmessage_missing_origin(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeApp,
+                          delivery='postmessage')
+
+    def test_unknown(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeApp, delivery='nope')
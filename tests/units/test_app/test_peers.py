@@ -0,0 +1,115 @@
+import requests
+import unittest2 as unittest
+
+
+class TestTokenNode(unittest.TestCase):
+
+    def _callFUT(self, token):
+        from velruse.app.peers import token_node
+        return token_node(token)
+
+    def test_unmarked(self):
+        self.assertEqual(self._callFUT('abc'), None)
+
+    def test_marked(self):
+        from velruse.app.peers import add_node
+        self.assertEqual(self._callFUT(add_node('abc', 'b')), 'b')
+
+    def test_dotted_node(self):
+        from velruse.app.peers import split_node
+        self.assertEqual(self._callFUT('abc.eu.b'), 'eu.b')
+        self.assertEqual(split_node('abc.eu.b'), ('abc', 'eu.b'))
+        self.assertEqual(split_node('abc'), ('abc', None))
+
+
+class DummyResponse(object):
+
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+
+
+class DummySession(object):
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append((url, params, timeout))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class TestPeerClient(unittest.TestCase):
+
+    def _makeOne(self, result):
+        from velruse.app.peers import PeerClient
+        client = PeerClient({'b': 'http://10.0.0.2/velruse'}, timeout=1)
+        client.session = DummySession(result)
+        return client
+
+    def test_retrieve(self):
+        client = self._makeOne(DummyResponse(200, b'{"profile":{}}'))
+        self.assertEqual(client.retrieve('b', 'abc.b'), b'{"profile":{}}')
+        self.assertEqual(client.session.calls, [(
+            'http://10.0.0.2/velruse/auth_info',
+            {'format': 'json', 'token': 'abc.b'},
+            1.0)])
+
+    def test_unknown_node(self):
+        client = self._makeOne(DummyResponse(200))
+        self.assertRaises(KeyError, client.retrieve, 'c', 'abc.c')
+        self.assertEqual(client.session.calls, [])
+
+    def test_unknown_token(self):
+        client = self._makeOne(DummyResponse(400, b'null'))
+        self.assertRaises(KeyError, client.retrieve, 'b', 'abc.b')
+
+    def test_unreachable(self):
+        client = self._makeOne(requests.ConnectionError('refused'))
+        self.assertRaises(KeyError, client.retrieve, 'b', 'abc.b')
+
+
+class DummyPeers(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def retrieve(self, node, token):
+        self.calls.append((node, token))
+        return b'{"peer":true}'
+
+
+class TestRetrieveResult(unittest.TestCase):
+
+    def setUp(self):
+        from pyramid.config import Configurator
+        from anykeystore import create_store
+        config = Configurator(settings={'node': 'a'})
+        config.registry.velruse_store = create_store('memory')
+        config.registry.velruse_peers = DummyPeers()
+        self.registry = config.registry
+
+    def _callFUT(self, token):
+        from pyramid.request import Request
+        from velruse.app import retrieve_result
+        request = Request.blank('/auth_info')
+        request.registry = self.registry
+        return retrieve_result(request, token)
+
+    def test_peer_token(self):
+        self.assertEqual(self._callFUT('abc.b'), b'{"peer":true}')
+        self.assertEqual(self.registry.velruse_peers.calls, [('b', 'abc.b')])
+
+    def test_own_token(self):
+        from velruse.app import RESULT_MARKER
+        self.registry.velruse_store.store('abc.a',
+                                          RESULT_MARKER + b'{"own":true}')
+        self.assertEqual(self._callFUT('abc.a'), b'{"own":true}')
+        self.assertEqual(self.registry.velruse_peers.calls, [])
+
+    def test_unmarked_token(self):
+        self.assertRaises(KeyError, self._callFUT, 'abc')
+        self.assertEqual(self.registry.velruse_peers.calls, [])
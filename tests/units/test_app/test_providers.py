@@ -0,0 +1,33 @@
+import unittest2 as unittest
+
+
+class TestIncludeProviders(unittest.TestCase):
+
+    def _callFUT(self, **settings):
+        from pyramid.config import Configurator
+        from velruse.app import include_providers
+        config = Configurator(settings=settings)
+        include_providers(config)
+        config.commit()
+        return config
+
+    def test_only_requested(self):
+        config = self._callFUT(**{
+            'provider.fb.impl': 'facebook',
+            'provider.fb.consumer_key': 'key',
+            'provider.fb.consumer_secret': 'secret',
+        })
+        self.assertTrue('facebook' in config.registry.velruse_providers)
+        self.assertTrue(hasattr(config, 'add_facebook_login'))
+        self.assertFalse(hasattr(config, 'add_twitter_login'))
+
+    def test_enabled(self):
+        config = self._callFUT(providers='github twitter')
+        self.assertTrue(hasattr(config, 'add_github_login'))
+        self.assertTrue(hasattr(config, 'add_twitter_login'))
+        self.assertFalse(hasattr(config, 'add_facebook_login'))
+
+    def test_unknown(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._callFUT,
+                          **{'provider.foo.consumer_key': 'key'})
@@ -0,0 +1,159 @@
+import json
+
+import unittest2 as unittest
+
+from tests.units.test_providers.test_base import (
+    DummyResponse,
+    ProviderTests,
+)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def _makeOne(self, rate, burst=None):
+        from velruse.app.refresh import RateLimiter
+        return RateLimiter(rate, burst)
+
+    def test_burst(self):
+        limiter = self._makeOne(1, burst=2)
+        self.assertTrue(limiter.acquire('a', 0))
+        self.assertTrue(limiter.acquire('a', 0))
+        self.assertFalse(limiter.acquire('a', 0))
+        # keys are limited separately
+        self.assertTrue(limiter.acquire('b', 0))
+
+    def test_wait(self):
+        import time
+        limiter = self._makeOne(50, burst=1)
+        self.assertTrue(limiter.acquire('a', 0))
+        start = time.time()
+        self.assertTrue(limiter.acquire('a', 1))
+        self.assertTrue(time.time() - start >= 0.015)
+
+
+class TestRefreshViews(ProviderTests, unittest.TestCase):
+
+    name = 'renren'
+    responses = [
+        ('https://graph.renren.com/oauth/token',
+         DummyResponse(json.dumps({'access_token': 'new'}))),
+    ]
+    settings = {
+        'provider.facebook.consumer_key': 'key',
+        'provider.facebook.consumer_secret': 'secret',
+        'refresh.enabled': 'true',
+        'tenants.providers': 'renren',
+        'tenant.acme.renren.consumer_key': 'acme-key',
+        'tenant.acme.renren.consumer_secret': 'acme-secret',
+    }
+
+    def _post(self, path, **kw):
+        from pyramid.request import Request
+        request = Request.blank('http://localhost' + path, **kw)
+        request.method = 'POST'
+        return request.get_response(self.app)
+
+    def test_refresh(self):
+        response = self._post(
+            '/refresh', POST={'format': 'json', 'provider': 'renren',
+                              'refresh_token': 'ref'})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(json.loads(response.body.decode('utf-8')), {
+            'credentials': {'oauthAccessToken': 'new',
+                            'oauthRefreshToken': 'ref'},
+        })
+        method, url, kw = self.session.calls[0]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(kw['data']['grant_type'], 'refresh_token')
+        self.assertEqual(kw['data']['refresh_token'], 'ref')
+        self.assertEqual(kw['data']['client_secret'], 'secret')
+
+    def test_refresh_unsupported(self):
+        response = self._post(
+            '/refresh', POST={'format': 'json', 'provider': 'facebook',
+                              'refresh_token': 'ref'})
+        self.assertEqual(response.status_int, 400)
+        self.assertEqual(self.session.calls, [])
+
+    def test_disabled(self):
+        from velruse.app import make_app
+        self.app = make_app(**{
+            'endpoint': 'http://example.com/logged_in',
+            'session.secret': 'seekrit',
+            'provider.renren.consumer_key': 'key',
+            'provider.renren.consumer_secret': 'secret',
+        })
+        self.assertFalse(hasattr(self.app.registry, 'velruse_refresher'))
+        response = self._post(
+            '/refresh', POST={'format': 'json', 'provider': 'renren',
+                              'refresh_token': 'ref'})
+        self.assertEqual(response.status_int, 404)
+        response = self._post('/refresh_batch?format=json', body=b'[]')
+        self.assertEqual(response.status_int, 404)
+
+    def test_refresh_tenant(self):
+        response = self._post(
+            '/refresh', POST={'format': 'json', 'provider': 'renren',
+                              'tenant': 'acme', 'refresh_token': 'ref'})
+        self.assertEqual(response.status_int, 200)
+        method, url, kw = self.session.calls[0]
+        self.assertEqual(kw['data']['client_id'], 'acme-key')
+        self.assertEqual(kw['data']['client_secret'], 'acme-secret')
+
+    def test_refresh_unknown_tenant(self):
+        response = self._post(
+            '/refresh', POST={'format': 'json', 'provider': 'renren',
+                              'tenant': 'other', 'refresh_token': 'ref'})
+        self.assertEqual(response.status_int, 400)
+        self.assertEqual(self.session.calls, [])
+
+    def test_refresh_rate_limited(self):
+        self.app.registry.velruse_refresher.limiter.acquire = \
+                lambda key, max_wait: False
+        response = self._post(
+            '/refresh', POST={'format': 'json', 'provider': 'renren',
+                              'refresh_token': 'ref'})
+        self.assertEqual(response.status_int, 503)
+
+    def test_refresh_batch(self):
+        items = [
+            {'provider': 'renren', 'refresh_token': 'a'},
+            {'provider': 'nope', 'refresh_token': 'b'},
+            {'provider': 'renren'},
+            {'provider': 'renren', 'refresh_token': 'c'},
+        ]
+        response = self._post('/refresh_batch?format=json',
+                              body=json.dumps(items).encode('utf-8'))
+        results = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]['credentials']['oauthRefreshToken'], 'a')
+        self.assertEqual(results[1], {'error': 'unknown provider "nope"'})
+        self.assertEqual(results[2], {'error': 'missing refresh_token'})
+        self.assertEqual(results[3]['credentials']['oauthRefreshToken'], 'c')
+        self.assertEqual(len(self.session.calls), 2)
+
+    def test_refresh_batch_unexpected_error(self):
+        tenants = self.app.registry.velruse_tenants
+
+        def get(tenant, impl):
+            if tenant == 'broken':
+                raise RuntimeError('source down')
+            return tenants.__class__.get(tenants, tenant, impl)
+        tenants.get = get
+        self.app.registry.velruse_refresher.workers = 1
+        items = [
+            {'provider': 'renren', 'refresh_token': 'a', 'tenant': 'broken'},
+            {'provider': 'renren', 'refresh_token': 'b', 'tenant': 'acme'},
+        ]
+        response = self._post('/refresh_batch?format=json',
+                              body=json.dumps(items).encode('utf-8'))
+        results = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(results[0], {'error': 'internal error'})
+        self.assertEqual(results[1]['credentials']['oauthRefreshToken'], 'b')
+
+    def test_refresh_batch_limit(self):
+        self.app.registry.settings['refresh.batch_limit'] = 1
+        items = [{'provider': 'renren', 'refresh_token': 'a'}] * 2
+        response = self._post('/refresh_batch?format=json',
+                              body=json.dumps(items).encode('utf-8'))
+        self.assertEqual(response.status_int, 400)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+
+import unittest2 as unittest
+
+
+class TestProviderReloader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'providers.ini')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, **providers):
+        with open(self.path, 'w') as f:
+            f.write('[providers]\n')
+            for name, key in providers.items():
+                f.write('provider.%s.consumer_key = %s\n' % (name, key))
+                f.write('provider.%s.consumer_secret = secret\n' % name)
+
+    def _makeApp(self):
+        from velruse.app import make_app
+        return make_app(**{
+            'endpoint': 'http://example.com/logged_in',
+            'session.secret': 'seekrit',
+            'providers_file': self.path,
+        })
+
+    def _login(self, app, name):
+        from pyramid.request import Request
+        # force a check of the file on this request
+        app.registry.velruse_reloader.next_check = 0
+        app.registry.velruse_reloader.mtime = None
+        return Request.blank('/login/%s' % name).get_response(app)
+
+    def test_reload(self):
+        self._write(facebook='key1')
+        app = self._makeApp()
+        response = self._login(app, 'facebook')
+        self.assertTrue('client_id=key1' in response.location)
+
+        self._write(facebook='key2', github='key3')
+        response = self._login(app, 'facebook')
+        self.assertTrue('client_id=key2' in response.location)
+        response = self._login(app, 'github')
+        self.assertTrue('client_id=key3' in response.location)
+
+        self._write(github='key3')
+        self.assertEqual(self._login(app, 'facebook').status_int, 404)
+
+    def test_reload_aliased_provider(self):
+        self._write(facebook='key1')
+        app = self._makeApp()
+        mapper_routes = app.routes_mapper.routelist
+        with open(self.path, 'a') as f:
+            f.write('provider.gh.impl = github\n'
+                    'provider.gh.consumer_key = key2\n'
+                    'provider.gh.consumer_secret = secret\n')
+        response = self._login(app, 'github')
+        self.assertTrue('client_id=key2' in response.location)
+        # the route list was replaced instead of changed in place
+        self.assertFalse(app.routes_mapper.routelist is mapper_routes)
+
+    def test_reload_shares_metadata(self):
+        self._write(facebook='key1')
+        app = self._makeApp()
+        with open(self.path, 'a') as f:
+            f.write('provider.oidc.consumer_key = key2\n'
+                    'provider.oidc.consumer_secret = secret\n'
+                    'provider.oidc.issuer = https://id.example.com\n')
+        self.assertTrue(app.registry.velruse_reloader.reload())
+        cache = app.registry.velruse_metadata
+        provider = app.registry.velruse_providers['oidc']
+        self.assertTrue(provider.metadata is cache)
+        self.assertTrue(cache.store is app.registry.velruse_store)
+
+        self._write(facebook='key3')
+        with open(self.path, 'a') as f:
+            f.write('provider.oidc.consumer_key = key4\n'
+                    'provider.oidc.consumer_secret = secret\n'
+                    'provider.oidc.issuer = https://id.example.com\n')
+        self.assertTrue(app.registry.velruse_reloader.reload())
+        provider = app.registry.velruse_providers['oidc']
+        self.assertEqual(provider.consumer_key, 'key4')
+        self.assertTrue(provider.metadata is cache)
+
+    def test_removed_settings_dropped(self):
+        self._write(facebook='key1', github='key2')
+        app = self._makeApp()
+        self._write(facebook='key1')
+        self._login(app, 'facebook')
+        settings = app.registry.settings
+        self.assertFalse('provider.github.consumer_key' in settings)
+        self.assertEqual(settings['provider.facebook.consumer_key'], 'key1')
+
+    def test_invalid_file_keeps_providers(self):
+        self._write(facebook='key1')
+        app = self._makeApp()
+        with open(self.path, 'w') as f:
+            f.write('[providers]\nprovider.nope.consumer_key = x\n')
+        response = self._login(app, 'facebook')
+        self.assertTrue('client_id=key1' in response.location)
@@ -0,0 +1,54 @@
+import time
+
+import unittest2 as unittest
+
+
+class TestTokenCodec(unittest.TestCase):
+
+    def _makeOne(self, secret='seekrit'):
+        from velruse.app.tokens import TokenCodec
+        return TokenCodec(secret)
+
+    def test_generate_and_verify(self):
+        codec = self._makeOne()
+        token = codec.generate(300)
+        self.assertTrue(codec.verify(token))
+        self.assertAlmostEqual(codec.expiry(token), time.time() + 300,
+                               delta=2)
+
+    def test_node(self):
+        codec = self._makeOne()
+        token = codec.generate(300, node='b')
+        self.assertTrue(token.endswith('.b'))
+        self.assertTrue(codec.verify(token))
+        self.assertFalse(codec.verify(token[:-1] + 'c'))
+
+    def test_dotted_node(self):
+        from velruse.app.peers import token_node
+        codec = self._makeOne()
+        token = codec.generate(300, node='eu.b')
+        self.assertEqual(token_node(token), 'eu.b')
+        self.assertTrue(codec.verify(token))
+        self.assertFalse(codec.verify(token[:-4] + 'us.b'))
+
+    def test_routing_hint_ignored(self):
+        codec = self._makeOne()
+        self.assertTrue(codec.verify('_' + codec.generate(300)))
+
+    def test_expired(self):
+        codec = self._makeOne()
+        token = codec.generate(300)
+        self.assertFalse(codec.verify(token, now=time.time() + 301))
+
+    def test_forged(self):
+        codec = self._makeOne()
+        token = codec.generate(300)
+        self.assertFalse(self._makeOne('other').verify(token))
+        tampered = token[:-1] + ('2' if token[-1] != '2' else '3')
+        self.assertFalse(codec.verify(tampered))
+
+    def test_malformed(self):
+        codec = self._makeOne()
+        self.assertFalse(codec.verify(''))
+        self.assertFalse(codec.verify('not-a-token'))
+        self.assertFalse(codec.verify('Z' * 40))
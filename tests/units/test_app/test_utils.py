@@ -0,0 +1,52 @@
+import unittest2 as unittest
+
+
+class TestTokenGenerator(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.app.utils import TokenGenerator
+        return TokenGenerator(**kw)
+
+    def test_tokens_are_unique(self):
+        gen = self._makeOne(buffer_size=64)
+        tokens = [gen() for i in range(100)] + gen.batch(100)
+        self.assertEqual(len(set(tokens)), 200)
+
+    def test_token_range(self):
+        from velruse.app.baseconvert import base_decode
+        gen = self._makeOne()
+        for token in gen.batch(1000):
+            self.assertTrue(0 <= base_decode(token) < 2 ** 128)
+
+    def test_after_fork(self):
+        gen = self._makeOne()
+        gen()
+        # as left by a thread holding the lock when the process forked
+        gen._lock.acquire()
+        gen._after_fork()
+        self.assertEqual(gen._buffer, b'')
+        self.assertEqual(len(gen.random_bytes(16)), 16)
+
+
+class TestRedirectForm(unittest.TestCase):
+
+    def _makeOne(self, *args):
+        from velruse.app.utils import RedirectForm
+        return RedirectForm(*args)
+
+    def test_render(self):
+        form = self._makeOne('http://example.com/?a=1&b=2')
+        body = form.render('abc')
+        self.assertTrue(b'action="http://example.com/?a=1&amp;b=2"' in body)
+        self.assertTrue(b'name="token" value="abc"' in body)
+
+    def test_custom_template(self):
+        form = self._makeOne('/done', '%(endpoint)s %(token)s %(token)s %%')
+        self.assertEqual(form.render('<x>'), b'/done &lt;x&gt; &lt;x&gt; %')
+
+    def test_template_without_placeholders(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeOne, '/done',
+                          '<form action="%(endpoint)s"></form>')
+        self.assertRaises(ConfigurationError, self._makeOne, '/done',
+                          '<input value="%(token)s">')
@@ -0,0 +1,132 @@
+import json
+
+import unittest2 as unittest
+
+
+class TestAuthInfoView(unittest.TestCase):
+
+    def setUp(self):
+        from pyramid.config import Configurator
+        from anykeystore import create_store
+        config = Configurator(settings={})
+        config.registry.velruse_store = create_store('memory')
+        self.registry = config.registry
+
+    def _makeRequest(self, **params):
+        from pyramid.request import Request
+        request = Request.blank('/auth_info', POST=params)
+        request.registry = self.registry
+        return request
+
+    def test_stores_bytes(self):
+        from velruse.app import RESULT_MARKER
+        from velruse.app import encode_result
+        from velruse.app import store_result
+        data = encode_result({'profile': {'displayName': u'\xe9'}})
+        token = store_result(self._makeRequest(), data)
+        stored = self.registry.velruse_store.retrieve(token)
+        self.assertTrue(isinstance(stored, bytes))
+        self.assertEqual(stored, RESULT_MARKER + data)
+        self.assertEqual(json.loads(data.decode('utf-8')),
+                         {'profile': {'displayName': u'\xe9'}})
+
+    def _callFUT(self, token):
+        from velruse.app import auth_info_view
+        return auth_info_view(self._makeRequest(format='json', token=token))
+
+    def test_auth_info(self):
+        from velruse.app import encode_result
+        from velruse.app import store_result
+        token = store_result(self._makeRequest(),
+                             encode_result({'profile': {}}))
+        response = self._callFUT(token)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(response.body, b'{"profile":{}}')
+
+    def test_auth_info_legacy(self):
+        self.registry.velruse_store.store(
+            'old', {'profile': {'a': 1}, 'credentials': {}})
+        response = self._callFUT('old')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(json.loads(response.body.decode('utf-8')),
+                         {'profile': {'a': 1}, 'credentials': {}})
+
+    def test_auth_info_other_values(self):
+        store = self.registry.velruse_store
+        store.store('velruse_tenant:acme:github',
+                    {'consumer_key': 'k', 'consumer_secret': 'TOPSECRET'})
+        store.store('velruse.metadata.abc', '{"document": {}}')
+        store.store('raw', b'{"consumer_secret":"TOPSECRET"}')
+        for key in ('velruse_tenant:acme:github', 'velruse.metadata.abc',
+                    'raw'):
+            response = self._callFUT(key)
+            self.assertEqual(response.status_int, 400)
+            self.assertEqual(response.body, b'null')
+
+    def test_auth_info_unknown(self):
+        response = self._callFUT('missing')
+        self.assertEqual(response.status_int, 400)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(response.body, b'null')
+
+
+class TestAuthInfoBatchView(unittest.TestCase):
+
+    def setUp(self):
+        from pyramid.config import Configurator
+        from anykeystore import create_store
+        config = Configurator(settings={'auth_info.batch_limit': '3'})
+        config.registry.velruse_store = create_store('memory')
+        self.registry = config.registry
+
+    def _callFUT(self, *tokens):
+        from pyramid.request import Request
+        from velruse.app import auth_info_batch_view
+        request = Request.blank('/auth_info_batch', POST=[
+            ('format', 'json')] + [('token', t) for t in tokens])
+        request.registry = self.registry
+        return auth_info_batch_view(request)
+
+    def test_it(self):
+        from velruse.app import RESULT_MARKER
+        store = self.registry.velruse_store
+        store.store('a', RESULT_MARKER + b'{"profile":{}}')
+        store.store('b', {'code': None, 'description': 'denied'})
+        store.store('c', {'consumer_secret': 'TOPSECRET'})
+        response = self._callFUT('a', 'b', 'c')
+        self.assertEqual(json.loads(response.body.decode('utf-8')), {
+            'a': {'profile': {}},
+            'b': {'code': None, 'description': 'denied'},
+        })
+
+    def test_limit(self):
+        response = self._callFUT('a', 'b', 'c', 'd')
+        self.assertEqual(response.status_int, 400)
+
+    def test_no_tokens(self):
+        self.assertEqual(self._callFUT().status_int, 400)
+
+
+class TestProvidersView(unittest.TestCase):
+
+    def test_it(self):
+        from pyramid.request import Request
+        from velruse.app import make_app
+        app = make_app(**{
+            'endpoint': 'http://example.com/logged_in',
+            'session.secret': 'seekrit',
+            'provider.github.consumer_key': 'key',
+            'provider.github.consumer_secret': 'secret',
+        })
+        request = Request.blank('http://a.com/providers?format=json')
+        response = request.get_response(app)
+        self.assertEqual(json.loads(response.body.decode('utf-8')), {
+            'github': {'login_url': 'http://a.com/login/github'},
+        })
+        self.assertEqual(response.cache_control.max_age, 300)
+
+        request = Request.blank('http://a.com/providers?format=json')
+        request.if_none_match = response.etag
+        self.assertEqual(request.get_response(app).status_int, 304)
@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import threading
+
+import requests
+import unittest2 as unittest
+
+
+class DummyResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class DummySession(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.calls.append((url, data, headers, timeout))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return DummyResponse(result)
+
+
+class DummyTime(object):
+
+    def __init__(self):
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+class TestWebhookPusher(unittest.TestCase):
+
+    def setUp(self):
+        from velruse.app import webhook
+        self.time = DummyTime()
+        self._time = webhook.time
+        webhook.time = self.time
+
+    def tearDown(self):
+        from velruse.app import webhook
+        webhook.time = self._time
+
+    def _makeOne(self, *results, **kw):
+        from velruse.app.webhook import WebhookPusher
+        kw.setdefault('retries', 2)
+        pusher = WebhookPusher('http://example.com/hook', 'seekrit', **kw)
+        pusher.session = DummySession(*results)
+        return pusher
+
+    def test_signature(self):
+        pusher = self._makeOne(200)
+        self.assertTrue(pusher._send('tok', b'{"profile":{}}'))
+        url, data, headers, timeout = pusher.session.calls[0]
+        self.assertEqual(url, 'http://example.com/hook')
+        self.assertEqual(data, b'{"profile":{}}')
+        self.assertEqual(headers['X-Velruse-Token'], 'tok')
+        expected = hmac.new(b'seekrit', b'tok\n{"profile":{}}',
+                            hashlib.sha256).hexdigest()
+        self.assertEqual(headers['X-Velruse-Signature'],
+                         'sha256=' + expected)
+        self.assertEqual(self.time.sleeps, [])
+
+    def test_retry_server_error(self):
+        pusher = self._makeOne(503, 500, 204)
+        self.assertTrue(pusher._send('tok', b'{}'))
+        self.assertEqual(len(pusher.session.calls), 3)
+        self.assertEqual(self.time.sleeps, [0.5, 1.0])
+
+    def test_retry_connection_error(self):
+        pusher = self._makeOne(requests.ConnectionError('refused'), 200)
+        self.assertTrue(pusher._send('tok', b'{}'))
+        self.assertEqual(len(pusher.session.calls), 2)
+        self.assertEqual(self.time.sleeps, [0.5])
+
+    def test_client_error_not_retried(self):
+        pusher = self._makeOne(403)
+        self.assertTrue(pusher._send('tok', b'{}'))
+        self.assertEqual(len(pusher.session.calls), 1)
+
+    def test_give_up(self):
+        pusher = self._makeOne(500, requests.Timeout('slow'), 502, 200)
+        self.assertFalse(pusher._send('tok', b'{}'))
+        self.assertEqual(len(pusher.session.calls), 3)
+        self.assertEqual(self.time.sleeps, [0.5, 1.0])
+
+    def test_queue_full(self):
+        pusher = self._makeOne(queue_size=1)
+        pusher._work = lambda queue: None
+        self.assertTrue(pusher.push('a', b'{}'))
+        self.assertFalse(pusher.push('b', b'{}'))
+        self.assertEqual(pusher.queue.get_nowait(), ('a', b'{}'))
+
+    def test_started_lazily_per_process(self):
+        started = []
+        lock = threading.Lock()
+
+        def work(queue):
+            with lock:
+                started.append((threading.current_thread().name, queue))
+        from velruse.app.webhook import WebhookPusher
+        pusher = WebhookPusher('http://example.com/hook', 'seekrit',
+                               workers=2)
+        pusher._work = work
+        self.assertEqual(pusher.queue, None)
+        self.assertEqual(pusher.session, None)
+        pusher.push('a', b'{}')
+        queue, session = pusher.queue, pusher.session
+        self.assertTrue(isinstance(session, requests.Session))
+        pusher.push('b', b'{}')
+        # a forked child starts its own queue, connections and workers
+        pusher._started_pid = -1
+        pusher.push('c', b'{}')
+        self.assertFalse(pusher.queue is queue)
+        self.assertFalse(pusher.session is session)
+        self.assertEqual(pusher.queue.get_nowait(), ('c', b'{}'))
+        for t in threading.enumerate():
+            if t.name.startswith('velruse-webhook-'):
+                t.join(1)
+        self.assertEqual(sorted(name for name, q in started),
+                         ['velruse-webhook-0', 'velruse-webhook-0',
+                          'velruse-webhook-1', 'velruse-webhook-1'])
+        self.assertEqual(set(q for name, q in started),
+                         set([queue, pusher.queue]))
@@ -0,0 +1,135 @@
+import json
+
+import unittest2 as unittest
+
+
+class DummyResponse(object):
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode('utf-8')
+
+
+class DummySession(object):
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kw):
+        self.calls.append((method, url, kw))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestVelruseClient(unittest.TestCase):
+
+    def _makeOne(self, *responses, **kw):
+        from velruse.client import VelruseClient
+        kw.setdefault('backoff', 0)
+        client = VelruseClient('http://velruse/', **kw)
+        client.session = DummySession(*responses)
+        return client
+
+    def test_auth_info(self):
+        client = self._makeOne(DummyResponse(200, {'profile': {}}))
+        self.assertEqual(client.auth_info('abc'), {'profile': {}})
+        method, url, kw = client.session.calls[0]
+        self.assertEqual(url, 'http://velruse/auth_info')
+        self.assertEqual(kw['params'], {'format': 'json', 'token': 'abc'})
+
+    def test_auth_info_unknown(self):
+        client = self._makeOne(DummyResponse(400, None))
+        self.assertRaises(KeyError, client.auth_info, 'abc')
+
+    def test_retries(self):
+        import requests
+        client = self._makeOne(requests.ConnectionError(),
+                               DummyResponse(503, None),
+                               DummyResponse(200, {'profile': {}}))
+        self.assertEqual(client.auth_info('abc'), {'profile': {}})
+        self.assertEqual(len(client.session.calls), 3)
+
+    def test_unavailable(self):
+        from velruse.exceptions import ServiceUnavailable
+        client = self._makeOne(DummyResponse(503, None),
+                               DummyResponse(503, None), retries=1)
+        self.assertRaises(ServiceUnavailable, client.auth_info, 'abc')
+
+    def test_local_validation(self):
+        from velruse.app.tokens import TokenCodec
+        token = TokenCodec('seekrit').generate(300)
+        client = self._makeOne(DummyResponse(200, {token: {}}),
+                               token_secret='seekrit')
+        self.assertRaises(KeyError, client.auth_info, 'forged')
+        self.assertEqual(client.auth_info_batch(['forged', token]),
+                         {token: {}})
+        self.assertEqual(len(client.session.calls), 1)
+
+    def test_batch_chunks(self):
+        client = self._makeOne(DummyResponse(200, {'a': 1, 'b': 2}),
+                               DummyResponse(200, {'c': 3}), batch_size=2)
+        self.assertEqual(client.auth_info_batch(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(client.session.calls[1][2]['data']['token'], ['c'])
+
+    def test_refresh(self):
+        client = self._makeOne(
+            DummyResponse(200, {'credentials': {'oauthAccessToken': 'a'}}),
+            DummyResponse(400, {'error': 'unknown provider "x"'}))
+        self.assertEqual(client.refresh('live', 'ref'),
+                         {'oauthAccessToken': 'a'})
+        method, url, kw = client.session.calls[0]
+        self.assertEqual(url, 'http://velruse/refresh')
+        self.assertEqual(kw['data']['refresh_token'], 'ref')
+        self.assertRaises(ValueError, client.refresh, 'x', 'ref')
+
+    def test_refresh_not_json(self):
+        from velruse.exceptions import ServiceUnavailable
+        response = DummyResponse(404, None)
+        response.content = b'<html><body>Not Found</body></html>'
+        client = self._makeOne(response)
+        self.assertRaises(ServiceUnavailable, client.refresh, 'live', 'ref')
+
+    def test_refresh_sent_once(self):
+        import requests
+        from velruse.exceptions import ServiceUnavailable
+        client = self._makeOne(requests.Timeout('slow'),
+                               DummyResponse(200, {'credentials': {}}))
+        self.assertRaises(ServiceUnavailable, client.refresh, 'live', 'ref')
+        self.assertEqual(len(client.session.calls), 1)
+        self.assertEqual(client.session.calls[0][2]['timeout'], 15)
+
+        client = self._makeOne(DummyResponse(502, None),
+                               DummyResponse(200, {'credentials': {}}))
+        self.assertRaises(ServiceUnavailable, client.refresh, 'live', 'ref')
+        self.assertEqual(len(client.session.calls), 1)
+
+    def test_refresh_rate_limited(self):
+        from velruse.exceptions import RateLimited
+        client = self._makeOne(DummyResponse(503, {'error': 'rate limited'}),
+                               DummyResponse(200, {'credentials': {}}))
+        self.assertRaises(RateLimited, client.refresh, 'live', 'ref')
+        self.assertEqual(len(client.session.calls), 1)
+
+    def test_refresh_batch_sent_once(self):
+        from velruse.exceptions import ServiceUnavailable
+        client = self._makeOne(DummyResponse(500, None),
+                               DummyResponse(200, [{'credentials': {}}]))
+        self.assertRaises(ServiceUnavailable, client.refresh_batch,
+                          [{'provider': 'live', 'refresh_token': 'a'}])
+        self.assertEqual(len(client.session.calls), 1)
+
+    def test_refresh_batch_chunks(self):
+        client = self._makeOne(
+            DummyResponse(200, [{'credentials': {}}, {'error': 'e'}]),
+            DummyResponse(200, [{'credentials': {}}]), batch_size=2)
+        items = [{'provider': 'live', 'refresh_token': str(i)}
+                 for i in range(3)]
+        self.assertEqual(client.refresh_batch(items),
+                         [{'credentials': {}}, {'error': 'e'},
+                          {'credentials': {}}])
+        self.assertEqual(json.loads(client.session.calls[1][2]['data']),
+                         items[2:])
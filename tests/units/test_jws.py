@@ -0,0 +1,103 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+
+import unittest2 as unittest
+
+
+N = int(
+    'd23786f620719d21e071749b5f43b21c608a5b9c66f9f1793eb48ddcccc45a1d'
+    '8777113d745c5367859c9069068f5707690af880da521a457a7b6313844c50b8'
+    '74e136e11cffe87fa2fd8f778e29e9936736d1fe91f08d574e9b79e8ccb29d45'
+    'a5f3c9e81d899ff8b5d88153b1b5a4cd6fc33271affccf64669d0ce814128303',
+    16)
+D = int(
+    'c1acdeef0c5d208401a105e9d00f329dea640e9b3e54b1211fa081c317f51f81'
+    '6d3949ecf0b3cf33e569a5b2dd945a7e3d4d1a3ebce63fc61b5e6a9da49a1b12'
+    'e9404eee3e3ccfb4863f9a60881dc1d82eb93a7a70373e520462ae5fe5f877ea'
+    '891666ab7407d6723e806b03515114300fac19041d77d381f7e0b64711ecd1a1',
+    16)
+E = 65537
+SIZE = 128
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def b64_int(num):
+    hexed = '%x' % num
+    return b64(binascii.unhexlify('0' * (len(hexed) % 2) + hexed)) \
+        .decode('ascii')
+
+
+JWK = {'kty': 'RSA', 'kid': 'k1', 'n': b64_int(N), 'e': b64_int(E)}
+
+
+def make_token(claims, alg='RS256', kid='k1', secret='secret'):
+    header = {'alg': alg, 'kid': kid}
+    message = b64(json.dumps(header).encode('utf-8')) + b'.' + \
+        b64(json.dumps(claims).encode('utf-8'))
+    if alg == 'RS256':
+        from velruse.jws import SHA256_DIGEST_INFO
+        digest = SHA256_DIGEST_INFO + hashlib.sha256(message).digest()
+        encoded = b'\x00\x01' + b'\xff' * (SIZE - len(digest) - 3) + \
+            b'\x00' + digest
+        num = pow(int(binascii.hexlify(encoded), 16), D, N)
+        signature = binascii.unhexlify('%0*x' % (SIZE * 2, num))
+    elif alg == 'HS256':
+        signature = hmac.new(secret.encode('utf-8'), message,
+                             hashlib.sha256).digest()
+    else:
+        signature = b''
+    return (message + b'.' + b64(signature)).decode('ascii')
+
+
+class TestVerify(unittest.TestCase):
+
+    def _callFUT(self, token, secret=None):
+        from velruse.jws import verify
+        return verify(token, {'k1': JWK}.get, secret)
+
+    def test_rs256(self):
+        token = make_token({'sub': '1'})
+        self.assertEqual(self._callFUT(token), {'sub': '1'})
+
+    def test_hs256(self):
+        token = make_token({'sub': '1'}, alg='HS256')
+        self.assertEqual(self._callFUT(token, 'secret'), {'sub': '1'})
+
+    def test_hs256_wrong_secret(self):
+        from velruse.jws import InvalidToken
+        token = make_token({'sub': '1'}, alg='HS256')
+        self.assertRaises(InvalidToken, self._callFUT, token, 'other')
+
+    def test_hs256_without_secret(self):
+        from velruse.jws import InvalidToken
+        token = make_token({'sub': '1'}, alg='HS256')
+        self.assertRaises(InvalidToken, self._callFUT, token)
+
+    def test_tampered_claims(self):
+        from velruse.jws import InvalidToken
+        header, claims, signature = make_token({'sub': '1'}).split('.')
+        claims = b64(json.dumps({'sub': '2'}).encode('utf-8')) \
+            .decode('ascii')
+        self.assertRaises(InvalidToken, self._callFUT,
+                          '.'.join([header, claims, signature]))
+
+    def test_unknown_key(self):
+        from velruse.jws import InvalidToken
+        token = make_token({'sub': '1'}, kid='k2')
+        self.assertRaises(InvalidToken, self._callFUT, token)
+
+    def test_alg_none(self):
+        from velruse.jws import InvalidToken
+        token = make_token({'sub': '1'}, alg='none')
+        self.assertRaises(InvalidToken, self._callFUT, token, 'secret')
+
+    def test_malformed(self):
+        from velruse.jws import InvalidToken
+        self.assertRaises(InvalidToken, self._callFUT, 'abc')
+        self.assertRaises(InvalidToken, self._callFUT, 'a.b.c')
@@ -0,0 +1,62 @@
+import unittest2 as unittest
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import parse_qs, urlparse
+else:
+    from urlparse import parse_qs, urlparse
+
+
+class TestVelruseMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def _app(self, environ, start_response):
+        self.calls.append(environ)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'app']
+
+    def _makeOne(self, **settings):
+        from velruse.middleware import VelruseMiddleware
+        settings.setdefault('endpoint', '/logged_in')
+        settings.setdefault('session.secret', 'seekrit')
+        settings.setdefault('provider.facebook.consumer_key', 'key')
+        settings.setdefault('provider.facebook.consumer_secret', 'secret')
+        return VelruseMiddleware(self._app, **settings)
+
+    def _get(self, app, url, headers=None):
+        from pyramid.request import Request
+        return Request.blank(url, headers=headers).get_response(app)
+
+    def test_other_paths_pass_through(self):
+        app = self._makeOne()
+        response = self._get(app, '/some/page?x=1')
+        self.assertEqual(response.body, b'app')
+        self.assertEqual(self.calls[0]['PATH_INFO'], '/some/page')
+        self.assertFalse('velruse.context' in self.calls[0])
+
+    def test_result_in_environ(self):
+        from velruse import AuthenticationDenied
+        app = self._makeOne()
+        response = self._get(app, '/login/facebook')
+        self.assertEqual(response.status_int, 302)
+        self.assertEqual(self.calls, [])
+        state = parse_qs(urlparse(response.location).query)['state'][0]
+        cookie = response.headers['Set-Cookie'].split(';', 1)[0]
+
+        response = self._get(
+            app, '/login/facebook/callback?state=%s&error_reason=denied'
+            % state, headers={'Cookie': cookie})
+        self.assertEqual(response.body, b'app')
+        environ = self.calls[0]
+        self.assertEqual(environ['PATH_INFO'], '/logged_in')
+        self.assertEqual(environ['QUERY_STRING'], '')
+        context = environ['velruse.context']
+        self.assertTrue(isinstance(context, AuthenticationDenied))
+        self.assertEqual(context.reason, 'denied')
+
+    def test_missing_endpoint(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeOne, endpoint='')
@@ -0,0 +1,233 @@
+import json
+
+import unittest2 as unittest
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import parse_qs, urlsplit
+else:
+    from urlparse import parse_qs, urlsplit
+
+
+def load_result(value):
+    """Decode a login result as saved in the velruse store"""
+    from velruse.app import RESULT_MARKER
+    assert value.startswith(RESULT_MARKER)
+    return json.loads(value[len(RESULT_MARKER):].decode('utf-8'))
+
+
+class DummyResponse(object):
+
+    def __init__(self, content, status_code=200):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        self.content = content
+        self.status_code = status_code
+
+
+class DummySession(object):
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def request(self, method, url, **kw):
+        self.calls.append((method, url, kw))
+        for prefix, response in self.responses:
+            if url.startswith(prefix):
+                return response
+        raise AssertionError('unexpected request to %s' % url)
+
+
+class ProviderTests(object):
+
+    settings = {}
+
+    def setUp(self):
+        import os
+        from velruse.providers import base
+        from velruse.app import make_app
+        self.session = DummySession(self.responses)
+        self._saved = base._session, base._session_pid
+        base._session, base._session_pid = self.session, os.getpid()
+        settings = {
+            'endpoint': 'http://example.com/logged_in',
+            'session.secret': 'seekrit',
+            'provider.%s.consumer_key' % self.name: 'key',
+            'provider.%s.consumer_secret' % self.name: 'secret',
+        }
+        settings.update(self.settings)
+        self.app = make_app(**settings)
+
+    def tearDown(self):
+        from velruse.providers import base
+        base._session, base._session_pid = self._saved
+
+    def _get(self, url, cookie=None):
+        from pyramid.request import Request
+        request = Request.blank(url)
+        if cookie:
+            request.headers['Cookie'] = cookie
+        return request.get_response(self.app)
+
+    def _login(self, **callback_params):
+        response = self._get('http://localhost/login/%s' % self.name)
+        self.assertEqual(response.status_int, 302)
+        query = parse_qs(urlsplit(response.location).query)
+        self.assertEqual(query['client_id'], ['key'])
+        self.assertEqual(query['redirect_uri'], [
+            'http://localhost/login/%s/callback' % self.name])
+        cookie = None
+        if 'state' in query:
+            callback_params['state'] = query['state'][0]
+            cookie = response.headers['Set-Cookie'].split(';', 1)[0]
+
+        # capture the context instead of storing it
+        contexts = []
+        self.app.registry.velruse_store.store = \
+                lambda key, value, expires=None: contexts.append(value)
+        qs = '&'.join('%s=%s' % kv for kv in callback_params.items())
+        self._get('http://localhost/login/%s/callback?%s' % (self.name, qs),
+                  cookie)
+        return load_result(contexts[0])
+
+
+class TestFacebook(ProviderTests, unittest.TestCase):
+
+    name = 'facebook'
+    responses = [
+        ('https://graph.facebook.com/oauth/access_token',
+         DummyResponse('access_token=tok&expires=5')),
+        ('https://graph.facebook.com/me',
+         DummyResponse(json.dumps({'id': '1', 'name': 'Foo Bar',
+                                   'link': 'http://fb.com/foo'}))),
+    ]
+
+    def test_login(self):
+        result = self._login(code='abc')
+        self.assertEqual(result['credentials'], {'oauthAccessToken': 'tok'})
+        self.assertEqual(result['profile']['preferredUsername'], 'foo')
+        method, url, kw = self.session.calls[0]
+        query = parse_qs(urlsplit(url).query)
+        self.assertEqual(query['client_secret'], ['secret'])
+        self.assertEqual(query['code'], ['abc'])
+        self.assertTrue(kw['timeout'])
+
+    def test_denied(self):
+        result = self._login(error_reason='user_denied')
+        self.assertEqual(result['description'], 'user_denied')
+        self.assertEqual(self.session.calls, [])
+
+    def test_stats(self):
+        from velruse.providers.base import stats
+        stats.reset()
+        self._login(code='abc')
+        self.assertEqual(stats.snapshot()['facebook']['requests'], 2)
+
+
+class TestWeibo(ProviderTests, unittest.TestCase):
+
+    name = 'weibo'
+    responses = [
+        ('https://api.weibo.com/oauth2/access_token',
+         DummyResponse(json.dumps({'access_token': 'tok', 'uid': 7}))),
+        ('https://api.weibo.com/2/users/show.json',
+         DummyResponse(json.dumps({'id': 7, 'screen_name': 'Foo',
+                                   'name': 'foo'}))),
+    ]
+
+    def test_login(self):
+        result = self._login(code='abc')
+        self.assertEqual(result['profile']['accounts'],
+                         [{'domain': 'weibo.com', 'userid': 7}])
+        method, url, kw = self.session.calls[0]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(kw['data']['grant_type'], 'authorization_code')
+
+
+class TestRenren(ProviderTests, unittest.TestCase):
+
+    name = 'renren'
+    responses = [
+        ('https://graph.renren.com/oauth/token',
+         DummyResponse(json.dumps({'access_token': 'tok',
+                                   'refresh_token': 'ref',
+                                   'user': {'id': 3, 'name': 'Foo'}}))),
+    ]
+
+    def test_login(self):
+        result = self._login(code='abc')
+        self.assertEqual(result['profile']['displayName'], 'Foo')
+        self.assertEqual(result['credentials'], {
+            'oauthAccessToken': 'tok',
+            'oauthRefreshToken': 'ref',
+        })
+        self.assertEqual(len(self.session.calls), 1)
+
+
+class TestThirdPartyFailure(ProviderTests, unittest.TestCase):
+
+    name = 'github'
+    responses = [
+        ('https://github.com/login/oauth/access_token',
+         DummyResponse('nope', status_code=500)),
+    ]
+
+    def test_failure(self):
+        from velruse.exceptions import ThirdPartyFailure
+        self.assertRaises(ThirdPartyFailure, self._login, code='abc')
+
+
+class TestTaobao(ProviderTests, unittest.TestCase):
+
+    name = 'taobao'
+    responses = [
+        ('https://oauth.taobao.com/token',
+         DummyResponse(json.dumps({'access_token': 'tok'}))),
+        ('http://gw.api.taobao.com/router/rest',
+         DummyResponse(json.dumps({'user_get_response': {
+             'user': {'nick': 'foo', 'user_id': 4}}}))),
+    ]
+
+    def test_login(self):
+        from hashlib import md5
+        result = self._login(code='abc')
+        self.assertEqual(result['profile']['preferredUsername'], 'foo')
+        method, url, kw = self.session.calls[1]
+        query = dict((k, v[0]) for k, v in
+                     parse_qs(urlsplit(url).query).items())
+        sign = query.pop('sign')
+        self.assertEqual(query['session'], 'tok')
+        src = 'secret%ssecret' % ''.join(
+            '%s%s' % (k, query[k]) for k in sorted(query))
+        self.assertEqual(sign, md5(src.encode('utf-8')).hexdigest().upper())
+
+
+class TestLastfm(ProviderTests, unittest.TestCase):
+
+    name = 'lastfm'
+    settings = {
+        'provider.lastfm.login_path': '/login/lastfm',
+        'provider.lastfm.callback_path': '/login/lastfm/callback',
+    }
+    responses = [
+        ('https://ws.audioscrobbler.com/2.0/?format=json&method=auth',
+         DummyResponse(json.dumps({'session': {'key': 'sk',
+                                               'name': 'foo'}}))),
+        ('https://ws.audioscrobbler.com/2.0/?format=json&method=user',
+         DummyResponse(json.dumps({'user': {'name': 'foo', 'id': '8',
+                                            'gender': 'm'}}))),
+    ]
+
+    def test_callback(self):
+        contexts = []
+        self.app.registry.velruse_store.store = \
+                lambda key, value, expires=None: contexts.append(value)
+        self._get('http://localhost/login/lastfm/callback?token=tok')
+        result = load_result(contexts[0])
+        self.assertEqual(result['credentials'], {'sessionKey': 'sk'})
+        self.assertEqual(result['profile']['accounts'][0]['userid'], '8')
+        query = parse_qs(urlsplit(self.session.calls[0][1]).query)
+        self.assertEqual(query['api_sig'],
+                         ['04e870be4bb79756721b7bc1937fe83d'])
@@ -0,0 +1,103 @@
+import time
+
+import unittest2 as unittest
+
+
+class DummyStore(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def retrieve(self, key):
+        return self.data[key]
+
+    def store(self, key, value, expires=None):
+        self.data[key] = value
+
+
+class BrokenStore(object):
+
+    def retrieve(self, key):
+        raise IOError('down')
+
+    def store(self, key, value, expires=None):
+        raise IOError('down')
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    url = 'https://id.example.com/jwks'
+
+    def _makeOne(self, **kw):
+        from velruse.providers.metadata import MetadataCache
+        return MetadataCache(**kw)
+
+    def _fetcher(self):
+        calls = []
+
+        def fetch(url):
+            calls.append(url)
+            return {'version': len(calls)}
+        return fetch, calls
+
+    def test_fetched_once(self):
+        cache = self._makeOne()
+        fetch, calls = self._fetcher()
+        self.assertEqual(cache.get(self.url, fetch), {'version': 1})
+        self.assertEqual(cache.get(self.url, fetch), {'version': 1})
+        self.assertEqual(calls, [self.url])
+
+    def test_expired(self):
+        cache = self._makeOne(ttl=60)
+        fetch, calls = self._fetcher()
+        cache.entries[self.url] = ({'version': 0}, time.time() - 61)
+        self.assertEqual(cache.get(self.url, fetch), {'version': 1})
+
+    def test_refresh_ahead(self):
+        cache = self._makeOne(ttl=60, refresh_ahead=10)
+        fetch, calls = self._fetcher()
+        cache.entries[self.url] = ({'version': 0}, time.time() - 55)
+        # the cached document is served while it is refreshed
+        self.assertEqual(cache.get(self.url, fetch), {'version': 0})
+        thread = cache.refreshing.get(self.url)
+        if thread is not None:
+            thread.join()
+        self.assertEqual(cache.get(self.url, fetch), {'version': 1})
+        self.assertEqual(calls, [self.url])
+        self.assertEqual(cache.refreshing, {})
+
+    def test_refetch_rate_limited(self):
+        cache = self._makeOne(min_refetch=60)
+        fetch, calls = self._fetcher()
+        cache.get(self.url, fetch)
+        self.assertEqual(cache.refetch(self.url, fetch), {'version': 1})
+        cache.last_fetch[self.url] -= 61
+        self.assertEqual(cache.refetch(self.url, fetch), {'version': 2})
+        self.assertEqual(cache.get(self.url, fetch), {'version': 2})
+
+    def test_shared_through_store(self):
+        store = DummyStore()
+        fetch, calls = self._fetcher()
+        self._makeOne(store=store).get(self.url, fetch)
+        other = self._makeOne(store=store)
+        self.assertEqual(other.get(self.url, fetch), {'version': 1})
+        self.assertEqual(len(calls), 1)
+
+    def test_broken_store(self):
+        fetch, calls = self._fetcher()
+        cache = self._makeOne(store=BrokenStore())
+        self.assertEqual(cache.get(self.url, fetch), {'version': 1})
+
+
+class TestMetadataCacheSetting(unittest.TestCase):
+
+    def test_it(self):
+        from pyramid.registry import Registry
+        from velruse.providers.metadata import metadata_cache
+        registry = Registry()
+        registry.settings = {'metadata.ttl': '600'}
+        registry.velruse_store = DummyStore()
+        cache = metadata_cache(registry)
+        self.assertEqual(cache.ttl, 600)
+        self.assertTrue(cache.store is registry.velruse_store)
+        self.assertTrue(metadata_cache(registry) is cache)
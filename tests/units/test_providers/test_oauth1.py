@@ -0,0 +1,103 @@
+import json
+
+import unittest2 as unittest
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import parse_qs, urlsplit
+else:
+    from urlparse import parse_qs, urlsplit
+
+from tests.units.test_providers.test_base import (
+    DummyResponse,
+    ProviderTests,
+    load_result,
+)
+
+
+class OAuth1ProviderTests(ProviderTests):
+
+    def _login(self, **callback_params):
+        response = self._get('http://localhost/login/%s' % self.name)
+        self.assertEqual(response.status_int, 302)
+        self.location = urlsplit(response.location)
+        query = parse_qs(self.location.query)
+        self.assertEqual(query['oauth_token'], ['reqtok'])
+        cookie = response.headers['Set-Cookie'].split(';', 1)[0]
+
+        contexts = []
+        self.app.registry.velruse_store.store = \
+                lambda key, value, expires=None: contexts.append(value)
+        qs = '&'.join('%s=%s' % kv for kv in callback_params.items())
+        self._get('http://localhost/login/%s/callback?%s' % (self.name, qs),
+                  cookie)
+        return load_result(contexts[0])
+
+    def _auth_header(self, index):
+        method, url, kw = self.session.calls[index]
+        return kw['headers']['Authorization']
+
+
+REQUEST_TOKEN = DummyResponse('oauth_token=reqtok&oauth_token_secret=s')
+
+
+class TestTwitter(OAuth1ProviderTests, unittest.TestCase):
+
+    name = 'twitter'
+    responses = [
+        ('https://api.twitter.com/oauth/request_token', REQUEST_TOKEN),
+        ('https://api.twitter.com/oauth/access_token',
+         DummyResponse('oauth_token=acc&oauth_token_secret=accs'
+                       '&user_id=5&screen_name=foo')),
+    ]
+
+    def test_login(self):
+        result = self._login(oauth_token='reqtok', oauth_verifier='ver')
+        self.assertEqual(self.location.netloc, 'api.twitter.com')
+        self.assertEqual(result['credentials'], {
+            'oauthAccessToken': 'acc',
+            'oauthAccessTokenSecret': 'accs',
+        })
+        self.assertEqual(result['profile']['displayName'], 'foo')
+        self.assertTrue('oauth_callback=' in self._auth_header(0))
+        self.assertEqual(self.session.calls[1][0], 'POST')
+        header = self._auth_header(1)
+        self.assertTrue('oauth_token="reqtok"' in header)
+        self.assertTrue('oauth_verifier="ver"' in header)
+        self.assertTrue('oauth_signature=' in header)
+
+    def test_denied(self):
+        result = self._login(denied='reqtok')
+        self.assertEqual(result['description'], 'User denied authentication')
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_missing_verifier(self):
+        from velruse.exceptions import ThirdPartyFailure
+        self.assertRaises(ThirdPartyFailure, self._login,
+                          oauth_token='reqtok')
+
+
+class TestDouban(OAuth1ProviderTests, unittest.TestCase):
+
+    name = 'douban'
+    responses = [
+        ('http://www.douban.com/service/auth/request_token', REQUEST_TOKEN),
+        ('http://www.douban.com/service/auth/access_token',
+         DummyResponse('oauth_token=acc&oauth_token_secret=accs'
+                       '&douban_user_id=9')),
+        ('http://api.douban.com/people/',
+         DummyResponse(json.dumps({'title': {'$t': 'Foo'}}))),
+    ]
+
+    def test_login(self):
+        result = self._login(oauth_token='reqtok')
+        query = parse_qs(self.location.query)
+        self.assertEqual(query['oauth_callback'],
+                         ['http://localhost/login/douban/callback'])
+        self.assertEqual(result['profile']['accounts'],
+                         [{'domain': 'douban.com', 'userid': '9'}])
+        self.assertEqual(result['profile']['displayName'], 'Foo')
+        self.assertEqual([c[0] for c in self.session.calls],
+                         ['GET', 'GET', 'GET'])
+        self.assertTrue('oauth_token="acc"' in self._auth_header(2))
@@ -0,0 +1,225 @@
+import json
+import time
+
+import unittest2 as unittest
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import parse_qs, urlsplit
+else:
+    from urlparse import parse_qs, urlsplit
+
+from tests.units.test_jws import JWK
+from tests.units.test_jws import make_token
+from tests.units.test_providers.test_base import (
+    DummyResponse,
+    ProviderTests,
+    load_result,
+)
+
+
+ISSUER = 'https://id.example.com'
+
+
+class TestOIDC(ProviderTests, unittest.TestCase):
+
+    name = 'oidc'
+    settings = {
+        'provider.oidc.issuer': ISSUER,
+    }
+
+    def setUp(self):
+        self.token_response = DummyResponse('')
+        self.responses = [
+            (ISSUER + '/.well-known/openid-configuration',
+             DummyResponse(json.dumps({
+                 'issuer': ISSUER,
+                 'authorization_endpoint': ISSUER + '/authorize',
+                 'token_endpoint': ISSUER + '/token',
+                 'userinfo_endpoint': ISSUER + '/userinfo',
+                 'jwks_uri': ISSUER + '/jwks',
+             }))),
+            (ISSUER + '/token', self.token_response),
+            (ISSUER + '/jwks', DummyResponse(json.dumps({'keys': [JWK]}))),
+            (ISSUER + '/userinfo',
+             DummyResponse(json.dumps({'sub': '42', 'name': 'Foo Bar',
+                                       'email': 'info@example.com'}))),
+        ]
+        ProviderTests.setUp(self)
+
+    def _claims(self, **kw):
+        claims = {
+            'iss': ISSUER,
+            'aud': 'key',
+            'sub': '42',
+            'exp': int(time.time()) + 300,
+            'name': 'Foo Bar',
+            'email': 'foo@example.com',
+            'email_verified': True,
+        }
+        claims.update(kw)
+        return claims
+
+    def _oidc_login(self, **claims):
+        response = self._get('http://localhost/login/oidc')
+        self.assertEqual(response.status_int, 302)
+        query = parse_qs(urlsplit(response.location).query)
+        self.assertEqual(query['scope'], ['openid email profile'])
+        claims = self._claims(**claims)
+        claims.setdefault('nonce', query['nonce'][0])
+        claims = dict((k, v) for k, v in claims.items() if v is not None)
+        self.token_response.content = json.dumps({
+            'access_token': 'tok',
+            'id_token': make_token(claims),
+        }).encode('utf-8')
+
+        contexts = []
+        store = self.app.registry.velruse_store
+
+        def capture(key, value, expires=None):
+            if key.startswith('velruse.metadata.'):
+                store.__class__.store(store, key, value, expires)
+            else:
+                contexts.append(value)
+        store.store = capture
+        cookie = response.headers['Set-Cookie'].split(';', 1)[0]
+        self.callback_url = ('http://localhost/login/oidc/callback'
+                             '?code=abc&state=%s' % query['state'][0])
+        self.callback_response = self._get(self.callback_url, cookie)
+        return load_result(contexts[0])
+
+    def _requested(self):
+        return [url.split('?', 1)[0] for m, url, kw in self.session.calls]
+
+    def test_login_from_id_token(self):
+        result = self._oidc_login()
+        profile = result['profile']
+        self.assertEqual(profile['accounts'],
+                         [{'domain': 'id.example.com', 'userid': '42'}])
+        self.assertEqual(profile['verifiedEmail'], 'foo@example.com')
+        self.assertEqual(profile['preferredUsername'], 'foo')
+        self.assertEqual(result['credentials'], {'oauthAccessToken': 'tok'})
+        self.assertFalse(ISSUER + '/userinfo' in self._requested())
+
+    def test_login_with_birthdate(self):
+        result = self._oidc_login(birthdate='1980-02-03')
+        self.assertEqual(result['profile']['birthday'], '1980-02-03')
+        result = self._oidc_login(birthdate='0000-02-03')
+        self.assertFalse('birthday' in result['profile'])
+
+    def test_metadata_fetched_once(self):
+        self._oidc_login()
+        self._oidc_login()
+        self.assertEqual(self._requested().count(ISSUER + '/jwks'), 1)
+        self.assertEqual(self._requested().count(
+            ISSUER + '/.well-known/openid-configuration'), 1)
+
+    def test_metadata_shared_through_store(self):
+        from velruse.providers.oidc import OIDCProvider
+        from velruse.providers.metadata import MetadataCache
+        self._oidc_login()
+        provider = OIDCProvider(
+            'oidc', 'key', 'secret', ISSUER,
+            metadata=MetadataCache(self.app.registry.velruse_store))
+        provider.configure()
+        self.assertEqual(provider.get_key('k1'), JWK)
+        self.assertEqual(self._requested().count(ISSUER + '/jwks'), 1)
+
+    def test_discovery_change(self):
+        from velruse.providers.oidc import OIDCProvider
+        from velruse.providers.metadata import MetadataCache
+        documents = [{'issuer': ISSUER,
+                      'authorization_endpoint': ISSUER + '/authorize',
+                      'token_endpoint': ISSUER + '/token'}]
+        provider = OIDCProvider('oidc', 'key', 'secret', ISSUER,
+                                metadata=MetadataCache(ttl=300))
+        provider.get_json = lambda url: documents[-1]
+        provider.configure()
+        self.assertEqual(provider.token_endpoint, ISSUER + '/token')
+        documents.append(dict(documents[0], token_endpoint=ISSUER + '/t2'))
+        provider.configure()
+        self.assertEqual(provider.token_endpoint, ISSUER + '/token')
+        # the cached document expired
+        provider.metadata.clear()
+        provider.configure()
+        self.assertEqual(provider.token_endpoint, ISSUER + '/t2')
+        self.assertEqual(provider.token_form['client_id'], 'key')
+
+    def test_explicit_endpoints(self):
+        from velruse.providers.oidc import OIDCProvider
+        provider = OIDCProvider('oidc', 'key', 'secret', ISSUER,
+                                authorize_endpoint=ISSUER + '/a',
+                                token_endpoint=ISSUER + '/t',
+                                userinfo_endpoint=ISSUER + '/u',
+                                jwks_uri=ISSUER + '/j')
+        provider.configure()
+        provider.configure()
+        self.assertEqual(provider.authorize_endpoint, ISSUER + '/a')
+        self.assertEqual(self.session.calls, [])
+
+    def test_missing_claims_use_userinfo(self):
+        result = self._oidc_login(name=None)
+        self.assertEqual(result['profile']['displayName'], 'Foo Bar')
+        # the verified id_token claims win over userinfo
+        self.assertEqual(result['profile']['emails'],
+                         [{'value': 'foo@example.com', 'primary': True}])
+        method, url, kw = self.session.calls[-1]
+        self.assertEqual(url, ISSUER + '/userinfo')
+        self.assertEqual(kw['headers'], {'Authorization': 'Bearer tok'})
+
+    def test_wrong_nonce(self):
+        from velruse.exceptions import CSRFError
+        self.assertRaises(CSRFError, self._oidc_login, nonce='other')
+
+    def test_replayed_callback(self):
+        from velruse.exceptions import CSRFError
+        self._oidc_login()
+        cookie = self.callback_response.headers['Set-Cookie'].split(';')[0]
+        self.assertRaises(CSRFError, self._get, self.callback_url, cookie)
+
+    def test_wrong_audience(self):
+        from velruse.exceptions import ThirdPartyFailure
+        self.assertRaises(ThirdPartyFailure, self._oidc_login, aud='other')
+
+    def test_wrong_issuer(self):
+        from velruse.exceptions import ThirdPartyFailure
+        self.assertRaises(ThirdPartyFailure, self._oidc_login,
+                          iss='https://evil.example.com')
+
+    def test_expired(self):
+        from velruse.exceptions import ThirdPartyFailure
+        self.assertRaises(ThirdPartyFailure, self._oidc_login,
+                          exp=int(time.time()) - 3600)
+
+
+class TestExtractOIDCData(unittest.TestCase):
+
+    def _callFUT(self, claims):
+        from velruse.providers.oidc import extract_oidc_data
+        return extract_oidc_data(claims, 'example.com')
+
+    def test_minimal(self):
+        profile = self._callFUT({'sub': '1'})
+        self.assertEqual(profile['accounts'],
+                         [{'domain': 'example.com', 'userid': '1'}])
+        self.assertEqual(profile['emails'], [])
+        self.assertFalse('verifiedEmail' in profile)
+
+    def test_unverified_email(self):
+        profile = self._callFUT({'sub': '1', 'email': 'a@b.c',
+                                 'email_verified': False,
+                                 'preferred_username': 'ab'})
+        self.assertFalse('verifiedEmail' in profile)
+        self.assertEqual(profile['preferredUsername'], 'ab')
+        self.assertEqual(profile['displayName'], 'ab')
+
+    def test_birthdate(self):
+        import datetime
+        profile = self._callFUT({'sub': '1', 'birthdate': '1980-02-29'})
+        self.assertEqual(profile['birthday'], datetime.date(1980, 2, 29))
+
+    def test_partial_birthdate(self):
+        for birthdate in ('0000-02-29', '1980', '1980-02-30'):
+            profile = self._callFUT({'sub': '1', 'birthdate': birthdate})
+            self.assertFalse('birthday' in profile)
@@ -0,0 +1,115 @@
+import threading
+
+import unittest2 as unittest
+
+
+class TestPipelinedStore(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.store.pipeline import PipelinedStore
+        return PipelinedStore('memory', **kw)
+
+    def test_operations(self):
+        store = self._makeOne()
+        store.store('foo', 'bar', expires=60)
+        self.assertEqual(store.retrieve('foo'), 'bar')
+        store.delete('foo')
+        self.assertRaises(KeyError, store.retrieve, 'foo')
+
+        stats = store.stats.snapshot()
+        self.assertEqual(stats['store']['count'], 1)
+        self.assertEqual(stats['retrieve']['count'], 2)
+        self.assertEqual(stats['delete']['count'], 1)
+        self.assertEqual(stats['batches'], 4)
+
+    def test_concurrent_operations_are_batched(self):
+        store = self._makeOne(pool_size=1)
+        release = threading.Event()
+        backend_store = store.backend.store
+
+        def slow_store(key, value, expires=None):
+            release.wait()
+            backend_store(key, value, expires=expires)
+        store.backend.store = slow_store
+
+        threads = [threading.Thread(target=store.store, args=('k%d' % i, i))
+                   for i in range(5)]
+        threads[0].start()
+        while not store._flushers:
+            pass
+        for t in threads[1:]:
+            t.start()
+        while len(store._pending) < 4:
+            pass
+        release.set()
+        for t in threads:
+            t.join()
+
+        for i in range(5):
+            self.assertEqual(store.retrieve('k%d' % i), i)
+        self.assertEqual(store.stats.snapshot()['batches'], 7)
+
+    def test_leader_hands_off(self):
+        store = self._makeOne(pool_size=1, batch_size=1)
+        release = threading.Event()
+        senders = {}
+        backend_store = store.backend.store
+
+        def slow_store(key, value, expires=None):
+            release.wait()
+            senders[key] = threading.current_thread().name
+            backend_store(key, value, expires=expires)
+        store.backend.store = slow_store
+
+        threads = [threading.Thread(target=store.store, args=('k%d' % i, i),
+                                    name='t%d' % i)
+                   for i in range(3)]
+        threads[0].start()
+        while not store._flushers:
+            pass
+        for t in threads[1:]:
+            t.start()
+        while len(store._pending) < 2:
+            pass
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(senders, {'k0': 't0', 'k1': 't1', 'k2': 't2'})
+        self.assertEqual(store._flushers, 0)
+
+    def test_batch_error(self):
+        store = self._makeOne(pool_size=1)
+
+        def fail(batch):
+            raise RuntimeError('down')
+        store._execute = fail
+        self.assertRaises(RuntimeError, store.store, 'k', 'v')
+        self.assertEqual(store._flushers, 0)
+
+    def test_redis_expiry_rounded_up(self):
+        from datetime import timedelta
+        calls = []
+
+        class DummyPipeline(object):
+            def set(self, key, value, ex=None):
+                calls.append((key, ex))
+
+            def execute(self, raise_on_error=True):
+                return [True] * len(calls)
+
+        class DummyRedis(object):
+            def pipeline(self, transaction=True):
+                return DummyPipeline()
+
+        from velruse.store.pipeline import STORE, _Op
+        store = self._makeOne()
+        store.backend.key_prefix = 'p.'
+        store._redis = DummyRedis()
+        store._execute_redis([
+            _Op(STORE, 'a', 1, timedelta(milliseconds=300)),
+            _Op(STORE, 'b', 1, timedelta(seconds=1.5)),
+            _Op(STORE, 'c', 1, 60),
+            _Op(STORE, 'd', 1),
+        ])
+        self.assertEqual(calls, [('p.a', 1), ('p.b', 2), ('p.c', 60),
+                                 ('p.d', None)])
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import time
+
+import unittest2 as unittest
+
+
+class TestSharedMemoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, **kw):
+        from velruse.store.shm import SharedMemoryStore
+        kw.setdefault('slots', 64)
+        kw.setdefault('stripes', 4)
+        kw.setdefault('slot_size', 512)
+        return SharedMemoryStore(self.path, **kw)
+
+    def test_store_and_retrieve(self):
+        store = self._makeOne()
+        store.store('foo', {'profile': {'displayName': 'Foo'}})
+        self.assertEqual(store.retrieve('foo'),
+                         {'profile': {'displayName': 'Foo'}})
+        self.assertRaises(KeyError, store.retrieve, 'bar')
+
+    def test_overwrite(self):
+        store = self._makeOne()
+        store.store('foo', 1)
+        store.store('foo', 2)
+        self.assertEqual(store.retrieve('foo'), 2)
+
+    def test_shared_between_instances(self):
+        store = self._makeOne()
+        other = self._makeOne()
+        store.store('foo', 'bar')
+        self.assertEqual(other.retrieve('foo'), 'bar')
+        other.delete('foo')
+        self.assertRaises(KeyError, store.retrieve, 'foo')
+
+    def test_geometry_mismatch(self):
+        self._makeOne()
+        self.assertRaises(ValueError, self._makeOne, slots=128)
+
+    def test_expires(self):
+        store = self._makeOne()
+        store.store('foo', 'bar', expires=0.01)
+        store.store('baz', 'bar')
+        time.sleep(0.02)
+        self.assertRaises(KeyError, store.retrieve, 'foo')
+        store.purge_expired()
+        self.assertRaises(KeyError, store.retrieve, 'foo')
+        self.assertEqual(store.retrieve('baz'), 'bar')
+
+    def test_full(self):
+        store = self._makeOne(slots=4, stripes=1)
+        for i in range(4):
+            store.store('key%d' % i, i)
+        self.assertRaises(ValueError, store.store, 'key4', 4)
+        store.delete('key0')
+        store.store('key4', 4)
+        for i in range(1, 5):
+            self.assertEqual(store.retrieve('key%d' % i), i)
+
+    def test_value_too_large(self):
+        store = self._makeOne()
+        self.assertRaises(ValueError, store.store, 'foo', 'x' * 1024)
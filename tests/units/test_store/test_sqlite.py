@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import time
+
+import unittest2 as unittest
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'store.db')
+        self.stores = []
+
+    def tearDown(self):
+        # close the connections before their WAL files are removed
+        for store in self.stores:
+            store._get_conn().close()
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, **kw):
+        from velruse.store.sqlite import SQLiteStore
+        kw.setdefault('purge_interval', 0)
+        store = SQLiteStore(self.path, **kw)
+        self.stores.append(store)
+        return store
+
+    def test_store_and_retrieve(self):
+        store = self._makeOne()
+        store.store('foo', {'profile': {'displayName': 'Foo'}})
+        self.assertEqual(store.retrieve('foo'),
+                         {'profile': {'displayName': 'Foo'}})
+        self.assertRaises(KeyError, store.retrieve, 'bar')
+
+    def test_wal_mode(self):
+        store = self._makeOne()
+        mode = store._get_conn().execute('PRAGMA journal_mode').fetchone()
+        self.assertEqual(mode[0], 'wal')
+
+    def test_delete(self):
+        store = self._makeOne()
+        store.store('foo', 'bar')
+        store.delete('foo')
+        self.assertRaises(KeyError, store.retrieve, 'foo')
+
+    def test_purge_in_batches(self):
+        store = self._makeOne(purge_batch=3)
+        for i in range(10):
+            store.store('expired%d' % i, i, expires=0.01)
+        store.store('kept', 'bar', expires=60)
+        time.sleep(0.02)
+        self.assertRaises(KeyError, store.retrieve, 'expired0')
+        store.purge_expired()
+        count = store._get_conn().execute(
+            'SELECT count(*) FROM velruse_store').fetchone()[0]
+        self.assertEqual(count, 1)
+        self.assertEqual(store.retrieve('kept'), 'bar')
@@ -0,0 +1,131 @@
+import socket
+import threading
+
+import unittest2 as unittest
+
+
+class DummyPrimary(object):
+
+    def __init__(self):
+        self.data = {}
+        self.error = None
+        self.block = None
+
+    def _check(self):
+        if self.block is not None:
+            self.block.wait()
+        if self.error is not None:
+            raise self.error
+
+    def store(self, key, value, expires=None):
+        self._check()
+        self.data[key] = value
+
+    def retrieve(self, key):
+        self._check()
+        return self.data[key]
+
+    def delete(self, key):
+        self._check()
+        self.data.pop(key, None)
+
+    def purge_expired(self):
+        pass
+
+
+class TestTieredStore(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = DummyPrimary()
+
+    def tearDown(self):
+        if self.primary.block is not None:
+            self.primary.block.set()
+
+    def _makeOne(self, **kw):
+        from velruse.store.tiered import TieredStore
+        kw.setdefault('timeout', 0.05)
+        store = TieredStore('memory', **kw)
+        store.primary = self.primary
+        return store
+
+    def test_primary(self):
+        store = self._makeOne()
+        self.assertEqual(store.store_routed('foo', 'bar'), 'foo')
+        self.assertEqual(self.primary.data, {'foo': 'bar'})
+        self.assertEqual(store.retrieve('foo'), 'bar')
+
+    def test_workers_started_lazily(self):
+        store = self._makeOne()
+        self.assertEqual(store._calls, None)
+        store.store('foo', 'bar')
+        calls = store._calls
+        self.assertTrue(calls is not None)
+        # a forked child starts its own workers
+        store._workers_pid = -1
+        store.store('foo', 'baz')
+        self.assertFalse(store._calls is calls)
+        self.assertEqual(store.retrieve('foo'), 'baz')
+
+    def test_fallback_when_primary_raises(self):
+        from velruse.store.tiered import LOCAL_HINT
+        store = self._makeOne()
+        self.primary.error = IOError('down')
+        key = store.store_routed('foo', 'bar')
+        self.assertEqual(key, LOCAL_HINT + 'foo')
+        self.assertEqual(store.retrieve(key), 'bar')
+
+    def test_unhinted_key_stored_during_outage(self):
+        store = self._makeOne()
+        self.primary.error = IOError('down')
+        store.store('foo', 'bar')
+        # the primary is back but never saw the value
+        self.primary.error = None
+        self.assertEqual(store.retrieve('foo'), 'bar')
+        self.assertRaises(KeyError, store.retrieve, 'unknown')
+
+    def test_retrieve_when_primary_raises(self):
+        store = self._makeOne(retry_interval=60)
+        store.local.store('foo', 'bar')
+        self.primary.error = socket.error('connection refused')
+        self.assertEqual(store.retrieve('foo'), 'bar')
+        self.assertTrue(store._down_until > 0)
+        self.assertRaises(KeyError, store.retrieve, 'unknown')
+
+    def test_hinted_key_stored_by_primary(self):
+        from velruse.store.tiered import LOCAL_HINT
+        store = self._makeOne()
+        store.store('foo', 'bar')
+        self.assertEqual(store.retrieve(LOCAL_HINT + 'foo'), 'bar')
+
+    def test_timeout_marks_primary_down(self):
+        from velruse.store.tiered import LOCAL_HINT
+        store = self._makeOne(retry_interval=60)
+        self.primary.block = threading.Event()
+        self.assertEqual(store.store_routed('foo', 'bar'),
+                         LOCAL_HINT + 'foo')
+        self.assertTrue(store._down_until > 0)
+        # the primary is skipped without waiting while it is down
+        self.primary.block.set()
+        self.primary.block = None
+        self.assertEqual(store.store_routed('baz', 'qux'),
+                         LOCAL_HINT + 'baz')
+        self.assertFalse('baz' in self.primary.data)
+
+    def test_retry_after_interval(self):
+        store = self._makeOne(retry_interval=0)
+        self.primary.block = threading.Event()
+        store.store_routed('foo', 'bar')
+        self.primary.block.set()
+        self.primary.block = None
+        self.assertEqual(store.store_routed('baz', 'qux'), 'baz')
+
+    def test_delete_hinted_key(self):
+        store = self._makeOne()
+        self.primary.error = IOError('down')
+        key = store.store_routed('foo', 'bar')
+        self.primary.error = None
+        self.primary.data['foo'] = 'stale'
+        store.delete(key)
+        self.assertRaises(KeyError, store.retrieve, key)
+        self.assertEqual(self.primary.data, {})
@@ -0,0 +1,162 @@
+import unittest2 as unittest
+
+
+class DummySource(object):
+
+    def __init__(self, tenants):
+        self.tenants = tenants
+        self.loads = 0
+
+    def load(self, tenant, provider):
+        self.loads += 1
+        return self.tenants.get(tenant)
+
+
+class TestTenantProviders(unittest.TestCase):
+
+    def _makeOne(self, source, **kw):
+        from velruse.tenants import TenantProviders
+        return TenantProviders(source, **kw)
+
+    def test_get(self):
+        source = DummySource({'acme': {'consumer_key': 'key',
+                                       'consumer_secret': 'secret',
+                                       'scope': 'repo'}})
+        tenants = self._makeOne(source)
+        provider = tenants.get('acme', 'github')
+        self.assertEqual(provider.consumer_key, 'key')
+        self.assertEqual(provider.scope, 'repo')
+        self.assertEqual(provider.callback_route,
+                         'velruse.tenant-github-callback')
+        self.assertTrue(tenants.get('acme', 'github') is provider)
+        self.assertEqual(tenants.get('other', 'github'), None)
+        self.assertEqual(tenants.get('other', 'github'), None)
+        self.assertEqual(source.loads, 2)
+
+    def test_scope(self):
+        source = DummySource({'acme': {'consumer_key': 'key',
+                                       'consumer_secret': 'secret',
+                                       'scope': 'email'}})
+        tenants = self._makeOne(source)
+        for impl in ('taobao', 'weibo', 'facebook'):
+            self.assertEqual(tenants.get('acme', impl).scope, 'email')
+        # OAuth1 providers take no scope
+        self.assertEqual(tenants.get('acme', 'twitter').consumer_key, 'key')
+
+    def test_lru(self):
+        source = DummySource({'a': {'consumer_key': 'a',
+                                    'consumer_secret': 'a'},
+                              'b': {'consumer_key': 'b',
+                                    'consumer_secret': 'b'}})
+        tenants = self._makeOne(source, max_entries=2)
+        tenants.get('a', 'twitter')
+        tenants.get('b', 'twitter')
+        tenants.get('a', 'twitter')
+        tenants.get('c', 'twitter')
+        self.assertEqual(source.loads, 3)
+        tenants.get('a', 'twitter')
+        self.assertEqual(source.loads, 3)
+        tenants.get('b', 'twitter')
+        self.assertEqual(source.loads, 4)
+
+    def test_ttl_and_invalidate(self):
+        source = DummySource({})
+        tenants = self._makeOne(source, ttl=0)
+        tenants.get('a', 'github')
+        tenants.get('a', 'github')
+        self.assertEqual(source.loads, 2)
+
+        tenants = self._makeOne(source)
+        tenants.get('a', 'github')
+        tenants.get('a', 'facebook')
+        tenants.invalidate('a', 'github')
+        tenants.get('a', 'github')
+        tenants.get('a', 'facebook')
+        self.assertEqual(source.loads, 5)
+
+
+class TestSQLSource(unittest.TestCase):
+
+    def test_it(self):
+        import sqlite3
+        from velruse.tenants import SQLSource
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE velruse_tenants (tenant, provider, '
+                     'consumer_key, consumer_secret, scope)')
+        conn.execute("INSERT INTO velruse_tenants VALUES "
+                     "('acme', 'github', 'key', 'secret', NULL)")
+        source = SQLSource(lambda: conn)
+        self.assertEqual(source.load('acme', 'github'), {
+            'consumer_key': 'key',
+            'consumer_secret': 'secret',
+            'scope': None,
+        })
+        self.assertEqual(source.load('acme', 'facebook'), None)
+
+
+class TestTenantRoutes(unittest.TestCase):
+
+    def _makeApp(self):
+        from velruse.app import make_app
+        return make_app(**{
+            'endpoint': 'http://example.com/logged_in',
+            'session.secret': 'seekrit',
+            'tenants.providers': 'github',
+            'tenant.acme.github.consumer_key': 'key',
+            'tenant.acme.github.consumer_secret': 'secret',
+        })
+
+    def test_login(self):
+        from pyramid.request import Request
+        app = self._makeApp()
+        response = Request.blank('/login/acme/github').get_response(app)
+        self.assertEqual(response.status_int, 302)
+        self.assertTrue('client_id=key' in response.location)
+        self.assertTrue('%2Flogin%2Facme%2Fgithub%2Fcallback'
+                        in response.location)
+
+    def test_unknown_tenant(self):
+        from pyramid.request import Request
+        app = self._makeApp()
+        response = Request.blank('/login/other/github').get_response(app)
+        self.assertEqual(response.status_int, 404)
+
+
+class TestStoreSource(unittest.TestCase):
+
+    def _makeApp(self, **settings):
+        from velruse.app import make_app
+        settings.update({
+            'endpoint': 'http://example.com/logged_in',
+            'session.secret': 'seekrit',
+            'tenants.providers': 'github',
+            'tenants.source': 'store',
+        })
+        return make_app(**settings)
+
+    def test_own_store(self):
+        from pyramid.request import Request
+        app = self._makeApp(**{'tenants.store.store': 'memory'})
+        store = app.registry.velruse_tenants.source.store
+        self.assertFalse(store is app.registry.velruse_store)
+        store.store('velruse_tenant:acme:github',
+                    {'consumer_key': 'k', 'consumer_secret': 'TOPSECRET'})
+        response = Request.blank('/login/acme/github').get_response(app)
+        self.assertTrue('client_id=k' in response.location)
+
+    def test_auth_info_cannot_read_tenant_key(self):
+        from pyramid.request import Request
+        app = self._makeApp(**{'tenants.store.store': 'memory'})
+        # even when the velruse store holds tenant credentials
+        app.registry.velruse_store.store(
+            'velruse_tenant:acme:github',
+            {'consumer_key': 'k', 'consumer_secret': 'TOPSECRET'})
+        response = Request.blank(
+            '/auth_info?format=json&token=velruse_tenant:acme:github'
+        ).get_response(app)
+        self.assertEqual(response.status_int, 400)
+        self.assertEqual(response.body, b'null')
+
+    def test_missing_store(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeApp)
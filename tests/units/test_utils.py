@@ -0,0 +1,130 @@
+import unittest2 as unittest
+
+
+class TestRouteURLCache(unittest.TestCase):
+
+    def setUp(self):
+        from pyramid.config import Configurator
+        config = Configurator()
+        config.add_route('login', '/login')
+        config.add_route('tenant', '/login/{tenant}',
+                         pregenerator=lambda request, elements, kw: (
+                             elements, dict(kw, tenant='t')))
+        config.commit()
+        self.registry = config.registry
+
+    def _makeOne(self, max_entries=1000):
+        from velruse.utils import RouteURLCache
+        return RouteURLCache(max_entries)
+
+    def _makeRequest(self, url, matchdict=None):
+        from pyramid.request import Request
+        request = Request.blank(url)
+        request.registry = self.registry
+        request.matchdict = matchdict
+        return request
+
+    def test_per_host(self):
+        cache = self._makeOne()
+        url = cache.route_url(self._makeRequest('http://a.com/x'), 'login')
+        self.assertEqual(url, 'http://a.com/login')
+        url = cache.route_url(self._makeRequest('https://b.com/x'), 'login')
+        self.assertEqual(url, 'https://b.com/login')
+        self.assertEqual(len(cache.urls), 2)
+        cache.route_url(self._makeRequest('http://a.com/y'), 'login')
+        self.assertEqual(len(cache.urls), 2)
+
+    def test_matchdict(self):
+        cache = self._makeOne()
+        cache.route_url(self._makeRequest('http://a.com/', {'x': '1'}),
+                        'login')
+        cache.route_url(self._makeRequest('http://a.com/', {'x': '2'}),
+                        'login')
+        self.assertEqual(len(cache.urls), 1)
+        cache.route_url(self._makeRequest('http://a.com/', {'x': '1'}),
+                        'tenant')
+        cache.route_url(self._makeRequest('http://a.com/', {'x': '2'}),
+                        'tenant')
+        self.assertEqual(len(cache.urls), 3)
+
+    def test_bounded(self):
+        cache = self._makeOne(max_entries=2)
+        for host in ('a', 'b', 'c'):
+            cache.route_url(self._makeRequest('http://%s.com/' % host),
+                            'login')
+        self.assertEqual(list(cache.urls.values()), ['http://c.com/login'])
+
+
+class TestURLTemplate(unittest.TestCase):
+
+    def _makeOne(self, url, **static):
+        from velruse.utils import URLTemplate
+        return URLTemplate(url, **static)
+
+    def _parse(self, url):
+        from pyramid.compat import PY3
+        if PY3:
+            from urllib.parse import parse_qs, urlsplit
+        else:
+            from urlparse import parse_qs, urlsplit
+        parts = urlsplit(url)
+        return parts.path, parse_qs(parts.query)
+
+    def test_matches_flat_url(self):
+        from velruse.utils import flat_url
+        template = self._makeOne('https://example.com/authorize',
+                                 client_id='a b', response_type='code')
+        url = template(state='x&y', redirect_uri='http://h/cb?x=1')
+        self.assertEqual(self._parse(url), self._parse(flat_url(
+            'https://example.com/authorize', client_id='a b',
+            response_type='code', state='x&y',
+            redirect_uri='http://h/cb?x=1')))
+
+    def test_no_static(self):
+        template = self._makeOne('https://example.com/me')
+        self.assertEqual(template(), 'https://example.com/me')
+        self.assertEqual(template(a='1'), 'https://example.com/me?a=1')
+
+    def test_no_dynamic(self):
+        template = self._makeOne('https://example.com/me', a='1')
+        self.assertEqual(template(), 'https://example.com/me?a=1')
+
+
+class TestMD5Signer(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.utils import MD5Signer
+        return MD5Signer(**kw)
+
+    def test_taobao_signature(self):
+        sign = self._makeOne(prefix='secret', suffix='secret', upper=True,
+                             method='taobao.user.get', format='json',
+                             app_key='key', v='2.0', sign_method='md5',
+                             fields='user_id,nick')
+        self.assertEqual(sign(timestamp='2013-01-02 03:04:05',
+                              session='tok'),
+                         '1DABDB7840E5B3E3F2661E9A05E0195C')
+
+    def test_lastfm_signature(self):
+        sign = self._makeOne(suffix='secret', method='auth.getSession',
+                             api_key='key')
+        self.assertEqual(sign(token='tok'),
+                         '04e870be4bb79756721b7bc1937fe83d')
+
+    def test_matches_unprimed(self):
+        from hashlib import md5
+        static = {'b': 1, 'd': 2, 'f': 3}
+        sign = self._makeOne(prefix='p', suffix='s', **static)
+        for params in [{}, {'a': 0}, {'c': 0, 'e': 0}, {'g': 0},
+                       {'a': 0, 'g': 0}, {'d': 5}]:
+            merged = dict(static, **params)
+            src = 'p%ss' % ''.join('%s%s' % (k, merged[k])
+                                   for k in sorted(merged))
+            self.assertEqual(sign(**params),
+                             md5(src.encode('utf-8')).hexdigest())
+
+    def test_unicode(self):
+        from hashlib import md5
+        sign = self._makeOne(suffix='s')
+        self.assertEqual(sign(name=u'张'),
+                         md5(u'name张s'.encode('utf-8')).hexdigest())
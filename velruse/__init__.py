@@ -18,6 +18,7 @@ class AuthenticationDenied(object):
 
 def login_url(request, name):
     """ Generate the login URL for a provider."""
+    from velruse.utils import cached_route_url
     registry = request.registry
     provider = registry.velruse_providers[name]
-    return request.route_url(provider.login_route)
+    return cached_route_url(request, provider.login_route)
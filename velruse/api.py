@@ -1,4 +1,6 @@
 """Velruse Authentication API"""
+from pyramid.httpexceptions import HTTPNotFound
+
 from velruse import (
     AuthenticationComplete,
     AuthenticationDenied,
@@ -22,3 +24,35 @@ def register_provider(config, name, provider):
         registry.velruse_providers[name] = provider
 
     config.action(('velruse-provider', name), register)
+
+
+def current_provider(request, name):
+    """Return the provider currently registered as ``name``.
+
+    Raises :exc:`pyramid.httpexceptions.HTTPNotFound` when there is none,
+    for example after the provider was removed by a reload.
+    """
+    providers = getattr(request.registry, 'velruse_providers', {})
+    provider = providers.get(name)
+    if provider is None:
+        raise HTTPNotFound('unknown provider "%s"' % name)
+    return provider
+
+
+def provider_login_view(name):
+    """Return a login view for the provider registered as ``name``.
+
+    The provider is looked up on every request rather than bound when the
+    route is added, so that providers can be replaced at runtime.
+    """
+    def login(request):
+        return current_provider(request, name).login(request)
+    return login
+
+
+def provider_callback_factory(name):
+    """Return a callback route factory for the provider registered as
+    ``name``, see :func:`provider_login_view`."""
+    def callback(request):
+        return current_provider(request, name).callback(request)
+    return callback
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import os
 
@@ -6,18 +8,79 @@ from anykeystore import create_store_from_settings
 from pyramid.config import Configurator
 from pyramid.exceptions import ConfigurationError
 from pyramid.response import Response
-
+from pyramid.settings import asbool
+from pyramid.settings import aslist
+
+from velruse import login_url
+from velruse.app.delivery import delivery_modes
+from velruse.app.peers import PeerClient
+from velruse.app.peers import add_node
+from velruse.app.peers import find_peers
+from velruse.app.peers import token_node
+from velruse.app.tokens import TokenCodec
 from velruse.app.utils import generate_token
-from velruse.app.utils import redirect_form
+from velruse.app.webhook import WebhookPusher
+from velruse.utils import url_cache
 
 
 log = logging.getLogger(__name__)
 
 
-def auth_complete_view(context, request):
-    endpoint = request.registry.settings.get('endpoint')
-    token = generate_token()
+# prefix of the values saved by store_result, telling login results apart
+# from anything else kept in the velruse store
+RESULT_MARKER = b'velruse-result\n'
+
+# keys of the results stored by versions of velruse not encoding them
+LEGACY_RESULT_KEYS = (
+    frozenset(['profile', 'credentials']),
+    frozenset(['code', 'description']),
+)
+
+
+def store_result(request, data, expires=300):
+    """Save ``data`` in the velruse store and return its token.
+
+    Stores able to route keys (such as the ``tiered`` store) may return a
+    token carrying a routing hint, which is then handed out instead. When a
+    webhook is configured the result is also pushed to the application.
+    """
+    settings = request.registry.settings
+    codec = getattr(request.registry, 'velruse_tokens', None)
+    if codec is not None:
+        token = codec.generate(expires, node=settings.get('node'))
+    else:
+        token = generate_token()
+        if settings.get('node'):
+            token = add_node(token, settings['node'])
     storage = request.registry.velruse_store
+    value = RESULT_MARKER + data
+    store_routed = getattr(storage, 'store_routed', None)
+    if store_routed is not None:
+        token = store_routed(token, value, expires=expires)
+    else:
+        storage.store(token, value, expires=expires)
+    webhook = getattr(request.registry, 'velruse_webhook', None)
+    if webhook is not None:
+        webhook.push(token, data)
+    return token
+
+
+def encode_result(data):
+    """Encode ``data`` to the JSON bytes served by ``auth_info``"""
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(body, status=200):
+    return Response(body=body, status=status,
+                    content_type='application/json', charset='UTF-8')
+
+
+def redirect_response(request, token):
+    """Return the response delivering ``token`` to the endpoint"""
+    return request.registry.velruse_delivery(token)
+
+
+def auth_complete_view(context, request):
     if 'birthday' in context.profile:
         context.profile['birthday'] = \
                 context.profile['birthday'].strftime('%Y-%m-%d')
@@ -25,37 +88,112 @@ def auth_complete_view(context, request):
         'profile': context.profile,
         'credentials': context.credentials,
     }
-    storage.store(token, result_data, expires=300)
-    form = redirect_form(endpoint, token)
-    return Response(body=form)
+    if getattr(context, 'tenant', None):
+        result_data['tenant'] = context.tenant
+    token = store_result(request, encode_result(result_data))
+    return redirect_response(request, token)
 
 
 def auth_denied_view(context, request):
-    endpoint = request.registry.settings.get('endpoint')
-    token = generate_token()
-    storage = request.registry.velruse_store
     error_dict = {
         'code': getattr(context, 'code', None),
-        'description': context.message,
+        'description': context.reason,
     }
-    storage.store(token, error_dict, expires=300)
-    form = redirect_form(endpoint, token)
-    return Response(body=form)
+    if getattr(context, 'tenant', None):
+        error_dict['tenant'] = context.tenant
+    token = store_result(request, encode_result(error_dict))
+    return redirect_response(request, token)
+
+
+def retrieve_result(request, token):
+    """Load the JSON encoded result stored for ``token``.
+
+    Tokens owned by another node are fetched from that node when peers are
+    configured. Raises :exc:`KeyError` for unknown tokens and for keys of
+    anything but a login result.
+    """
+    registry = request.registry
+    node = token_node(token)
+    peers = getattr(registry, 'velruse_peers', None)
+    if peers is not None and node is not None \
+            and node != registry.settings.get('node'):
+        return peers.retrieve(node, token)
+    data = registry.velruse_store.retrieve(token)
+    if isinstance(data, bytes):
+        if data.startswith(RESULT_MARKER):
+            return data[len(RESULT_MARKER):]
+    elif isinstance(data, dict) and frozenset(data) in LEGACY_RESULT_KEYS:
+        # stored by a version of velruse which did not encode results
+        return encode_result(data)
+    # e.g. provider metadata kept in the store
+    raise KeyError(token)
 
 
 def auth_info_view(request):
     # TODO: insecure URL, must be protected behind a firewall
-    storage = request.registry.velruse_store
-    token = request.get('token')
+    token = request.params.get('token')
+    if not token:
+        return json_response(b'null', status=400)
+    codec = getattr(request.registry, 'velruse_tokens', None)
+    if codec is not None and not codec.verify(token):
+        log.info('auth_info requested expired or forged token "%s"', token)
+        return json_response(b'null', status=400)
     try:
-        return storage.retrieve(token)
+        return json_response(retrieve_result(request, token))
     except KeyError:
-        log.info('auth_info requested invalid token "%s"')
-        request.response.status = 400
-        return None
+        log.info('auth_info requested invalid token "%s"', token)
+        return json_response(b'null', status=400)
 
 
-def default_setup(config):
+def auth_info_batch_view(request):
+    """Return the results of every ``token`` parameter as one JSON object.
+
+    Unknown, expired or forged tokens are left out of the object.
+    """
+    tokens = request.params.getall('token')
+    limit = int(request.registry.settings.get('auth_info.batch_limit', 100))
+    if not tokens or len(tokens) > limit:
+        return json_response(b'null', status=400)
+    codec = getattr(request.registry, 'velruse_tokens', None)
+    items = []
+    for token in set(tokens):
+        if codec is not None and not codec.verify(token):
+            continue
+        try:
+            data = retrieve_result(request, token)
+        except KeyError:
+            continue
+        items.append(json.dumps(token).encode('utf-8') + b':' + data)
+    return json_response(b'{' + b','.join(items) + b'}')
+
+
+def _providers_listing(request):
+    providers = getattr(request.registry, 'velruse_providers', {})
+    listing = dict((name, {'login_url': login_url(request, name)})
+                   for name in providers)
+    body = encode_result(listing)
+    return body, hashlib.md5(body).hexdigest()
+
+
+def providers_view(request):
+    """List the configured providers with their login URLs.
+
+    The JSON body and its ETag are cached per host with the provider URLs.
+    """
+    cache = url_cache(request.registry)
+    body, etag = cache.get(('velruse.providers', request.application_url),
+                           lambda: _providers_listing(request))
+    response = json_response(body)
+    response.etag = etag
+    response.cache_control.public = True
+    response.cache_control.max_age = int(
+        request.registry.settings.get('providers_max_age', 300))
+    response.vary = ('Host',)
+    response.conditional_response = True
+    return response
+
+
+def default_session_setup(config):
     from pyramid.session import UnencryptedCookieSessionFactoryConfig
 
     log.info('Using an unencrypted cookie-based session. This can be '
@@ -75,10 +213,15 @@ def default_setup(config):
         secret, cookie_name=cookie_name)
     config.set_session_factory(factory)
 
+
+def default_setup(config):
+    default_session_setup(config)
+
     # setup backing storage
+    settings = config.registry.settings
     storage_string = settings.get('store', 'memory')
     settings['store.store'] = storage_string
-    store = create_store_from_settings('store.')
+    store = create_store_from_settings(settings, prefix='store.')
     config.register_velruse_store(store)
 
 
@@ -87,18 +230,19 @@ def register_velruse_store(config, storage):
     config.registry.velruse_store = storage
 
 settings_adapter = {
-    'bitbucket': 'add_bitbucket_login_from_settings',
-    'douban': 'add_douban_login_from_settings',
-    'facebook': 'add_facebook_login_from_settings',
-    'github': 'add_github_login_from_settings',
-    'lastfm': 'add_lastfm_login_from_settings',
-    'linkedin': 'add_linkedin_login_from_settings',
-    'live': 'add_live_login_from_settings',
-    'qq': 'add_qq_login_from_settings',
-    'renren': 'add_renren_login_from_settings',
-    'taobao': 'add_taobao_login_from_settings',
-    'twitter': 'add_twitter_login_from_settings',
-    'weibo': 'add_weibo_login_from_settings',
+    'bitbucket': 'setup_bitbucket_login_from_settings',
+    'douban': 'setup_douban_login_from_settings',
+    'facebook': 'setup_facebook_login_from_settings',
+    'github': 'setup_github_login_from_settings',
+    'lastfm': 'setup_lastfm_login_from_settings',
+    'linkedin': 'setup_linkedin_login_from_settings',
+    'live': 'setup_live_login_from_settings',
+    'oidc': 'setup_oidc_login_from_settings',
+    'qq': 'setup_qq_login_from_settings',
+    'renren': 'setup_renren_login_from_settings',
+    'taobao': 'setup_taobao_login_from_settings',
+    'twitter': 'setup_twitter_login_from_settings',
+    'weibo': 'setup_weibo_login_from_settings',
 }
 
 
@@ -124,6 +268,35 @@ def load_provider(config, provider):
     loader(prefix='provider.%s.' % provider)
 
 
+def include_providers(config):
+    """Add and configure the requested providers.
+
+    Only the provider modules used by a ``provider.*`` setting or listed in
+    the ``providers`` setting are imported and have their directives added,
+    so unused providers and their dependencies are never loaded.
+    """
+    settings = config.registry.settings
+    providers = find_providers(settings)
+
+    impls = set(aslist(settings.get('providers', '')))
+    for provider in providers:
+        impls.add(settings.get('provider.%s.impl' % provider) or provider)
+
+    # include used providers
+    for impl in sorted(impls):
+        if impl not in settings_adapter:
+            raise ConfigurationError('unknown provider "%s"' % impl)
+        config.include('velruse.providers.%s' % impl)
+
+    # configure requested providers
+    for provider in providers:
+        load_provider(config, provider)
+
+    # serve providers with per-tenant credentials
+    if settings.get('tenants.providers'):
+        config.include('velruse.tenants')
+
+
 def includeme(config):
     """Add the velruse standalone app configuration to a pyramid app."""
     settings = config.registry.settings
@@ -134,19 +307,46 @@ def includeme(config):
     if setup:
         config.include(setup)
 
-    # include supported providers
-    for provider in settings_adapter:
-        config.include('velruse.providers.%s' % provider)
+    # load provider settings which may change at runtime
+    if settings.get('providers_file'):
+        config.include('velruse.app.reload')
 
-    # configure requested providers
-    for provider in find_providers(settings):
-        load_provider(provider)
+    include_providers(config)
 
     # check for required settings
     if not settings.get('endpoint'):
         raise ConfigurationError(
             'missing required setting "endpoint"')
 
+    # prepare the responses delivering tokens to the endpoint
+    delivery = settings.get('delivery', 'form')
+    if delivery not in delivery_modes:
+        raise ConfigurationError(
+            'unknown delivery mode "%s"' % delivery)
+    config.registry.velruse_delivery = delivery_modes[delivery](settings)
+
+    # setup self-describing tokens
+    if settings.get('token.secret'):
+        config.registry.velruse_tokens = TokenCodec(settings['token.secret'])
+
+    # setup pushing results to the application
+    if settings.get('webhook.url'):
+        if not settings.get('webhook.secret'):
+            raise ConfigurationError(
+                'missing required setting "webhook.secret"')
+        options = dict((k[8:], v) for k, v in settings.items()
+                       if k.startswith('webhook.'))
+        config.registry.velruse_webhook = WebhookPusher(**options)
+
+    # setup peers owning node-local stores
+    peers = find_peers(settings)
+    if peers:
+        if not settings.get('node'):
+            raise ConfigurationError(
+                'missing required setting "node" when peers are configured')
+        config.registry.velruse_peers = PeerClient(
+            peers, timeout=settings.get('peer_timeout', 2))
+
     # add views
     config.add_view(
         auth_complete_view,
@@ -157,8 +357,20 @@ def includeme(config):
     config.add_view(
         auth_info_view,
         name='auth_info',
-        request_param='format=json',
-        renderer='json')
+        request_param='format=json')
+    config.add_view(
+        providers_view,
+        name='providers',
+        request_param='format=json')
+    config.add_view(
+        auth_info_batch_view,
+        name='auth_info_batch',
+        request_method='POST',
+        request_param='format=json')
+
+    # refreshing access tokens
+    if asbool(settings.get('refresh.enabled', False)):
+        config.include('velruse.app.refresh')
 
 
 def make_app(**settings):
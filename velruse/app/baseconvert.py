@@ -2,6 +2,22 @@
 
 ALPHABET = "23456789abcdefghijkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ"
 
+_pair_tables = {}
+
+
+def _pairs(alphabet):
+    """Return the encoding of every two digit number in ``alphabet``
+
+    Encoding two digits per division halves the number of big integer
+    operations needed to encode a number. The tables are built once per
+    alphabet, 3136 entries for the default one.
+    """
+    table = _pair_tables.get(alphabet)
+    if table is None:
+        table = [a + b for a in alphabet for b in alphabet]
+        _pair_tables[alphabet] = table
+    return table
+
 
 def base_encode(num, alphabet=ALPHABET):
     """Encode a number in Base X
@@ -11,12 +27,16 @@ def base_encode(num, alphabet=ALPHABET):
     """
     if (num == 0):
         return alphabet[0]
+    pairs = _pairs(alphabet)
+    pair_base = len(pairs)
     arr = []
-    base = len(alphabet)
-    while num:
-        rem = num % base
-        num = num // base
-        arr.append(alphabet[rem])
+    while num >= pair_base:
+        num, rem = divmod(num, pair_base)
+        arr.append(pairs[rem])
+    if num >= len(alphabet):
+        arr.append(pairs[num])
+    else:
+        arr.append(alphabet[num])
     arr.reverse()
     return ''.join(arr)
 
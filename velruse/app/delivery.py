@@ -0,0 +1,157 @@
+"""Delivering tokens to the endpoint
+
+The ``delivery`` setting of the standalone app selects how the browser
+hands the token to the endpoint once a login finished:
+
+``form`` (default)
+    An auto-submitting page POSTing the token, see
+    :class:`velruse.app.utils.RedirectForm`.
+
+``redirect``
+    A 302 redirect to the endpoint with the token as the ``token`` query
+    parameter. This saves the browser a page render and a POST, but the
+    token ends up in the endpoint's access logs and history.
+
+``fragment``
+    A 302 redirect with the token in the URL fragment, for endpoints read
+    by client-side code. The token never reaches the endpoint's server.
+
+``postmessage``
+    For logins opened in a popup by a single-page app. A tiny page sends
+    ``{"type": "velruse", "token": ...}`` to ``window.opener`` with
+    ``postMessage`` and closes the popup. The message is only delivered to
+    the origin given by the ``postmessage_origin`` setting.
+"""
+import io
+import json
+
+from pyramid.compat import PY3
+from pyramid.exceptions import ConfigurationError
+from pyramid.httpexceptions import HTTPFound
+from pyramid.path import AssetResolver
+from pyramid.response import Response
+
+if PY3:
+    from urllib.parse import quote
+else:
+    from urllib import quote
+
+from velruse.app.utils import RedirectForm
+
+
+class FormDelivery(object):
+    """Deliver the token with an auto-submitting form"""
+
+    def __init__(self, endpoint, template=None):
+        if template is None:
+            self.form = RedirectForm(endpoint)
+        else:
+            self.form = RedirectForm(endpoint, template)
+
+    def __call__(self, token):
+        response = Response(body=self.form.render(token),
+                            content_type='text/html', charset='UTF-8')
+        response.cache_control = 'no-store'
+        return response
+
+
+class RedirectDelivery(object):
+    """Deliver the token by redirecting to the endpoint
+
+    The endpoint is split once so each redirect only appends the quoted
+    token.
+    """
+
+    def __init__(self, endpoint, fragment=False):
+        base, sep, anchor = endpoint.partition('#')
+        if fragment:
+            sep = '&' if anchor else ''
+            self.prefix = '%s#%s%stoken=' % (base, anchor, sep)
+            self.suffix = ''
+        else:
+            sep = '&' if '?' in base else '?'
+            self.prefix = '%s%stoken=' % (base, sep)
+            self.suffix = '#' + anchor if anchor else ''
+
+    def __call__(self, token):
+        response = HTTPFound(
+            location=self.prefix + quote(token, safe='') + self.suffix)
+        response.cache_control = 'no-store'
+        return response
+
+
+POSTMESSAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><title>Login complete</title></head>
+<body>
+<script>
+if (window.opener) {
+  window.opener.postMessage({type: "velruse", token: %(token)s}, %(origin)s);
+}
+window.close();
+</script>
+</body>
+</html>
+"""
+
+
+def _script_literal(value):
+    """Encode ``value`` as a JavaScript literal safe inside a script tag"""
+    return json.dumps(value).replace('<', '\\u003c') \
+            .replace('>', '\\u003e').replace('&', '\\u0026')
+
+
+class PostMessageDelivery(object):
+    """Deliver the token to the window which opened the login popup
+
+    Like :class:`velruse.app.utils.RedirectForm` the page is compiled once
+    with the origin and split around the token.
+    """
+
+    def __init__(self, origin, template=POSTMESSAGE_TEMPLATE):
+        text = template % {
+            'origin': _script_literal(origin),
+            'token': '\x00',
+        }
+        self.chunks = [c.encode('utf-8') for c in text.split('\x00')]
+
+    def __call__(self, token):
+        token = _script_literal(token).encode('utf-8')
+        response = Response(body=token.join(self.chunks),
+                            content_type='text/html', charset='UTF-8')
+        response.cache_control = 'no-store'
+        return response
+
+
+def form_delivery(settings):
+    template_path = settings.get('redirect_template')
+    if not template_path:
+        return FormDelivery(settings['endpoint'])
+    path = AssetResolver().resolve(template_path).abspath()
+    with io.open(path, encoding='utf-8') as f:
+        return FormDelivery(settings['endpoint'], f.read())
+
+
+def redirect_delivery(settings):
+    return RedirectDelivery(settings['endpoint'])
+
+
+def fragment_delivery(settings):
+    return RedirectDelivery(settings['endpoint'], fragment=True)
+
+
+def postmessage_delivery(settings):
+    origin = settings.get('postmessage_origin')
+    if not origin:
+        raise ConfigurationError(
+            'missing required setting "postmessage_origin" for the '
+            '"postmessage" delivery mode')
+    return PostMessageDelivery(origin)
+
+
+delivery_modes = {
+    'form': form_delivery,
+    'redirect': redirect_delivery,
+    'fragment': fragment_delivery,
+    'postmessage': postmessage_delivery,
+}
@@ -0,0 +1,91 @@
+"""Fetching results stored on other velruse nodes
+
+When every node keeps its results in a node-local store (``memory`` or
+``shm``), the node serving an ``auth_info`` request is not necessarily the
+one that handled the callback. Tokens issued by a node configured with a
+``node`` setting end with ``.<node>``, and a node receiving a token owned by
+a peer asks that peer for the result over a pooled HTTP connection.
+
+Example settings:
+
+.. code-block:: ini
+
+    node = a
+    peer.a = http://10.0.0.1:8080/velruse
+    peer.b = http://10.0.0.2:8080/velruse
+    peer_timeout = 2
+"""
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger(__name__)
+
+NODE_SEPARATOR = '.'
+
+
+def find_peers(settings):
+    peers = {}
+    for k, v in settings.items():
+        if k.startswith('peer.'):
+            peers[k[5:]] = v.rstrip('/')
+    return peers
+
+
+def add_node(token, node):
+    """Mark ``token`` as owned by ``node``"""
+    return '%s%s%s' % (token, NODE_SEPARATOR, node)
+
+
+def split_node(token):
+    """Split ``token`` into its body and owning node.
+
+    Token bodies never contain the separator, so node names may. The node
+    is ``None`` for unmarked tokens.
+    """
+    body, sep, node = token.partition(NODE_SEPARATOR)
+    return body, node if sep else None
+
+
+def token_node(token):
+    """Return the node owning ``token`` or ``None`` if it is unmarked"""
+    return split_node(token)[1]
+
+
+class PeerClient(object):
+    """Retrieve results from the ``auth_info`` view of peer nodes.
+
+    Connections to each peer are kept alive and reused between requests.
+    """
+
+    def __init__(self, peers, timeout=2, pool_size=10):
+        self.peers = peers
+        self.timeout = float(timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(peers), 1),
+                              pool_maxsize=int(pool_size))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def retrieve(self, node, token):
+        """Fetch the JSON encoded result for ``token`` from ``node``.
+
+        Raises a :exc:`KeyError` when the node is unknown, unreachable or
+        does not know the token, mirroring a local store miss.
+        """
+        base = self.peers.get(node)
+        if base is None:
+            raise KeyError(token)
+        try:
+            r = self.session.get(base + '/auth_info',
+                                 params={'format': 'json', 'token': token},
+                                 timeout=self.timeout)
+        except requests.RequestException:
+            log.warn('could not reach velruse peer "%s"', node,
+                     exc_info=True)
+            raise KeyError(token)
+        if r.status_code != 200:
+            raise KeyError(token)
+        return r.content
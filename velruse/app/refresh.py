@@ -0,0 +1,209 @@
+"""Refreshing access tokens
+
+Providers issuing refresh tokens (see
+:attr:`velruse.providers.base.OAuth2Provider.refresh_supported`) return
+them as ``oauthRefreshToken`` in the credentials of a login. With
+``refresh.enabled = true`` the standalone app exchanges them for new
+credentials without sending the user through the login again:
+
+``POST refresh?format=json`` with the ``provider`` name, the
+``refresh_token`` and, for per-tenant providers, the ``tenant`` (with the
+provider's implementation as ``provider``) returns
+``{"credentials": {...}}``, or ``{"error": "..."}`` with a 400 status.
+
+``POST refresh_batch?format=json`` with a JSON list of
+``{"provider": ..., "refresh_token": ..., "tenant": ...}`` objects returns
+a list with a ``credentials`` or ``error`` object for each of them, in the
+same order. At most ``refresh.batch_limit`` (default 100) tokens are
+refreshed by ``refresh.workers`` (default 8) threads at once.
+
+Requests to each provider are limited to ``refresh.rate`` per second
+(default 10) with bursts of ``refresh.burst`` (default the rate). A token
+waiting more than ``refresh.max_wait`` seconds (default 5) for its turn
+fails with a ``rate limited`` error, answered with a 503 by ``refresh``.
+
+Like ``auth_info``, these URLs must only be reachable by the application.
+"""
+import json
+import logging
+import threading
+import time
+
+from pyramid.compat import PY3
+
+if PY3:
+    import queue
+else:  # pragma: no cover
+    import Queue as queue
+
+from velruse.app import json_response
+from velruse.exceptions import VelruseException
+
+
+log = logging.getLogger(__name__)
+
+
+class RefreshError(Exception):
+    """Raised when a refresh token cannot be exchanged"""
+
+
+class RateLimited(RefreshError):
+    """Raised when a provider's rate limit is exceeded for too long"""
+
+
+class RateLimiter(object):
+    """Token buckets allowing ``rate`` calls per second for each key"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, max_wait):
+        """Wait for a call to ``key`` to be allowed.
+
+        Returns ``False`` without waiting when it would take more than
+        ``max_wait`` seconds.
+        """
+        with self._lock:
+            now = time.time()
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            delay = (1 - tokens) / self.rate if tokens < 1 else 0
+            if delay > max_wait:
+                self.buckets[key] = (tokens, now)
+                return False
+            self.buckets[key] = (tokens - 1, now)
+        if delay:
+            time.sleep(delay)
+        return True
+
+
+class RefreshService(object):
+    """Refresh access tokens with the providers of ``registry``"""
+
+    def __init__(self, registry, workers=8, rate=10, burst=None,
+                 max_wait=5):
+        self.registry = registry
+        self.workers = int(workers)
+        self.max_wait = float(max_wait)
+        self.limiter = RateLimiter(rate, burst)
+
+    def provider(self, name, tenant=None):
+        if tenant:
+            tenants = getattr(self.registry, 'velruse_tenants', None)
+            provider = tenants and tenants.get(tenant, name)
+        else:
+            providers = getattr(self.registry, 'velruse_providers', {})
+            provider = providers.get(name)
+        if provider is None:
+            raise RefreshError('unknown provider "%s"' % name)
+        if not getattr(provider, 'refresh_supported', False):
+            raise RefreshError('provider "%s" does not support refresh'
+                               % name)
+        return provider
+
+    def refresh(self, name, refresh_token, tenant=None):
+        """Return new credentials for ``refresh_token``.
+
+        Raises :exc:`RefreshError` when the token cannot be refreshed.
+        """
+        if not refresh_token:
+            raise RefreshError('missing refresh_token')
+        provider = self.provider(name, tenant)
+        if not self.limiter.acquire(provider.name, self.max_wait):
+            raise RateLimited('rate limited')
+        try:
+            return provider.refresh(refresh_token)
+        except (VelruseException, ValueError) as e:
+            log.info('could not refresh a %s token: %s', name, e)
+            raise RefreshError(str(e))
+
+    def _result(self, item):
+        try:
+            if not isinstance(item, dict):
+                raise RefreshError('invalid item')
+            return {'credentials': self.refresh(item.get('provider'),
+                                                item.get('refresh_token'),
+                                                item.get('tenant'))}
+        except RefreshError as e:
+            return {'error': str(e)}
+        except Exception:
+            # keep the worker alive for the rest of the batch
+            log.exception('unexpected error refreshing a token')
+            return {'error': 'internal error'}
+
+    def refresh_many(self, items):
+        """Refresh the tokens of ``items`` concurrently.
+
+        Returns a ``credentials`` or ``error`` result for each item.
+        """
+        results = [None] * len(items)
+        pending = queue.Queue()
+        for i, item in enumerate(items):
+            pending.put((i, item))
+
+        def work():
+            while True:
+                try:
+                    i, item = pending.get_nowait()
+                except queue.Empty:
+                    return
+                results[i] = self._result(item)
+
+        threads = [threading.Thread(target=work)
+                   for _ in range(min(self.workers, len(items)) - 1)]
+        for thread in threads:
+            thread.start()
+        work()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+def refresh_view(request):
+    service = request.registry.velruse_refresher
+    params = request.POST
+    try:
+        cred = service.refresh(params.get('provider'),
+                               params.get('refresh_token'),
+                               params.get('tenant'))
+    except RefreshError as e:
+        status = 503 if isinstance(e, RateLimited) else 400
+        return json_response(json.dumps({'error': str(e)}).encode('utf-8'),
+                             status=status)
+    return json_response(json.dumps({'credentials': cred}).encode('utf-8'))
+
+
+def refresh_batch_view(request):
+    service = request.registry.velruse_refresher
+    limit = int(request.registry.settings.get('refresh.batch_limit', 100))
+    try:
+        items = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        items = None
+    if not isinstance(items, list) or not items or len(items) > limit:
+        return json_response(b'null', status=400)
+    results = service.refresh_many(items)
+    return json_response(json.dumps(results).encode('utf-8'))
+
+
+def includeme(config):
+    settings = config.registry.settings
+    config.registry.velruse_refresher = RefreshService(
+        config.registry,
+        workers=settings.get('refresh.workers', 8),
+        rate=settings.get('refresh.rate', 10),
+        burst=settings.get('refresh.burst'),
+        max_wait=settings.get('refresh.max_wait', 5))
+    config.add_view(
+        refresh_view,
+        name='refresh',
+        request_method='POST',
+        request_param='format=json')
+    config.add_view(
+        refresh_batch_view,
+        name='refresh_batch',
+        request_method='POST',
+        request_param='format=json')
@@ -0,0 +1,192 @@
+"""Reloading provider settings at runtime
+
+With a ``providers_file`` setting the standalone app reads additional
+settings, usually the ``provider.*`` ones, from the ``[providers]`` section
+of that file and checks it for changes at most every
+``providers_file.interval`` seconds (default 5).
+
+When the file changed, the providers are configured again in a throwaway
+configurator. If that succeeds the new provider objects replace
+``registry.velruse_providers`` in a single assignment; the login and
+callback routes look providers up by name on each request (see
+:func:`velruse.api.provider_login_view`), so requests already in progress
+finish with the old objects and new ones use the new objects. The store,
+metadata cache, delivery, webhook and peer connections are left alone. A
+file which fails to load is logged and the running providers are kept.
+
+Routes of providers added by a reload are added to the running app by
+swapping in a new route list. Routes of removed providers answer 404.
+Changing the ``login_path`` or ``callback_path`` of a running provider
+needs a restart.
+
+Example ``providers.ini``:
+
+.. code-block:: ini
+
+    [providers]
+    provider.facebook.consumer_key = KMfXjzsA2qVUcnnRn3vpnwWZ2pwPRFZdb
+    provider.facebook.consumer_secret = ULZ6PkJbsqw2GxZWCIbOEBZdkrb9XwgX
+"""
+import logging
+import os
+import threading
+import time
+
+from pyramid.compat import PY3
+from pyramid.config import Configurator
+from pyramid.events import NewRequest
+from pyramid.interfaces import IRoutesMapper
+from pyramid.urldispatch import RoutesMapper
+
+from velruse.providers.metadata import metadata_cache
+
+if PY3:
+    from configparser import RawConfigParser
+else:
+    from ConfigParser import RawConfigParser
+
+
+log = logging.getLogger(__name__)
+
+
+def read_providers_file(path):
+    """Return the settings in the ``[providers]`` section of ``path``"""
+    parser = RawConfigParser()
+    parser.optionxform = str
+    with open(path) as f:
+        if PY3:
+            parser.read_file(f)
+        else:
+            parser.readfp(f)
+    return dict(parser.items('providers'))
+
+
+class ProviderReloader(object):
+    """Reload the providers of ``registry`` when ``path`` changes"""
+
+    def __init__(self, registry, path, interval=5):
+        self.registry = registry
+        self.path = path
+        self.interval = float(interval)
+        # the app settings without anything read from the file
+        self.base_settings = dict(registry.settings)
+        self.mtime = None
+        self.next_check = 0
+        self._lock = threading.Lock()
+
+    def settings(self):
+        """Return the app settings updated from the file"""
+        self.mtime = os.stat(self.path).st_mtime
+        settings = dict(self.base_settings)
+        settings.update(read_providers_file(self.path))
+        return settings
+
+    def check(self, event=None):
+        """Reload the providers if the file changed.
+
+        Called for every request; only one request every ``interval``
+        seconds looks at the file and other requests never wait for a
+        reload in progress.
+        """
+        now = time.time()
+        if now < self.next_check or not self._lock.acquire(False):
+            return
+        try:
+            self.next_check = now + self.interval
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                log.warn('could not stat providers file "%s"', self.path)
+                return
+            if mtime != self.mtime:
+                self.reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Configure the providers from the file and swap them in.
+
+        Returns whether the providers were replaced.
+        """
+        from velruse.app import include_providers
+
+        try:
+            settings = self.settings()
+            # tenants are not reloaded and may need services of the app
+            settings.pop('tenants.providers', None)
+            config = Configurator(settings=settings)
+            # keep sharing the store and the warm metadata of the app
+            store = getattr(self.registry, 'velruse_store', None)
+            if store is not None:
+                config.registry.velruse_store = store
+            config.registry.velruse_metadata = metadata_cache(self.registry)
+            include_providers(config)
+            config.commit()
+        except Exception:
+            log.exception('could not load providers file "%s", keeping the '
+                          'current providers', self.path)
+            return False
+        providers = getattr(config.registry, 'velruse_providers', {})
+
+        # add the routes of new providers to the running app
+        mapper = self.registry.getUtility(IRoutesMapper)
+        added = set(n for n, p in providers.items()
+                    if mapper.get_route(p.login_route) is None)
+        for key in list(self.registry.settings):
+            if key.startswith('provider.') and key not in settings:
+                del self.registry.settings[key]
+        self.registry.settings.update(settings)
+        if added:
+            self.add_routes(mapper, settings, added)
+
+        self.registry.velruse_providers = providers
+        cache = getattr(self.registry, 'velruse_url_cache', None)
+        if cache is not None:
+            cache.clear()
+        log.info('reloaded providers from "%s": %s', self.path,
+                 ', '.join(sorted(providers)))
+        return True
+
+    def add_routes(self, mapper, settings, added):
+        """Configure the ``added`` providers in the running app.
+
+        Their routes are connected to a copy of the routes mapper which
+        then replaces the routes of ``mapper`` in single assignments, so
+        requests matching routes meanwhile never see a list being changed.
+        """
+        from velruse.app import find_providers
+        from velruse.app import load_provider
+
+        scratch = RoutesMapper()
+        scratch.routes = dict(mapper.routes)
+        scratch.routelist = list(mapper.routelist)
+        scratch.static_routes = list(mapper.static_routes)
+        self.registry.registerUtility(scratch, IRoutesMapper)
+        try:
+            live = Configurator(registry=self.registry)
+            for provider in find_providers(settings):
+                impl = settings.get('provider.%s.impl' % provider) or provider
+                # settings providers are registered under their impl
+                if provider in added or impl in added:
+                    live.include('velruse.providers.%s' % impl)
+                    load_provider(live, provider)
+            live.commit()
+        finally:
+            self.registry.registerUtility(mapper, IRoutesMapper)
+        mapper.routes = scratch.routes
+        mapper.static_routes = scratch.static_routes
+        mapper.routelist = scratch.routelist
+
+
+def includeme(config):
+    """Load the ``providers_file`` and reload it when it changes.
+
+    Must be included before the providers are configured.
+    """
+    settings = config.registry.settings
+    reloader = ProviderReloader(
+        config.registry, settings['providers_file'],
+        interval=settings.get('providers_file.interval', 5))
+    settings.update(reloader.settings())
+    config.registry.velruse_reloader = reloader
+    config.add_subscriber(reloader.check, NewRequest)
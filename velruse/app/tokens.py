@@ -0,0 +1,104 @@
+"""Self-describing tokens
+
+When the standalone app is configured with a ``token.secret`` setting, the
+tokens it issues describe themselves: they embed their expiry time and a
+MAC covering the token and the owning node (see :mod:`velruse.app.peers`).
+``auth_info`` can then reject expired, malformed or forged tokens without
+touching the store, and route valid ones straight to the owning node.
+
+A token is the base encoding of 20 bytes, optionally followed by
+``.<node>``::
+
+    random (8 bytes) | expiry (4 bytes, seconds since epoch) | MAC (8 bytes)
+
+The MAC is a truncated HMAC-SHA256 of the first 12 bytes and the node.
+"""
+import binascii
+import hashlib
+import hmac
+import struct
+import time
+
+from velruse.app.baseconvert import base_decode
+from velruse.app.baseconvert import base_encode
+from velruse.app.peers import add_node
+from velruse.app.peers import split_node
+from velruse.app.utils import random_bytes
+from velruse.store.tiered import LOCAL_HINT
+from velruse.utils import compare_digest
+
+
+EXPIRY = struct.Struct('>I')
+
+RANDOM_SIZE = 8
+MAC_SIZE = 8
+PAYLOAD_SIZE = RANDOM_SIZE + EXPIRY.size
+TOKEN_SIZE = PAYLOAD_SIZE + MAC_SIZE
+
+# the largest number of digits a TOKEN_SIZE byte number encodes to
+MAX_DIGITS = len(base_encode(2 ** (TOKEN_SIZE * 8) - 1))
+
+
+def _int_to_bytes(num):
+    return binascii.unhexlify('%0*x' % (TOKEN_SIZE * 2, num))
+
+
+def _bytes_to_int(data):
+    return int(binascii.hexlify(data), 16)
+
+
+class TokenCodec(object):
+    """Issue and verify self-describing tokens signed with ``secret``"""
+
+    def __init__(self, secret):
+        if not isinstance(secret, bytes):
+            secret = secret.encode('utf-8')
+        self.secret = secret
+        # keyed once, copied for every token
+        self._hmac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def _mac(self, payload, node):
+        h = self._hmac.copy()
+        h.update(payload + node.encode('utf-8'))
+        return h.digest()[:MAC_SIZE]
+
+    def generate(self, expires, node=None):
+        """Return a new token valid for ``expires`` seconds"""
+        node = node or ''
+        payload = random_bytes(RANDOM_SIZE) + \
+                EXPIRY.pack(int(time.time() + expires))
+        token = base_encode(_bytes_to_int(payload + self._mac(payload, node)))
+        if node:
+            token = add_node(token, node)
+        return token
+
+    def expiry(self, token):
+        """Return the expiry timestamp of a valid ``token``.
+
+        Raises :exc:`ValueError` if the token is malformed or its MAC does
+        not match. Routing hints added by stores are ignored.
+        """
+        if token.startswith(LOCAL_HINT):
+            token = token[len(LOCAL_HINT):]
+        body, node = split_node(token)
+        node = node or ''
+        if not body or len(body) > MAX_DIGITS:
+            raise ValueError('malformed token')
+        num = base_decode(body)
+        if num >> (TOKEN_SIZE * 8):
+            raise ValueError('malformed token')
+        data = _int_to_bytes(num)
+        payload, mac = data[:PAYLOAD_SIZE], data[PAYLOAD_SIZE:]
+        if not compare_digest(mac, self._mac(payload, node)):
+            raise ValueError('invalid token signature')
+        return EXPIRY.unpack(payload[RANDOM_SIZE:])[0]
+
+    def verify(self, token, now=None):
+        """Return whether ``token`` is authentic and not yet expired"""
+        try:
+            expiry = self.expiry(token)
+        except ValueError:
+            return False
+        if now is None:
+            now = time.time()
+        return now < expiry
@@ -1,19 +1,22 @@
-import uuid
+import binascii
+import os
+import threading
+
+from pyramid.compat import escape
+from pyramid.exceptions import ConfigurationError
 
 from velruse.app.baseconvert import base_encode
 
 
-def redirect_form(end_point, token):
-    """Generate a redirect form for POSTing"""
-    return """
+REDIRECT_TEMPLATE = """
 <html>
 <head>
   <title>OpenID transaction in progress</title>
 </head>
 <body onload="document.forms[0].submit();">
-<form action="%s" method="post" accept-charset="UTF-8"
+<form action="%(endpoint)s" method="post" accept-charset="UTF-8"
  enctype="application/x-www-form-urlencoded">
-<input type="hidden" name="token" value="%s" />
+<input type="hidden" name="token" value="%(token)s" />
 <input type="submit" value="Continue"/></form>
 <script>
 var elements = document.forms[0].elements;
@@ -23,9 +26,120 @@ for (var i = 0; i < elements.length; i++) {
 </script>
 </body>
 </html>
-""" % (end_point, token)
+"""
+
+# stands in for the token while a template is being compiled
+_TOKEN_MARKER = '\x00token\x00'
+
+
+class RedirectForm(object):
+    """A page POSTing a token to an endpoint, compiled once per endpoint
+
+    ``template`` is formatted with ``%(endpoint)s`` and ``%(token)s``
+    placeholders. The escaped endpoint is substituted and the result encoded
+    to bytes when the form is created, so rendering a page only joins the
+    static chunks around the escaped token. A template missing either
+    placeholder raises a :exc:`pyramid.exceptions.ConfigurationError`.
+    """
+
+    def __init__(self, end_point, template=REDIRECT_TEMPLATE):
+        for name in ('endpoint', 'token'):
+            if '%%(%s)s' % name not in template:
+                raise ConfigurationError(
+                    'redirect template has no %%(%s)s placeholder' % name)
+        text = template % {
+            'endpoint': escape(end_point, quote=True),
+            'token': _TOKEN_MARKER,
+        }
+        self.chunks = [c.encode('utf-8') for c in text.split(_TOKEN_MARKER)]
+
+    def render(self, token):
+        """Return the page for ``token`` as bytes"""
+        token = escape(token, quote=True).encode('utf-8')
+        return token.join(self.chunks)
+
+
+def redirect_form(end_point, token):
+    """Generate a redirect form for POSTing"""
+    return RedirectForm(end_point).render(token).decode('utf-8')
+
+
+if hasattr(int, 'from_bytes'):
+    def _bytes_to_int(data):
+        return int.from_bytes(data, 'big')
+else:  # pragma: no cover
+    def _bytes_to_int(data):
+        return int(binascii.hexlify(data), 16)
+
+
+class TokenGenerator(object):
+    """Generate random tokens from a buffer of random bytes
+
+    Reading ``os.urandom`` in large chunks avoids a system call per token.
+    The buffer is discarded when the process forks so that workers never
+    hand out the same tokens.
+    """
+
+    def __init__(self, token_bytes=16, buffer_size=4096):
+        self.token_bytes = token_bytes
+        self.buffer_size = buffer_size - buffer_size % token_bytes
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+            self._check_pid = False
+        else:  # pragma: no cover
+            self._check_pid = True
+
+    def _after_fork(self):
+        # the lock may have been held by a thread which did not survive
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._buffer = b''
+        self._offset = 0
+        self._pid = os.getpid()
+
+    def random_bytes(self, size):
+        """Return ``size`` random bytes"""
+        if size > self.buffer_size:
+            return os.urandom(size)
+        with self._lock:
+            if self._check_pid and self._pid != os.getpid():
+                self._reset()
+            start = self._offset
+            end = self._offset = start + size
+            if end > len(self._buffer):
+                self._buffer = os.urandom(self.buffer_size)
+                start = 0
+                end = self._offset = size
+            return self._buffer[start:end]
+
+    def __call__(self):
+        data = self.random_bytes(self.token_bytes)
+        return base_encode(_bytes_to_int(data))
+
+    def batch(self, count):
+        """Generate ``count`` tokens at once"""
+        size = self.token_bytes
+        data = self.random_bytes(size * count)
+        return [base_encode(_bytes_to_int(data[i:i + size]))
+                for i in range(0, size * count, size)]
+
+_generator = TokenGenerator()
 
 
 def generate_token():
     """Generate a random token"""
-    return base_encode(uuid.uuid4().int)
+    return _generator()
+
+
+def generate_tokens(count):
+    """Generate a list of ``count`` random tokens"""
+    return _generator.batch(count)
+
+
+def random_bytes(size):
+    """Return ``size`` bytes from the shared random buffer"""
+    return _generator.random_bytes(size)
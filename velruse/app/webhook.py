@@ -0,0 +1,144 @@
+"""Pushing results to the application backend
+
+With a ``webhook.url`` setting the standalone app POSTs every result to the
+application as soon as the login finishes, usually well before the browser
+reaches the endpoint with the token. The application can then answer the
+endpoint request without calling ``auth_info``.
+
+The request body is the JSON encoded result, the token is sent in the
+``X-Velruse-Token`` header and ``X-Velruse-Signature`` holds
+``sha256=<hex HMAC of token + "\\n" + body>`` keyed with ``webhook.secret``.
+
+Results are queued in a bounded queue and sent by background threads over
+keep-alive connections, so a slow backend never delays a login. Failed
+pushes are retried with exponential backoff; results which cannot be queued
+or delivered are still available through ``auth_info``.
+
+Example settings:
+
+.. code-block:: ini
+
+    webhook.url = http://127.0.0.1:6543/velruse_results
+    webhook.secret = a-long-random-string
+    webhook.queue_size = 1000
+    webhook.workers = 2
+    webhook.retries = 3
+    webhook.timeout = 5
+"""
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+from pyramid.compat import PY3
+
+if PY3:
+    from queue import Full, Queue
+else:
+    from Queue import Full, Queue
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger(__name__)
+
+
+def sign_result(secret, token, body):
+    """Return the signature sent with a pushed result"""
+    if not isinstance(secret, bytes):
+        secret = secret.encode('utf-8')
+    msg = token.encode('utf-8') + b'\n' + body
+    return 'sha256=' + hmac.new(secret, msg, hashlib.sha256).hexdigest()
+
+
+class WebhookPusher(object):
+    """Send results to ``url`` from a pool of background threads"""
+
+    def __init__(self, url, secret, queue_size=1000, workers=2, retries=3,
+                 timeout=5, backoff=0.5):
+        self.url = url
+        self.secret = secret
+        self.queue_size = int(queue_size)
+        self.workers = int(workers)
+        self.retries = int(retries)
+        self.timeout = float(timeout)
+        self.backoff = float(backoff)
+        self.queue = None
+        self.session = None
+
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_workers(self):
+        """Start the queue, connections and threads of this process.
+
+        Threads do not survive a fork and pooled connections must not be
+        shared with a forked child, so they are created by the first push
+        in each worker process.
+        """
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=self.workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.session = session
+            queue = Queue(maxsize=self.queue_size)
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, args=(queue,),
+                                     name='velruse-webhook-%d' % i)
+                t.daemon = True
+                t.start()
+            self.queue = queue
+            self._started_pid = os.getpid()
+
+    def push(self, token, body):
+        """Queue ``body`` for delivery, return whether it was queued"""
+        self._ensure_workers()
+        try:
+            self.queue.put_nowait((token, body))
+        except Full:
+            log.warn('webhook queue is full, not pushing token "%s"', token)
+            return False
+        return True
+
+    def _work(self, queue):
+        while True:
+            token, body = queue.get()
+            try:
+                self._send(token, body)
+            except Exception:
+                log.exception('unexpected error pushing token "%s"', token)
+
+    def _send(self, token, body):
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Velruse-Token': token,
+            'X-Velruse-Signature': sign_result(self.secret, token, body),
+        }
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                r = self.session.post(self.url, data=body, headers=headers,
+                                      timeout=self.timeout)
+            except requests.RequestException as e:
+                log.info('pushing token "%s" failed: %s', token, e)
+                continue
+            if r.status_code < 500:
+                if r.status_code >= 400:
+                    log.warn('webhook rejected token "%s" with status %s',
+                             token, r.status_code)
+                return True
+            log.info('pushing token "%s" failed with status %s', token,
+                     r.status_code)
+        log.warn('giving up pushing token "%s" after %d attempts', token,
+                 self.retries + 1)
+        return False
@@ -0,0 +1,194 @@
+"""Client for applications using the standalone velruse app
+
+Instead of calling ``auth_info`` by hand, the endpoint of an application
+can retrieve results with a :class:`VelruseClient`:
+
+.. code-block:: python
+
+    from velruse.client import VelruseClient
+
+    velruse = VelruseClient('http://127.0.0.1:8080/velruse')
+
+    def logged_in(request):
+        try:
+            result = velruse.auth_info(request.POST['token'])
+        except KeyError:
+            ...  # unknown or expired token
+        if 'profile' in result:
+            ...  # logged in
+
+The client keeps connections to the velruse app alive, applies a timeout
+to every request and retries connection errors and server errors with
+exponential backoff. :meth:`VelruseClient.auth_info_batch` fetches many
+tokens in a single request. :meth:`VelruseClient.refresh` and
+:meth:`VelruseClient.refresh_batch` exchange refresh tokens for new
+credentials (see :mod:`velruse.app.refresh`). Providers may rotate refresh
+tokens, so these requests are sent only once, with the longer
+``refresh_timeout`` leaving the app time to wait for its rate limit.
+
+When the app issues self-describing tokens (the ``token.secret`` setting,
+see :mod:`velruse.app.tokens`) the client can be given the same secret to
+reject expired or forged tokens locally, without a request.
+"""
+import json
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from velruse.exceptions import RateLimited
+from velruse.exceptions import ServiceUnavailable
+
+
+log = logging.getLogger(__name__)
+
+
+class VelruseClient(object):
+    """Retrieve login results from the velruse app at ``url``"""
+
+    def __init__(self, url, timeout=5, retries=2, backoff=0.1, pool_size=10,
+                 batch_size=100, token_secret=None, refresh_timeout=15):
+        self.url = url.rstrip('/')
+        self.batch_size = int(batch_size)
+        self.timeout = float(timeout)
+        self.refresh_timeout = float(refresh_timeout)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=int(pool_size))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.codec = None
+        if token_secret:
+            from velruse.app.tokens import TokenCodec
+            self.codec = TokenCodec(token_secret)
+
+    def _request(self, method, path, **kw):
+        """Send a request, retrying transient failures.
+
+        Returns the response unless it is a server error. Raises
+        :exc:`velruse.exceptions.ServiceUnavailable` once every attempt
+        failed.
+        """
+        url = self.url + path
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                r = self.session.request(method, url, timeout=self.timeout,
+                                         **kw)
+            except requests.RequestException as e:
+                log.info('velruse request to %s failed: %s', url, e)
+                continue
+            if r.status_code < 500:
+                return r
+            log.info('velruse request to %s failed with status %s', url,
+                     r.status_code)
+        raise ServiceUnavailable(
+            'could not reach velruse at %s after %d attempts'
+            % (url, self.retries + 1))
+
+    def _send_once(self, method, path, **kw):
+        """Send a request which must not be repeated.
+
+        Returns the response whatever its status. Raises
+        :exc:`velruse.exceptions.ServiceUnavailable` if it failed.
+        """
+        url = self.url + path
+        try:
+            return self.session.request(method, url,
+                                        timeout=self.refresh_timeout, **kw)
+        except requests.RequestException as e:
+            raise ServiceUnavailable(
+                'velruse request to %s failed: %s' % (url, e))
+
+    def _valid(self, token):
+        return self.codec is None or self.codec.verify(token)
+
+    def auth_info(self, token):
+        """Return the result stored for ``token``.
+
+        Raises :exc:`KeyError` if the token is unknown or expired.
+        """
+        if not self._valid(token):
+            raise KeyError(token)
+        r = self._request('GET', '/auth_info',
+                          params={'format': 'json', 'token': token})
+        if r.status_code != 200:
+            raise KeyError(token)
+        return json.loads(r.content.decode('utf-8'))
+
+    def auth_info_batch(self, tokens):
+        """Return a dict mapping each known token to its result.
+
+        Unknown and expired tokens are left out. Tokens are sent in
+        requests of at most ``batch_size`` tokens, which must not exceed the
+        ``auth_info.batch_limit`` setting of the app.
+        """
+        tokens = [t for t in tokens if self._valid(t)]
+        results = {}
+        for i in range(0, len(tokens), self.batch_size):
+            chunk = tokens[i:i + self.batch_size]
+            r = self._request('POST', '/auth_info_batch',
+                              data={'format': 'json', 'token': chunk})
+            if r.status_code != 200:
+                raise ServiceUnavailable(
+                    'velruse rejected the batch with status %s'
+                    % r.status_code)
+            results.update(json.loads(r.content.decode('utf-8')))
+        return results
+
+    def refresh(self, provider, refresh_token, tenant=None):
+        """Return new credentials for ``refresh_token``.
+
+        Raises :exc:`ValueError` with the reason if it cannot be refreshed,
+        :exc:`velruse.exceptions.RateLimited` if the app is over its rate
+        limit for the provider and
+        :exc:`velruse.exceptions.ServiceUnavailable` if velruse does not
+        answer with a reason.
+        """
+        data = {'format': 'json', 'provider': provider,
+                'refresh_token': refresh_token}
+        if tenant:
+            data['tenant'] = tenant
+        r = self._send_once('POST', '/refresh', data=data)
+        if r.status_code != 200:
+            try:
+                error = json.loads(r.content.decode('utf-8')).get('error')
+            except (ValueError, AttributeError):
+                # not an answer of the refresh view, e.g. a proxy's page
+                error = None
+            if r.status_code == 503 and error == 'rate limited':
+                raise RateLimited(error)
+            if not error or r.status_code >= 500:
+                raise ServiceUnavailable(
+                    'velruse rejected the refresh with status %s'
+                    % r.status_code)
+            raise ValueError(error)
+        return json.loads(r.content.decode('utf-8'))['credentials']
+
+    def refresh_batch(self, items):
+        """Refresh many tokens, returning a result for each item.
+
+        ``items`` are dicts with ``provider``, ``refresh_token`` and
+        optionally ``tenant`` keys. Each result is either
+        ``{'credentials': ...}`` or ``{'error': ...}``.
+        """
+        items = list(items)
+        results = []
+        for i in range(0, len(items), self.batch_size):
+            chunk = items[i:i + self.batch_size]
+            r = self._send_once('POST', '/refresh_batch',
+                                params={'format': 'json'},
+                                data=json.dumps(chunk),
+                                headers={'Content-Type': 'application/json'})
+            if r.status_code != 200:
+                raise ServiceUnavailable(
+                    'velruse rejected the batch with status %s'
+                    % r.status_code)
+            results.extend(json.loads(r.content.decode('utf-8')))
+        return results
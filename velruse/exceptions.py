@@ -17,3 +17,11 @@ class ThirdPartyFailure(VelruseException):
 
 class CSRFError(VelruseException):
     """Raised when CSRF validation fails"""
+
+
+class ServiceUnavailable(VelruseException):
+    """Raised when the velruse app could not be reached"""
+
+
+class RateLimited(ServiceUnavailable):
+    """Raised when the velruse app refused a refresh over its rate limit"""
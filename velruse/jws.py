@@ -0,0 +1,101 @@
+"""Verifying signed JSON Web Tokens
+
+Just enough of JWS to check the ``id_token`` of an OpenID Connect login
+locally: compact serialization, ``RS256`` with a public key from the
+provider's JWKS and ``HS256`` with the client secret. RSA signatures are
+checked with plain integer arithmetic, so no crypto library is needed.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+
+from velruse.utils import compare_digest
+
+
+# DER encoded DigestInfo prefix of a SHA-256 hash (RFC 3447, 9.2)
+SHA256_DIGEST_INFO = binascii.unhexlify(
+    '3031300d060960864801650304020105000420')
+
+
+class InvalidToken(ValueError):
+    """Raised when a token is malformed or its signature does not match"""
+
+
+def b64url_decode(data):
+    if not isinstance(data, bytes):
+        data = data.encode('ascii')
+    data += b'=' * (-len(data) % 4)
+    try:
+        return base64.urlsafe_b64decode(data)
+    except (TypeError, binascii.Error):
+        raise InvalidToken('invalid base64 encoding')
+
+
+def b64url_int(data):
+    return int(binascii.hexlify(b64url_decode(data)), 16)
+
+
+def rsa_verify(message, signature, n, e):
+    """Check a RSASSA-PKCS1-v1_5 SHA-256 ``signature`` of ``message``"""
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        return False
+    num = int(binascii.hexlify(signature), 16)
+    if num >= n:
+        return False
+    encoded = binascii.unhexlify('%0*x' % (size * 2, pow(num, e, n)))
+    digest = SHA256_DIGEST_INFO + hashlib.sha256(message).digest()
+    padding = size - len(digest) - 3
+    if padding < 8:
+        return False
+    expected = b'\x00\x01' + b'\xff' * padding + b'\x00' + digest
+    return compare_digest(encoded, expected)
+
+
+def decode(token):
+    """Split ``token`` into its header, claims, signed part and signature.
+
+    Nothing is verified.
+    """
+    if not isinstance(token, bytes):
+        token = token.encode('ascii')
+    parts = token.split(b'.')
+    if len(parts) != 3:
+        raise InvalidToken('not a signed token')
+    try:
+        header = json.loads(b64url_decode(parts[0]).decode('utf-8'))
+        claims = json.loads(b64url_decode(parts[1]).decode('utf-8'))
+    except ValueError:
+        raise InvalidToken('invalid token encoding')
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise InvalidToken('invalid token encoding')
+    return header, claims, parts[0] + b'.' + parts[1], b64url_decode(parts[2])
+
+
+def verify(token, get_key, secret=None):
+    """Return the claims of ``token`` after checking its signature.
+
+    ``get_key(kid)`` returns the JWK of an ``RS256`` token's key or
+    ``None``; ``HS256`` tokens are checked with ``secret``. Any other
+    algorithm is rejected.
+    """
+    header, claims, message, signature = decode(token)
+    alg = header.get('alg')
+    if alg == 'RS256':
+        key = get_key(header.get('kid'))
+        if key is None:
+            raise InvalidToken('unknown signing key "%s"' % header.get('kid'))
+        if key.get('kty') != 'RSA':
+            raise InvalidToken('signing key is not a RSA key')
+        valid = rsa_verify(message, signature,
+                           b64url_int(key['n']), b64url_int(key['e']))
+    elif alg == 'HS256' and secret:
+        mac = hmac.new(secret.encode('utf-8'), message, hashlib.sha256)
+        valid = compare_digest(mac.digest(), signature)
+    else:
+        raise InvalidToken('unsupported signing algorithm "%s"' % alg)
+    if not valid:
+        raise InvalidToken('invalid token signature')
+    return claims
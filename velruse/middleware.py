@@ -0,0 +1,124 @@
+"""Velruse as WSGI middleware
+
+:class:`VelruseMiddleware` wraps an application and serves the login and
+callback routes of the configured providers itself. Once a login finished
+the wrapped application is called in the same request at the ``endpoint``
+path, with the :class:`velruse.AuthenticationComplete` or
+:class:`velruse.AuthenticationDenied` context in
+``environ['velruse.context']``. There is no redirect form, no store write
+and no ``auth_info`` request.
+
+Requests to any other path go straight to the wrapped application without
+building a Pyramid request.
+
+Example INI file:
+
+.. code-block:: ini
+
+    [pipeline:main]
+    pipeline =
+        velruse
+        YOURAPP
+
+    [filter:velruse]
+    use = egg:velruse
+
+    endpoint = /logged_in
+    session.secret = a-long-random-string
+
+    provider.facebook.consumer_key = KMfXjzsA2qVUcnnRn3vpnwWZ2pwPRFZdb
+    provider.facebook.consumer_secret =
+        ULZ6PkJbsqw2GxZWCIbOEBZdkrb9XwgXNjRy
+
+The wrapped application then reads the result from the environ:
+
+.. code-block:: python
+
+    def logged_in(environ, start_response):
+        context = environ['velruse.context']
+        if isinstance(context, AuthenticationComplete):
+            ...
+"""
+from pyramid.config import Configurator
+from pyramid.exceptions import ConfigurationError
+from pyramid.interfaces import IRoutesMapper
+from pyramid.request import Request
+
+from velruse.app import default_session_setup
+from velruse.app import include_providers
+
+
+ENVIRON_KEY = 'velruse.context'
+
+# keys set by the velruse router which must not leak into the wrapped app
+_ROUTER_KEYS = (
+    'bfg.routes.route',
+    'bfg.routes.matchdict',
+    'webob._parsed_query_vars',
+)
+
+
+def forward_view(context, request):
+    """Call the wrapped application at the endpoint with ``context``"""
+    environ = dict(request.environ)
+    for key in _ROUTER_KEYS:
+        environ.pop(key, None)
+    environ[ENVIRON_KEY] = context
+    environ['PATH_INFO'] = request.registry.settings['endpoint']
+    environ['QUERY_STRING'] = ''
+    return Request(environ).get_response(request.registry.velruse_app)
+
+
+def includeme(config):
+    """Add the providers and the views forwarding their results.
+
+    ``config.registry.velruse_app`` must be set to the wrapped application.
+    """
+    settings = config.registry.settings
+
+    if not settings.get('endpoint'):
+        raise ConfigurationError(
+            'missing required setting "endpoint"')
+
+    # setup the session used by the providers
+    setup = settings.get('setup') or default_session_setup
+    config.include(setup)
+
+    include_providers(config)
+
+    config.add_view(
+        forward_view,
+        context='velruse.AuthenticationComplete')
+    config.add_view(
+        forward_view,
+        context='velruse.AuthenticationDenied')
+
+
+class VelruseMiddleware(object):
+    """Serve the provider routes in front of ``app``
+
+    ``settings`` are the same as for the standalone app, except that
+    ``endpoint`` is a path within ``app`` and there are no store, delivery
+    or token settings.
+    """
+
+    def __init__(self, app, **settings):
+        self.app = app
+        config = Configurator(settings=settings)
+        config.registry.velruse_app = app
+        config.include(includeme)
+        self.velruse = config.make_wsgi_app()
+        mapper = self.velruse.registry.getUtility(IRoutesMapper)
+        self.routes = mapper.get_routes()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO') or '/'
+        for route in self.routes:
+            if route.match(path) is not None:
+                return self.velruse(environ, start_response)
+        return self.app(environ, start_response)
+
+
+def make_velruse_middleware(app, global_conf, **settings):
+    """Wrap ``app`` in a :class:`VelruseMiddleware` from a Paste filter"""
+    return VelruseMiddleware(app, **settings)
@@ -0,0 +1,274 @@
+"""Common provider plumbing and OAuth2 login flow
+
+:class:`Provider` holds what every provider calling the provider's API
+shares. :class:`OAuth2Provider` implements the authorization code flow
+shared by the OAuth2 providers. A provider declares its endpoints and how
+the token response is encoded, and implements
+:meth:`OAuth2Provider.fetch_profile` to turn the access token into a
+normalized profile.
+
+All providers send their HTTP requests through one keep-alive connection
+pool per process with a timeout, and record the latency of every request
+in :data:`stats`.
+"""
+from json import loads
+import logging
+import os
+import threading
+import time
+import uuid
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import parse_qs
+else:  # pragma: no cover
+    from urlparse import parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pyramid.httpexceptions import HTTPFound
+
+from velruse.api import (
+    AuthenticationComplete,
+    AuthenticationDenied,
+)
+from velruse.exceptions import CSRFError
+from velruse.exceptions import ThirdPartyFailure
+from velruse.utils import URLTemplate
+from velruse.utils import cached_route_url
+
+
+log = logging.getLogger(__name__)
+
+POOL_SIZE = 20
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Return the requests session shared by the providers.
+
+    Pooled connections must not be shared with a forked child, so every
+    process creates its own session.
+    """
+    global _session, _session_pid
+    if _session_pid != os.getpid():
+        with _session_lock:
+            if _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE,
+                                      pool_maxsize=POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+                _session_pid = os.getpid()
+    return _session
+
+
+class ProviderStats(object):
+    """Per-provider request latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.providers = {}
+
+    def record(self, name, elapsed, failed=False):
+        with self._lock:
+            counters = self.providers.get(name)
+            if counters is None:
+                counters = self.providers[name] = [0, 0, 0.0, 0.0]
+            counters[0] += 1
+            if failed:
+                counters[1] += 1
+            counters[2] += elapsed
+            if elapsed > counters[3]:
+                counters[3] = elapsed
+
+    def snapshot(self):
+        """Return the counters as a dictionary of plain values.
+
+        Latencies are reported in milliseconds.
+        """
+        with self._lock:
+            result = {}
+            for name, (count, failed, total, worst) in \
+                    self.providers.items():
+                result[name] = {
+                    'requests': count,
+                    'failed': failed,
+                    'avg_ms': total / count * 1000 if count else 0.0,
+                    'max_ms': worst * 1000,
+                }
+            return result
+
+stats = ProviderStats()
+
+
+class Provider(object):
+    """Base class of the providers calling the provider's API"""
+
+    #: timeout in seconds of every request to the provider
+    timeout = 10
+
+    def __init__(self, name):
+        self.name = name
+        self.login_route = 'velruse.%s-login' % name
+        self.callback_route = 'velruse.%s-callback' % name
+
+    def http(self, method, url, **kw):
+        """Send a request to the provider and return the decoded body.
+
+        Raises :exc:`velruse.exceptions.ThirdPartyFailure` when the request
+        fails or the provider does not answer with a 200.
+        """
+        kw.setdefault('timeout', self.timeout)
+        start = time.time()
+        try:
+            r = http_session().request(method, url, **kw)
+        except requests.RequestException as e:
+            stats.record(self.name, time.time() - start, failed=True)
+            raise ThirdPartyFailure('Request to %s failed: %s' % (
+                url.split('?', 1)[0], e))
+        elapsed = time.time() - start
+        content = r.content.decode('UTF-8')
+        stats.record(self.name, elapsed, failed=r.status_code != 200)
+        log.debug('%s %s %s took %.1f ms', self.name, method,
+                  url.split('?', 1)[0], elapsed * 1000)
+        if r.status_code != 200:
+            raise ThirdPartyFailure("Status %s: %s" % (
+                r.status_code, content))
+        return content
+
+    def get_json(self, url, **kw):
+        return loads(self.http('GET', url, **kw))
+
+
+class OAuth2Provider(Provider):
+    """Base class of the OAuth2 providers"""
+
+    #: URL the user is sent to for authorizing the login
+    authorize_endpoint = None
+    #: extra static parameters of the authorize URL
+    authorize_params = {}
+    #: URL exchanging the code for an access token
+    token_endpoint = None
+    #: extra static parameters of the token request
+    token_params = {}
+    #: ``GET`` or ``POST`` (form encoded) token requests
+    token_method = 'GET'
+    #: encoding of the token response, ``json`` or ``query``
+    token_format = 'json'
+    #: scope requested when none is configured
+    default_scope = None
+    #: whether to protect the callback with a ``state`` parameter
+    use_state = False
+    #: callback parameter holding the reason of a denied login
+    denied_param = 'error'
+    #: context returned for completed logins
+    complete_class = AuthenticationComplete
+    #: whether the provider issues refresh tokens, see :meth:`refresh`
+    refresh_supported = False
+
+    def __init__(self, name, consumer_key, consumer_secret, scope=None):
+        Provider.__init__(self, name)
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.scope = scope
+
+        self.authorize_url = URLTemplate(
+            self.authorize_endpoint,
+            client_id=consumer_key,
+            **self.authorize_params)
+        self.token_form = dict(
+            self.token_params,
+            client_id=consumer_key,
+            client_secret=consumer_secret)
+        self.access_token_url = URLTemplate(
+            self.token_endpoint, **self.token_form)
+
+    def login(self, request):
+        """Redirect to the provider to authorize the login"""
+        params = {
+            'redirect_uri': cached_route_url(request, self.callback_route),
+        }
+        scope = request.POST.get('scope', self.scope or self.default_scope)
+        if scope:
+            params['scope'] = scope
+        if self.use_state:
+            request.session['state'] = params['state'] = uuid.uuid4().hex
+        return HTTPFound(location=self.authorize_url(**params))
+
+    def callback(self, request):
+        """Process the redirect back from the provider"""
+        if self.use_state:
+            self.check_state(request)
+        code = request.GET.get('code')
+        if not code:
+            reason = request.GET.get(self.denied_param,
+                                     'No reason provided.')
+            return AuthenticationDenied(reason)
+
+        token = self.fetch_token(request, code)
+        access_token = token['access_token']
+        profile = self.fetch_profile(access_token, token)
+        return self.complete_class(
+            profile=profile,
+            credentials=self.credentials(access_token, token))
+
+    def check_state(self, request):
+        if request.GET.get('state') != request.session.get('state'):
+            raise CSRFError(
+                'CSRF Validation check failed. Request state %s is not '
+                'the same as session state %s' % (
+                    request.GET.get('state'), request.session.get('state')))
+
+    def fetch_token(self, request, code):
+        """Exchange ``code`` for the decoded token response"""
+        redirect_uri = cached_route_url(request, self.callback_route)
+        if self.token_method == 'POST':
+            data = dict(self.token_form, redirect_uri=redirect_uri,
+                        code=code)
+            content = self.http('POST', self.token_endpoint, data=data)
+        else:
+            content = self.http('GET', self.access_token_url(
+                redirect_uri=redirect_uri, code=code))
+        return self.decode_token(content)
+
+    def decode_token(self, content):
+        if self.token_format == 'query':
+            return dict((k, v[0]) for k, v in parse_qs(content).items())
+        return loads(content)
+
+    def refresh(self, refresh_token):
+        """Exchange ``refresh_token`` for new credentials.
+
+        The credentials keep ``refresh_token`` unless the provider issued a
+        new one.
+        """
+        data = dict(self.token_form, grant_type='refresh_token',
+                    refresh_token=refresh_token)
+        token = self.decode_token(
+            self.http('POST', self.token_endpoint, data=data))
+        if 'access_token' not in token:
+            raise ThirdPartyFailure('No access token returned')
+        cred = self.credentials(token['access_token'], token)
+        cred.setdefault('oauthRefreshToken', refresh_token)
+        return cred
+
+    def fetch_profile(self, access_token, token):
+        """Return the normalized profile of the user"""
+        raise NotImplementedError
+
+    def credentials(self, access_token, token):
+        cred = {'oauthAccessToken': access_token}
+        if 'refresh_token' in token:
+            cred['oauthRefreshToken'] = token['refresh_token']
+        return cred
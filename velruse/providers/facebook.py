@@ -1,29 +1,17 @@
 """Facebook Authentication Views"""
-from pyramid.compat import PY3
-
 import datetime
-import uuid
-from json import loads
-
-if PY3:
-    from urllib.parse import parse_qs
-else:  # pragma: no cover
-    from urlparse import parse_qs
-
-import requests
 
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
-    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
-from velruse.exceptions import CSRFError
-from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
 from velruse.settings import ProviderSettings
-from velruse.utils import flat_url
+from velruse.utils import URLTemplate
 
 
 class FacebookAuthenticationComplete(AuthenticationComplete):
@@ -60,78 +48,30 @@ def add_facebook_login(config,
     provider = FacebookProvider(name, consumer_key, consumer_secret, scope)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class FacebookProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a facebook login"""
-        scope = request.POST.get('scope', self.scope)
-        request.session['state'] = state = uuid.uuid4().hex
-        fb_url = flat_url(
-            'https://www.facebook.com/dialog/oauth/',
-            scope=scope,
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route),
-            state=state)
-        return HTTPFound(location=fb_url)
-
-    def callback(self, request):
-        """Process the facebook redirect"""
-        if request.GET.get('state') != request.session.get('state'):
-            raise CSRFError(
-                'CSRF Validation check failed. Request state %s is not '
-                'the same as session state %s' % (
-                    request.GET.get('state'), request.session.get('state')))
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error_reason', 'No reason provided.')
-            return AuthenticationDenied(reason)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            'https://graph.facebook.com/oauth/access_token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-        r = requests.get(access_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        access_token = parse_qs(content)['access_token'][0]
-
-        # Retrieve profile data
-        graph_url = flat_url('https://graph.facebook.com/me',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        fb_profile = loads(content)
-        profile = extract_fb_data(fb_profile)
-
-        cred = {'oauthAccessToken': access_token}
-        return FacebookAuthenticationComplete(profile=profile,
-                                              credentials=cred)
+class FacebookProvider(OAuth2Provider):
+    authorize_endpoint = 'https://www.facebook.com/dialog/oauth/'
+    token_endpoint = 'https://graph.facebook.com/oauth/access_token'
+    token_format = 'query'
+    use_state = True
+    denied_param = 'error_reason'
+    complete_class = FacebookAuthenticationComplete
+
+    profile_url = URLTemplate('https://graph.facebook.com/me')
+
+    def fetch_profile(self, access_token, token):
+        return extract_fb_data(
+            self.get_json(self.profile_url(access_token=access_token)))
 
 
 def extract_fb_data(data):
@@ -187,7 +127,7 @@ def extract_fb_data(data):
     profile['name'] = name
 
     # Now strip out empty values
-    for k, v in profile.items():
+    for k, v in list(profile.items()):
         if not v or (isinstance(v, list) and not v[0]):
             del profile[k]
 
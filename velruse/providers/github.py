@@ -3,28 +3,17 @@
 http://develop.github.com/p/oauth.html
 https://github.com/account/applications
 """
-from pyramid.compat import PY3
-
-if PY3:
-    from urllib.parse import parse_qs
-else:
-    from urlparse import parse_qs
-
-from json import loads
-
-import requests
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
-    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
-from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
 from velruse.settings import ProviderSettings
-from velruse.utils import flat_url
+from velruse.utils import URLTemplate
 
 
 class GithubAuthenticationComplete(AuthenticationComplete):
@@ -61,66 +50,28 @@ def add_github_login(config,
     provider = GithubProvider(name, consumer_key, consumer_secret, scope)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class GithubProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a github login"""
-        scope = request.POST.get('scope', self.scope)
-        gh_url = flat_url(
-            'https://github.com/login/oauth/authorize',
-            scope=scope,
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route))
-        return HTTPFound(location=gh_url)
-
-    def callback(self, request):
-        """Process the github redirect"""
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            'https://github.com/login/oauth/access_token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-        r = requests.get(access_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        access_token = parse_qs(content)['access_token'][0]
-
-        # Retrieve profile data
-        graph_url = flat_url('https://github.com/api/v2/json/user/show',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        data = loads(content)['user']
+class GithubProvider(OAuth2Provider):
+    authorize_endpoint = 'https://github.com/login/oauth/authorize'
+    token_endpoint = 'https://github.com/login/oauth/access_token'
+    token_format = 'query'
+    complete_class = GithubAuthenticationComplete
+
+    profile_url = URLTemplate('https://github.com/api/v2/json/user/show')
+
+    def fetch_profile(self, access_token, token):
+        data = self.get_json(
+            self.profile_url(access_token=access_token))['user']
 
         profile = {}
         profile['accounts'] = [{
@@ -135,7 +86,4 @@ class GithubProvider(object):
         # addresses without verifying them
         if 'email' in data:
             profile['emails'] = [{'value':data['email']}]
-
-        cred = {'oauthAccessToken': access_token}
-        return GithubAuthenticationComplete(profile=profile,
-                                            credentials=cred)
+        return profile
@@ -1,19 +1,19 @@
 """Last.fm Authentication Views"""
-from hashlib import md5
-from json import loads
-
-import requests
-
 from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
     AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
 from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import Provider
 from velruse.settings import ProviderSettings
+from velruse.utils import MD5Signer
+from velruse.utils import URLTemplate
 from velruse.utils import flat_url
 
 API_BASE = 'https://ws.audioscrobbler.com/2.0/'
@@ -51,30 +51,38 @@ def add_lastfm_login(config,
     provider = LastfmProvider(name, consumer_key, consumer_secret)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class LastfmProvider(object):
+class LastfmProvider(Provider):
     def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
+        Provider.__init__(self, name)
         self.consumer_key = consumer_key
         self.consumer_secret = consumer_secret
 
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
+        self.login_url = flat_url('https://www.last.fm/api/auth/',
+                                  api_key=consumer_key)
+        session_params = {'method': 'auth.getSession',
+                          'api_key': consumer_key}
+        self.session_url = URLTemplate(API_BASE, format='json',
+                                       **session_params)
+        self.sign_session = MD5Signer(suffix=consumer_secret,
+                                      **session_params)
+        self.user_url = URLTemplate(API_BASE, format='json',
+                                    method='user.getInfo',
+                                    api_key=consumer_key)
 
     def login(self, request):
         """Initiate a LastFM login"""
-        fb_url = flat_url('https://www.last.fm/api/auth/',
-                          api_key=self.consumer_key)
-        return HTTPFound(location=fb_url)
+        return HTTPFound(location=self.login_url)
 
     def callback(self, request):
         """Process the LastFM redirect"""
@@ -87,32 +95,14 @@ class LastfmProvider(object):
             return AuthenticationDenied(reason)
 
         # Now establish a session with the token
-        params = {
-            'method': 'auth.getSession',
-            'api_key': self.consumer_key,
-            'token': token
-        }
-        signed_params = sign_call(params, self.consumer_secret)
-        session_url = flat_url(API_BASE, format='json', **signed_params)
-        r = requests.get(session_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = loads(r.content)
-
-        session = data['session']
+        session = self.get_json(self.session_url(
+            token=token, api_sig=self.sign_session(token=token)))['session']
         cred = {
             'sessionKey': session['key']
         }
 
         # Fetch the user data
-        user_url = flat_url(API_BASE, format='json', method='user.getInfo',
-                            user=session['name'], api_key=self.consumer_key)
-        r = requests.get(user_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = loads(r.content)['user']
+        data = self.get_json(self.user_url(user=session['name']))['user']
         profile = {
             'displayName': data['name'],
             'gender': 'male' if data['gender'] == 'm' else 'female',
@@ -144,8 +134,6 @@ class LastfmProvider(object):
 
 
 def sign_call(params, secret):
-    pairs = ['%s%s' % (k, params[k]) for k in sorted(params)]
-    api_sig = md5(''.join(pairs) + secret).hexdigest()
     signed_params = params.copy()
-    signed_params['api_sig'] = api_sig
+    signed_params['api_sig'] = MD5Signer(suffix=secret)(**params)
     return signed_params
@@ -1,20 +1,18 @@
 """Live Authentication Views"""
 import datetime
-from json import loads
 
-import requests
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
-    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
 from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
 from velruse.settings import ProviderSettings
-from velruse.utils import flat_url
+from velruse.utils import URLTemplate
 
 
 class LiveAuthenticationComplete(AuthenticationComplete):
@@ -51,76 +49,39 @@ def add_live_login(config,
     provider = LiveProvider(name, consumer_key, consumer_secret, scope)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class LiveProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
+class LiveProvider(OAuth2Provider):
+    authorize_endpoint = 'https://oauth.live.com/authorize'
+    authorize_params = {'response_type': 'code'}
+    token_endpoint = 'https://oauth.live.com/token'
+    token_params = {'grant_type': 'authorization_code'}
+    default_scope = 'wl.basic wl.emails wl.signin'
+    denied_param = 'error_reason'
+    complete_class = LiveAuthenticationComplete
+    refresh_supported = True
 
-    def login(self, request):
-        """Initiate a Live login"""
-        scope = request.POST.get('scope', self.scope or
-                                 'wl.basic wl.emails wl.signin')
-        fb_url = flat_url('https://oauth.live.com/authorize', scope=scope,
-                          client_id=self.consumer_key,
-                          redirect_uri=request.route_url(self.callback_route),
-                          response_type="code")
-        return HTTPFound(location=fb_url)
+    profile_url = URLTemplate('https://apis.live.net/v5.0/me')
 
     def callback(self, request):
         """Process the Live redirect"""
         if 'error' in request.GET:
             raise ThirdPartyFailure(request.GET.get('error_description',
                                     'No reason provided.'))
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error_reason', 'No reason provided.')
-            return AuthenticationDenied(reason)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            'https://oauth.live.com/token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-            grant_type="authorization_code",
-            code=code)
-        r = requests.get(access_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = loads(r.content)
-        access_token = data['access_token']
-
-        # Retrieve profile data
-        graph_url = flat_url('https://apis.live.net/v5.0/me',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        live_profile = loads(r.content)
-        profile = extract_live_data(live_profile)
-
-        cred = {'oauthAccessToken': access_token}
-        if 'refresh_token' in data:
-            cred['oauthRefreshToken'] = data['refresh_token']
-        return LiveAuthenticationComplete(profile=profile,
-                                          credentials=cred)
+        return OAuth2Provider.callback(self, request)
+
+    def fetch_profile(self, access_token, token):
+        return extract_live_data(
+            self.get_json(self.profile_url(access_token=access_token)))
 
 
 def extract_live_data(data):
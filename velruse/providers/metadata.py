@@ -0,0 +1,153 @@
+"""Cached provider metadata
+
+OpenID Connect providers need the issuer's discovery document and signing
+keys (JWKS). :class:`MetadataCache` fetches each document once and keeps
+it for ``ttl`` seconds:
+
+- documents are kept in the process and, when the app has a velruse
+  store, in the store so other workers and nodes reuse them instead of
+  fetching them again;
+- a document used during the last ``refresh_ahead`` seconds of its life
+  is refreshed by a background thread while the cached one is served, so
+  logins do not wait for the provider;
+- :meth:`MetadataCache.refetch` fetches a document again before it
+  expires, e.g. for a token signed with an unknown key, but at most once
+  every ``min_refetch`` seconds per URL.
+
+The standalone app shares one cache between its providers, configured
+with the ``metadata.ttl``, ``metadata.refresh_ahead`` and
+``metadata.min_refetch`` settings.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class MetadataCache(object):
+    """Documents by URL, kept for ``ttl`` seconds"""
+
+    def __init__(self, store=None, ttl=3600, refresh_ahead=300,
+                 min_refetch=60, key_prefix='velruse.metadata.'):
+        self.store = store
+        self.ttl = float(ttl)
+        self.refresh_ahead = float(refresh_ahead)
+        self.min_refetch = float(min_refetch)
+        self.key_prefix = key_prefix
+        self.entries = {}
+        self.last_fetch = {}
+        self.refreshing = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _key(self, url):
+        return self.key_prefix + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _check_pid(self):
+        # refresh threads do not survive a fork
+        if self._pid != os.getpid():
+            with self._lock:
+                self.refreshing = {}
+                self._pid = os.getpid()
+
+    def get(self, url, fetch):
+        """Return the document at ``url``, calling ``fetch(url)`` if needed"""
+        self._check_pid()
+        now = time.time()
+        entry = self.entries.get(url)
+        if entry is None or entry[1] + self.ttl <= now:
+            entry = self._load(url)
+            if entry is None or entry[1] + self.ttl <= now:
+                return self._fetch(url, fetch)
+            self.entries[url] = entry
+        if entry[1] + self.ttl - self.refresh_ahead <= now:
+            self._refresh_later(url, fetch)
+        return entry[0]
+
+    def refetch(self, url, fetch):
+        """Fetch ``url`` again unless it was fetched ``min_refetch`` ago"""
+        self._check_pid()
+        if self.last_fetch.get(url, 0) + self.min_refetch > time.time():
+            entry = self.entries.get(url)
+            if entry is not None:
+                return entry[0]
+        return self._fetch(url, fetch)
+
+    def clear(self):
+        self.entries.clear()
+        self.last_fetch.clear()
+
+    def _fetch(self, url, fetch):
+        self.last_fetch[url] = time.time()
+        document = fetch(url)
+        entry = (document, time.time())
+        self.entries[url] = entry
+        self._save(url, entry)
+        return document
+
+    def _refresh_later(self, url, fetch):
+        with self._lock:
+            if url in self.refreshing:
+                return
+            thread = threading.Thread(target=self._refresh,
+                                      args=(url, fetch))
+            thread.daemon = True
+            self.refreshing[url] = thread
+        thread.start()
+
+    def _refresh(self, url, fetch):
+        try:
+            # another worker may have refreshed it already
+            entry = self._load(url)
+            if entry is not None and \
+                    entry[1] + self.ttl - self.refresh_ahead > time.time():
+                self.entries[url] = entry
+            else:
+                self._fetch(url, fetch)
+        except Exception:
+            log.exception('could not refresh metadata from %s', url)
+        finally:
+            with self._lock:
+                self.refreshing.pop(url, None)
+
+    def _load(self, url):
+        if self.store is None:
+            return None
+        try:
+            value = self.store.retrieve(self._key(url))
+        except KeyError:
+            return None
+        except Exception:
+            log.exception('could not load metadata of %s from the store', url)
+            return None
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        value = json.loads(value)
+        return value['document'], value['fetched']
+
+    def _save(self, url, entry):
+        if self.store is None:
+            return
+        value = json.dumps({'document': entry[0], 'fetched': entry[1]})
+        try:
+            self.store.store(self._key(url), value, expires=self.ttl)
+        except Exception:
+            log.exception('could not save metadata of %s to the store', url)
+
+
+def metadata_cache(registry):
+    """Return the metadata cache shared by the providers of ``registry``"""
+    cache = getattr(registry, 'velruse_metadata', None)
+    if cache is None:
+        settings = registry.settings or {}
+        cache = registry.velruse_metadata = MetadataCache(
+            store=getattr(registry, 'velruse_store', None),
+            ttl=settings.get('metadata.ttl', 3600),
+            refresh_ahead=settings.get('metadata.refresh_ahead', 300),
+            min_refetch=settings.get('metadata.min_refetch', 60))
+    return cache
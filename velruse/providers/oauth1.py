@@ -0,0 +1,135 @@
+"""Common OAuth1 login flow
+
+:class:`OAuth1Provider` implements the three-legged OAuth 1.0a flow shared
+by the OAuth1 providers: fetching a request token, sending the user to the
+provider and exchanging the verified request token for an access token. A
+provider declares its endpoints and implements
+:meth:`OAuth1Provider.fetch_profile` to turn the access token into a
+normalized profile.
+
+The consumer and signature method are built once per provider, the request
+token is kept in the session as a ``[key, secret]`` pair and every signed
+request goes through the connection pool and latency counters of
+:mod:`velruse.providers.base`.
+"""
+from json import loads
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import parse_qs
+else:  # pragma: no cover
+    from urlparse import parse_qs
+
+import oauth2 as oauth
+
+from pyramid.httpexceptions import HTTPFound
+
+from velruse.api import (
+    AuthenticationComplete,
+    AuthenticationDenied,
+)
+from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import Provider
+from velruse.utils import URLTemplate
+from velruse.utils import cached_route_url
+
+
+def parse_token(content):
+    """Decode a form encoded token response"""
+    return dict((k, v[0]) for k, v in parse_qs(content).items())
+
+
+class OAuth1Provider(Provider):
+    """Base class of the OAuth1 providers"""
+
+    #: URL returning a request token
+    request_token_endpoint = None
+    #: URL the user is sent to for authorizing the request token
+    authorize_endpoint = None
+    #: URL exchanging the authorized request token for an access token
+    access_token_endpoint = None
+    #: HTTP method of the access token request
+    access_token_method = 'POST'
+    #: send the callback URL with the user instead of the request token
+    callback_in_authorize = False
+    #: whether the provider returns an ``oauth_verifier`` (OAuth 1.0a)
+    use_verifier = True
+    #: context returned for completed logins
+    complete_class = AuthenticationComplete
+
+    def __init__(self, name, consumer_key, consumer_secret):
+        Provider.__init__(self, name)
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+
+        self.consumer = oauth.Consumer(consumer_key, consumer_secret)
+        self.signature_method = oauth.SignatureMethod_HMAC_SHA1()
+        self.authorize_url = URLTemplate(self.authorize_endpoint)
+
+    def signed(self, method, url, token=None, params=None):
+        """Send a request signed for ``token`` and return the body"""
+        oauth_request = oauth.Request.from_consumer_and_token(
+            self.consumer, token=token, http_method=method, http_url=url,
+            parameters=params, is_form_encoded=method == 'POST')
+        oauth_request.sign_request(self.signature_method, self.consumer,
+                                   token)
+        return self.http(method, url, headers=oauth_request.to_header())
+
+    def login(self, request):
+        """Fetch a request token and redirect to the provider"""
+        callback_url = cached_route_url(request, self.callback_route)
+        params = None
+        if not self.callback_in_authorize:
+            params = {'oauth_callback': callback_url}
+        token = parse_token(self.signed(
+            'GET', self.request_token_endpoint, params=params))
+        try:
+            key = token['oauth_token']
+            secret = token['oauth_token_secret']
+        except KeyError:
+            raise ThirdPartyFailure('No request token returned')
+        request.session['token'] = [key, secret]
+
+        params = {'oauth_token': key}
+        if self.callback_in_authorize:
+            params['oauth_callback'] = callback_url
+        return HTTPFound(location=self.authorize_url(**params))
+
+    def callback(self, request):
+        """Process the redirect back from the provider"""
+        if 'denied' in request.GET:
+            return AuthenticationDenied("User denied authentication")
+
+        try:
+            key, secret = request.session['token']
+        except (KeyError, ValueError):
+            raise ThirdPartyFailure('No request token in the session')
+        request_token = oauth.Token(key, secret)
+        if self.use_verifier:
+            verifier = request.GET.get('oauth_verifier')
+            if not verifier:
+                raise ThirdPartyFailure("Oauth verifier not returned")
+            request_token.set_verifier(verifier)
+
+        data = parse_token(self.signed(
+            self.access_token_method, self.access_token_endpoint,
+            token=request_token))
+        access_token = oauth.Token(data['oauth_token'],
+                                   data['oauth_token_secret'])
+        profile = self.fetch_profile(access_token, data)
+        cred = {
+            'oauthAccessToken': access_token.key,
+            'oauthAccessTokenSecret': access_token.secret,
+        }
+        return self.complete_class(profile=profile, credentials=cred)
+
+    def fetch_profile(self, access_token, data):
+        """Return the normalized profile of the user.
+
+        ``data`` is the decoded access token response.
+        """
+        raise NotImplementedError
+
+    def get_signed_json(self, url, access_token):
+        return loads(self.signed('GET', url, token=access_token))
@@ -0,0 +1,356 @@
+"""OpenID Connect Authentication Views
+
+A generic OpenID Connect provider. The endpoints are read from the
+issuer's ``/.well-known/openid-configuration`` unless they are configured.
+
+The ``id_token`` returned with the access token is verified locally (its
+signature against the issuer's JWKS, issuer, audience, expiry and nonce)
+and the profile is built from its claims. The userinfo endpoint is only
+called when one of the ``required_claims`` is missing from the token, so
+most logins finish with a single token request.
+
+The discovery document and JWKS are kept in the app's
+:class:`velruse.providers.metadata.MetadataCache`.
+
+Example settings:
+
+.. code-block:: ini
+
+    provider.oidc.issuer = https://accounts.google.com
+    provider.oidc.consumer_key = ...
+    provider.oidc.consumer_secret = ...
+    provider.oidc.required_claims = email name
+"""
+import datetime
+import time
+import uuid
+
+from pyramid.compat import PY3
+
+if PY3:
+    from urllib.parse import urlsplit
+else:  # pragma: no cover
+    from urlparse import urlsplit
+
+from pyramid.httpexceptions import HTTPFound
+from pyramid.security import NO_PERMISSION_REQUIRED
+from pyramid.settings import aslist
+
+from velruse import jws
+from velruse.api import (
+    AuthenticationComplete,
+    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
+    register_provider,
+)
+from velruse.exceptions import CSRFError
+from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
+from velruse.providers.base import Provider
+from velruse.providers.metadata import MetadataCache
+from velruse.providers.metadata import metadata_cache
+from velruse.settings import ProviderSettings
+from velruse.utils import URLTemplate
+from velruse.utils import cached_route_url
+
+
+# provider attributes and the discovery document keys they are read from
+METADATA = {
+    'authorize_endpoint': 'authorization_endpoint',
+    'token_endpoint': 'token_endpoint',
+    'userinfo_endpoint': 'userinfo_endpoint',
+    'jwks_uri': 'jwks_uri',
+}
+
+
+class OIDCAuthenticationComplete(AuthenticationComplete):
+    """OpenID Connect auth complete"""
+
+
+def includeme(config):
+    config.add_directive('add_oidc_login', add_oidc_login)
+    config.add_directive('setup_oidc_login_from_settings',
+                         add_oidc_login_from_settings)
+
+
+def add_oidc_login_from_settings(config, prefix='velruse.oidc.'):
+    settings = config.registry.settings
+    p = ProviderSettings(settings, prefix)
+    p.update('consumer_key', required=True)
+    p.update('consumer_secret', required=True)
+    p.update('issuer', required=True)
+    p.update('scope')
+    p.update('required_claims')
+    p.update('authorize_endpoint')
+    p.update('token_endpoint')
+    p.update('userinfo_endpoint')
+    p.update('jwks_uri')
+    p.update('login_path')
+    p.update('callback_path')
+    if 'required_claims' in p.kwargs:
+        p.kwargs['required_claims'] = aslist(p.kwargs['required_claims'])
+    config.add_oidc_login(**p.kwargs)
+
+
+def add_oidc_login(config,
+                   consumer_key,
+                   consumer_secret,
+                   issuer,
+                   scope=None,
+                   required_claims=None,
+                   authorize_endpoint=None,
+                   token_endpoint=None,
+                   userinfo_endpoint=None,
+                   jwks_uri=None,
+                   login_path='/login/oidc',
+                   callback_path='/login/oidc/callback',
+                   name='oidc'):
+    """
+    Add an OpenID Connect login provider to the application.
+    """
+    provider = OIDCProvider(name, consumer_key, consumer_secret, issuer,
+                            scope=scope,
+                            required_claims=required_claims,
+                            authorize_endpoint=authorize_endpoint,
+                            token_endpoint=token_endpoint,
+                            userinfo_endpoint=userinfo_endpoint,
+                            jwks_uri=jwks_uri,
+                            metadata=metadata_cache(config.registry))
+
+    config.add_route(provider.login_route, login_path)
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
+                    permission=NO_PERMISSION_REQUIRED)
+
+    config.add_route(provider.callback_route, callback_path,
+                     use_global_views=True,
+                     factory=provider_callback_factory(name))
+
+    register_provider(config, name, provider)
+
+
+class OIDCProvider(OAuth2Provider):
+    token_method = 'POST'
+    default_scope = 'openid email profile'
+    use_state = True
+    complete_class = OIDCAuthenticationComplete
+    refresh_supported = True
+
+    #: claims which, when missing from the id_token, are fetched from the
+    #: userinfo endpoint
+    required_claims = ('email', 'name')
+    #: allowed clock difference in seconds when checking the expiry
+    leeway = 60
+
+    def __init__(self, name, consumer_key, consumer_secret, issuer,
+                 scope=None, required_claims=None, metadata=None,
+                 **endpoints):
+        Provider.__init__(self, name)
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.issuer = issuer
+        self.scope = scope
+        if required_claims is not None:
+            self.required_claims = tuple(required_claims)
+        self.domain = urlsplit(issuer).hostname or issuer
+
+        self.endpoints = dict((k, v) for k, v in endpoints.items() if v)
+        # the discovery document the endpoints were last read from
+        self._discovery = False
+        if metadata is None:
+            metadata = MetadataCache()
+        self.metadata = metadata
+        self._jwks = (None, {})
+
+    def configure(self):
+        """Read the endpoints, from the discovery document if needed.
+
+        The document is read through the metadata cache on every use, so
+        the endpoints follow it when the issuer changes it.
+        """
+        metadata = None
+        if any(attr not in self.endpoints for attr in METADATA):
+            metadata = self.metadata.get(
+                self.issuer.rstrip('/') + '/.well-known/openid-configuration',
+                self.get_json)
+        if metadata is self._discovery:
+            return
+        if metadata is not None and metadata.get('issuer') != self.issuer:
+            raise ThirdPartyFailure(
+                'Discovery document of %s is for issuer %s' % (
+                    self.issuer, metadata.get('issuer')))
+        for attr, key in METADATA.items():
+            setattr(self, attr,
+                    self.endpoints.get(attr) or (metadata or {}).get(key))
+        if not self.authorize_endpoint or not self.token_endpoint:
+            raise ThirdPartyFailure('%s has no authorization or token '
+                                    'endpoint' % self.issuer)
+
+        self.authorize_url = URLTemplate(
+            self.authorize_endpoint,
+            client_id=self.consumer_key,
+            response_type='code')
+        self.token_form = {
+            'grant_type': 'authorization_code',
+            'client_id': self.consumer_key,
+            'client_secret': self.consumer_secret,
+        }
+        self._discovery = metadata
+
+    def login(self, request):
+        """Redirect to the provider to authorize the login"""
+        self.configure()
+        nonce = request.session['nonce'] = uuid.uuid4().hex
+        request.session['state'] = uuid.uuid4().hex
+        scope = request.POST.get('scope', self.scope or self.default_scope)
+        return HTTPFound(location=self.authorize_url(
+            redirect_uri=cached_route_url(request, self.callback_route),
+            scope=scope,
+            state=request.session['state'],
+            nonce=nonce))
+
+    def callback(self, request):
+        """Process the redirect back from the provider"""
+        self.configure()
+        self.check_state(request)
+        # the state and nonce of a login are only good for one callback
+        request.session.pop('state', None)
+        nonce = request.session.pop('nonce', None)
+        code = request.GET.get('code')
+        if not code:
+            reason = request.GET.get(self.denied_param,
+                                     'No reason provided.')
+            return AuthenticationDenied(reason)
+
+        token = self.fetch_token(request, code)
+        if 'id_token' not in token:
+            raise ThirdPartyFailure('No id_token returned')
+        claims = self.verify_id_token(token['id_token'], nonce)
+        access_token = token['access_token']
+        if any(claim not in claims for claim in self.required_claims):
+            claims = self.fetch_userinfo(access_token, claims)
+        return self.complete_class(
+            profile=self.fetch_profile(access_token, claims),
+            credentials=self.credentials(access_token, token))
+
+    def keys(self, jwks):
+        """Return the keys of the ``jwks`` document by id"""
+        document, keys = self._jwks
+        if document is not jwks:
+            keys = dict((k.get('kid'), k) for k in jwks.get('keys', []))
+            self._jwks = (jwks, keys)
+        return keys
+
+    def refresh(self, refresh_token):
+        self.configure()
+        return OAuth2Provider.refresh(self, refresh_token)
+
+    def get_key(self, kid):
+        """Return the JWK with id ``kid``.
+
+        An unknown key may have been added since the JWKS was fetched, so
+        the JWKS is fetched again, as often as the metadata cache allows.
+        """
+        if not self.jwks_uri:
+            return None
+        key = self.keys(self.metadata.get(self.jwks_uri, self.get_json)) \
+            .get(kid)
+        if key is None:
+            key = self.keys(self.metadata.refetch(
+                self.jwks_uri, self.get_json)).get(kid)
+        return key
+
+    def verify_id_token(self, id_token, nonce):
+        """Return the claims of ``id_token`` once it is verified"""
+        try:
+            claims = jws.verify(id_token, self.get_key, self.consumer_secret)
+        except jws.InvalidToken as e:
+            raise ThirdPartyFailure('Invalid id_token: %s' % e)
+
+        if claims.get('iss') != self.issuer:
+            raise ThirdPartyFailure('id_token issued by %s' %
+                                    claims.get('iss'))
+        audience = claims.get('aud')
+        if not isinstance(audience, list):
+            audience = [audience]
+        if self.consumer_key not in audience:
+            raise ThirdPartyFailure('id_token issued for another client')
+        if len(audience) > 1 and claims.get('azp') != self.consumer_key:
+            raise ThirdPartyFailure('id_token authorized for another client')
+        try:
+            expired = float(claims['exp']) + self.leeway < time.time()
+        except (KeyError, TypeError, ValueError):
+            raise ThirdPartyFailure('id_token has no valid expiry')
+        if expired:
+            raise ThirdPartyFailure('id_token expired')
+        if not nonce or claims.get('nonce') != nonce:
+            raise CSRFError('id_token nonce does not match the login')
+        return claims
+
+    def fetch_userinfo(self, access_token, claims):
+        """Complete ``claims`` with those of the userinfo endpoint"""
+        if not self.userinfo_endpoint:
+            return claims
+        userinfo = self.get_json(
+            self.userinfo_endpoint,
+            headers={'Authorization': 'Bearer %s' % access_token})
+        if userinfo.get('sub') != claims['sub']:
+            raise ThirdPartyFailure('userinfo is for another user')
+        return dict(userinfo, **claims)
+
+    def fetch_profile(self, access_token, claims):
+        return extract_oidc_data(claims, self.domain)
+
+
+def extract_oidc_data(claims, domain):
+    """Normalize the standard OpenID Connect claims"""
+    profile = {
+        'accounts': [{'domain': domain, 'userid': claims['sub']}],
+        'displayName': claims.get('name'),
+        'name': {
+            'formatted': claims.get('name'),
+            'givenName': claims.get('given_name'),
+            'familyName': claims.get('family_name'),
+        },
+        'emails': [],
+        'photos': [],
+        'urls': [],
+    }
+    email = claims.get('email')
+    if email:
+        profile['emails'].append({'value': email, 'primary': True})
+        if claims.get('email_verified') in (True, 'true'):
+            profile['verifiedEmail'] = email
+    username = claims.get('preferred_username')
+    if not username and email:
+        username = email.split('@', 1)[0]
+    if username:
+        profile['preferredUsername'] = username
+    if not profile['displayName']:
+        profile['displayName'] = username
+    if claims.get('picture'):
+        profile['photos'].append({'type': 'thumbnail',
+                                  'value': claims['picture']})
+    if claims.get('profile'):
+        profile['urls'].append({'type': 'profile',
+                                'value': claims['profile']})
+    for claim in ('gender', 'locale'):
+        if claims.get(claim):
+            profile[claim] = claims[claim]
+    birthday = parse_birthdate(claims.get('birthdate'))
+    if birthday is not None:
+        profile['birthday'] = birthday
+    return profile
+
+
+def parse_birthdate(value):
+    """Return the date of a ``birthdate`` claim.
+
+    Partial dates, such as ``0000-MM-DD`` for an omitted year or a year
+    alone, and malformed ones give ``None``.
+    """
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
@@ -19,6 +19,7 @@ from velruse.api import (
 )
 from velruse.exceptions import MissingParameter
 from velruse.exceptions import ThirdPartyFailure
+from velruse.utils import cached_route_url
 
 
 log = logging.getLogger(__name__)
@@ -212,7 +213,7 @@ class OpenIDConsumer(object):
 
         realm = self._get_realm(request)
         # TODO: add a csrf check to the return_to URL
-        return_to = request.route_url(self.callback_route)
+        return_to = cached_route_url(request, self.callback_route)
         request.session['openid_session'] = openid_session
 
         # OpenID 2.0 lets Providers request POST instead of redirect, this
@@ -248,7 +249,7 @@ class OpenIDConsumer(object):
 
         # Setup the consumer and parse the information coming back
         oidconsumer = consumer.Consumer(openid_session, self.openid_store)
-        return_to = request.route_url(self.callback_route)
+        return_to = cached_route_url(request, self.callback_route)
         info = oidconsumer.complete(request.params, return_to)
 
         if info.status in [consumer.FAILURE, consumer.CANCEL]:
@@ -1,26 +1,17 @@
 """QQ Authentication Views"""
-from pyramid.compat import PY3
-
-if PY3:
-    from urllib.parse import parse_qs
-else:
-    from urlparse import parse_qs
-
 from json import loads
 
-import requests
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
-    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
-from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
 from velruse.settings import ProviderSettings
-from velruse.utils import flat_url
+from velruse.utils import URLTemplate
 
 
 class QQAuthenticationComplete(AuthenticationComplete):
@@ -57,85 +48,40 @@ def add_qq_login(config,
     provider = QQProvider(name, consumer_key, consumer_secret, scope)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class QQProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a qq login"""
-        scope = request.POST.get('scope', self.scope)
-        gh_url = flat_url('https://graph.qq.com/oauth2.0/authorize',
-                          scope=scope,
-                          client_id=self.consumer_key,
-                          response_type='code',
-                          redirect_uri=request.route_url(self.callback_route))
-        return HTTPFound(location=gh_url)
-
-    def callback(self, request):
-        """Process the qq redirect"""
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            'https://graph.qq.com/oauth2.0/token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            grant_type='authorization_code',
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-        r = requests.get(access_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        access_token = parse_qs(content)['access_token'][0]
-
-        # Retrieve profile data
-        graph_url = flat_url('https://graph.qq.com/oauth2.0/me',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        data = loads(content[10:-3])
-        openid = data.get('openid', '')
-
-        user_info_url = flat_url('https://graph.qq.com/user/get_user_info',
-                access_token=access_token,
-                oauth_consumer_key=self.consumer_key,
-                openid=openid)
-        r = requests.get(user_info_url)
-        content = r.content.decode('UTF-8')
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, content))
-        data = loads(content)
-
-        profile = {
+class QQProvider(OAuth2Provider):
+    authorize_endpoint = 'https://graph.qq.com/oauth2.0/authorize'
+    authorize_params = {'response_type': 'code'}
+    token_endpoint = 'https://graph.qq.com/oauth2.0/token'
+    token_params = {'grant_type': 'authorization_code'}
+    token_format = 'query'
+    complete_class = QQAuthenticationComplete
+    refresh_supported = True
+
+    openid_url = URLTemplate('https://graph.qq.com/oauth2.0/me')
+    user_info_url = URLTemplate('https://graph.qq.com/user/get_user_info')
+
+    def fetch_profile(self, access_token, token):
+        # the openid is wrapped in a JSONP callback
+        content = self.http('GET', self.openid_url(access_token=access_token))
+        openid = loads(content[10:-3]).get('openid', '')
+
+        data = self.get_json(self.user_info_url(
+            access_token=access_token,
+            oauth_consumer_key=self.consumer_key,
+            openid=openid))
+        return {
             'accounts': [{'domain':'qq.com', 'userid':openid}],
             'displayName': data['nickname'],
             'preferredUsername': data['nickname'],
         }
-
-        cred = {'oauthAccessToken': access_token}
-        return QQAuthenticationComplete(profile=profile, credentials=cred)
@@ -1,21 +1,21 @@
 """Taobao Authentication Views"""
-from hashlib import md5
-from json import loads
 import time
 
-import requests
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
-    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
-from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
 from velruse.settings import ProviderSettings
-from velruse.utils import flat_url
+from velruse.utils import MD5Signer
+from velruse.utils import URLTemplate
+
+
+API_URL = 'http://gw.api.taobao.com/router/rest'
 
 
 class TaobaoAuthenticationComplete(AuthenticationComplete):
@@ -50,83 +50,68 @@ def add_taobao_login(config,
     provider = TaobaoProvider(name, consumer_key, consumer_secret)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class TaobaoProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a taobao login"""
-        gh_url = flat_url('https://oauth.taobao.com/authorize',
-                          client_id=self.consumer_key,
-                          response_type='code',
-                          redirect_uri=request.route_url(self.callback_route))
-        return HTTPFound(location=gh_url)
-
-    def callback(self, request):
-        """Process the taobao redirect"""
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason)
-
-        # Now retrieve the access token with the code
-        r = requests.post('https://oauth.taobao.com/token',
-                dict(grant_type='authorization_code',
-                     client_id=self.consumer_key,
-                     client_secret=self.consumer_secret,
-                     redirect_uri=request.route_url(self.callback_route),
-                     code=code))
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = loads(r.content)
-        access_token = data['access_token']
-
-        # Retrieve profile data
-        params = {
-                'method': 'taobao.user.get',
-                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
-                'format': 'json',
-                'app_key': self.consumer_key,
-                'v': '2.0',
-                'sign_method': 'md5',
-                'fields': 'user_id,nick',
-                'session': access_token
-                }
-        src = self.consumer_secret\
-                + ''.join(["%s%s" % (k, v) for k, v in sorted(params.items())])\
-                + self.consumer_secret
-        params['sign'] = md5(src).hexdigest().upper()
-        get_user_info_url = flat_url('http://gw.api.taobao.com/router/rest',
-                                     **params)
-        r = requests.get(get_user_info_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (r.status_code, r.content))
-        data = loads(r.content)
+class TaobaoProvider(OAuth2Provider):
+    authorize_endpoint = 'https://oauth.taobao.com/authorize'
+    authorize_params = {'response_type': 'code'}
+    token_endpoint = 'https://oauth.taobao.com/token'
+    token_params = {'grant_type': 'authorization_code'}
+    token_method = 'POST'
+    complete_class = TaobaoAuthenticationComplete
+    refresh_supported = True
+
+    user_params = {
+        'method': 'taobao.user.get',
+        'format': 'json',
+        'v': '2.0',
+        'sign_method': 'md5',
+        'fields': 'user_id,nick',
+    }
+
+    def __init__(self, name, consumer_key, consumer_secret, scope=None):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope)
+        static = dict(self.user_params, app_key=consumer_key)
+        self.user_url = URLTemplate(API_URL, **static)
+        self.sign = MD5Signer(prefix=consumer_secret, suffix=consumer_secret,
+                              upper=True, **static)
+
+    def fetch_profile(self, access_token, token):
+        params = {'timestamp': timestamp(), 'session': access_token}
+        params['sign'] = self.sign(**params)
+        data = self.get_json(self.user_url(**params))
 
         username = data['user_get_response']['user']['nick']
         userid = data['user_get_response']['user']['user_id']
-
-        profile = {
+        return {
             'accounts': [{'domain':'taobao.com', 'userid':userid}],
             'displayName': username,
             'preferredUsername': username,
         }
 
-        cred = {'oauthAccessToken': access_token}
-        return TaobaoAuthenticationComplete(profile=profile, credentials=cred)
+
+_timestamp = (None, None)
+
+
+def timestamp():
+    """Return the local time as expected by the API.
+
+    The formatted time is reused for calls within the same second.
+    """
+    global _timestamp
+    now = int(time.time())
+    second, formatted = _timestamp
+    if second != now:
+        formatted = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        _timestamp = (now, formatted)
+    return formatted
@@ -1,21 +1,15 @@
 """Sina Microblogging weibo.com Authentication Views"""
-import uuid
-from json import loads
-
-import requests
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from velruse.api import (
     AuthenticationComplete,
-    AuthenticationDenied,
+    provider_callback_factory,
+    provider_login_view,
     register_provider,
 )
-from velruse.exceptions import CSRFError
-from velruse.exceptions import ThirdPartyFailure
+from velruse.providers.base import OAuth2Provider
 from velruse.settings import ProviderSettings
-from velruse.utils import flat_url
+from velruse.utils import URLTemplate
 
 
 class WeiboAuthenticationComplete(AuthenticationComplete):
@@ -50,80 +44,34 @@ def add_weibo_login(config,
     provider = WeiboProvider(name, consumer_key, consumer_secret)
 
     config.add_route(provider.login_route, login_path)
-    config.add_view(provider.login, route_name=provider.login_route,
+    config.add_view(provider_login_view(name),
+                    route_name=provider.login_route,
                     permission=NO_PERMISSION_REQUIRED)
 
     config.add_route(provider.callback_route, callback_path,
                      use_global_views=True,
-                     factory=provider.callback)
+                     factory=provider_callback_factory(name))
 
     register_provider(config, name, provider)
 
 
-class WeiboProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a weibo login"""
-        request.session['state'] = state = uuid.uuid4().hex
-        fb_url = flat_url('https://api.weibo.com/oauth2/authorize',
-                          client_id=self.consumer_key,
-                          redirect_uri=request.route_url(self.callback_route),
-                          state=state)
-        return HTTPFound(location=fb_url)
-
-    def callback(self, request):
-        """Process the weibo redirect"""
-        if request.GET.get('state') != request.session.get('state'):
-            raise CSRFError("CSRF Validation check failed. Request state %s is "
-                            "not the same as session state %s" % (
-                            request.GET.get('state'), request.session.get('state')
-                            ))
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error_reason', 'No reason provided.')
-            return AuthenticationDenied(reason)
-
-        # Now retrieve the access token with the code
-        r = requests.post(
-            'https://api.weibo.com/oauth2/access_token',
-            dict(
-                client_id=self.consumer_key,
-                client_secret=self.consumer_secret,
-                redirect_uri=request.route_url(self.callback_route),
-                grant_type='authorization_code',
-                code=code,
-            ),
-        )
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = loads(r.content)
-        access_token = data['access_token']
-        uid = data['uid']
-
-        # Retrieve profile data
-        graph_url = flat_url('https://api.weibo.com/2/users/show.json',
-                                access_token=access_token,
-                                uid=uid)
-        r = requests.get(graph_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = loads(r.content)
-
-        profile = {
+class WeiboProvider(OAuth2Provider):
+    authorize_endpoint = 'https://api.weibo.com/oauth2/authorize'
+    token_endpoint = 'https://api.weibo.com/oauth2/access_token'
+    token_params = {'grant_type': 'authorization_code'}
+    token_method = 'POST'
+    use_state = True
+    denied_param = 'error_reason'
+    complete_class = WeiboAuthenticationComplete
+
+    profile_url = URLTemplate('https://api.weibo.com/2/users/show.json')
+
+    def fetch_profile(self, access_token, token):
+        data = self.get_json(
+            self.profile_url(access_token=access_token, uid=token['uid']))
+        return {
             'accounts': [{'domain':'weibo.com', 'userid':data['id']}],
             'gender': data.get('gender'),
             'displayName': data['screen_name'],
             'preferredUsername': data['name'],
         }
-
-        cred = {'oauthAccessToken': access_token}
-        return WeiboAuthenticationComplete(profile=profile, credentials=cred)
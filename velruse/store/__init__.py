@@ -0,0 +1,7 @@
+"""Velruse key/value stores
+
+Additional :mod:`anykeystore` backends tailored to the way velruse uses its
+store: many small, short-lived entries keyed by random tokens. The backends
+are registered under the ``anykeystore.backends`` entry point so they can be
+selected with the ``store`` setting of the standalone app.
+"""
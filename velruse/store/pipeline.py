@@ -0,0 +1,250 @@
+"""Pipelined store
+
+A wrapper around another :mod:`anykeystore` backend which batches the
+operations issued concurrently by different threads. At most ``pool_size``
+threads talk to the backend at once, each with its own connection; any
+operation arriving while they are busy is queued and sent together with the
+other queued operations in the next round trip. Redis batches are sent as a
+single pipeline, other backends execute the batch sequentially.
+
+Every operation's latency, including the time spent waiting in the queue, is
+recorded in :attr:`PipelinedStore.stats`.
+
+Example settings for the standalone app:
+
+.. code-block:: ini
+
+    store = pipelined
+    store.backend = redis
+    store.backend.host = localhost
+    store.backend.port = 6379
+    store.pool_size = 10
+    store.batch_size = 100
+"""
+import logging
+import math
+import threading
+import time
+
+from anykeystore import create_store
+from anykeystore.backends.redis import RedisStore
+from anykeystore.compat import pickle
+from anykeystore.interfaces import KeyValueStore
+from anykeystore.utils import coerce_timedelta
+
+
+log = logging.getLogger(__name__)
+
+RETRIEVE = 'retrieve'
+STORE = 'store'
+DELETE = 'delete'
+
+
+class StoreStats(object):
+    """Per-operation latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.ops = dict((kind, [0, 0.0, 0.0])
+                            for kind in (RETRIEVE, STORE, DELETE))
+            self.batches = 0
+            self.batched_ops = 0
+
+    def record(self, kind, elapsed):
+        with self._lock:
+            counters = self.ops[kind]
+            counters[0] += 1
+            counters[1] += elapsed
+            if elapsed > counters[2]:
+                counters[2] = elapsed
+
+    def record_batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self.batched_ops += size
+
+    def snapshot(self):
+        """Return the counters as a dictionary of plain values.
+
+        Latencies are reported in milliseconds.
+        """
+        with self._lock:
+            result = {
+                'batches': self.batches,
+                'avg_batch_size': (
+                    float(self.batched_ops) / self.batches
+                    if self.batches else 0.0),
+            }
+            for kind, (count, total, worst) in self.ops.items():
+                result[kind] = {
+                    'count': count,
+                    'avg_ms': total / count * 1000 if count else 0.0,
+                    'max_ms': worst * 1000,
+                }
+            return result
+
+
+class _Op(object):
+    __slots__ = ('kind', 'key', 'value', 'expires', 'result', 'error',
+                 'done', 'handoff')
+
+    def __init__(self, kind, key, value=None, expires=None):
+        self.kind = kind
+        self.key = key
+        self.value = value
+        self.expires = expires
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.handoff = None
+
+
+class PipelinedStore(KeyValueStore):
+    """ Batch concurrent operations against another backend.
+
+    :param backend: Name of the wrapped anykeystore backend. Settings for
+                    it are passed with a ``backend.`` prefix.
+    :param pool_size: Maximum number of round trips in flight, which is
+                      also the size of the connection pool.
+    :param batch_size: Maximum number of operations per round trip.
+    """
+
+    def __init__(self, backend, pool_size=10, batch_size=100,
+                 backend_api=None, **kw):
+        prefix = 'backend.'
+        options = dict((k[len(prefix):], v) for k, v in kw.items()
+                       if k.startswith(prefix))
+        self.backend = create_store(backend, **options)
+        self.pool_size = int(pool_size)
+        self.batch_size = int(batch_size)
+        self.backend_api = backend_api
+        self.stats = StoreStats()
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._flushers = 0
+
+        if isinstance(self.backend, RedisStore):
+            api = self.backend.backend_api
+            pool = api.ConnectionPool(
+                host=self.backend.host, port=self.backend.port,
+                db=self.backend.db, max_connections=self.pool_size)
+            self._redis = api.Redis(connection_pool=pool)
+            self._execute = self._execute_redis
+        else:
+            self._execute = self._execute_sequential
+
+    @classmethod
+    def backend_api(cls):
+        return None
+
+    def _take(self):
+        """Remove the next batch from the queue, the lock must be held"""
+        batch = self._pending[:self.batch_size]
+        del self._pending[:self.batch_size]
+        return batch
+
+    def _submit(self, op):
+        start = time.time()
+        batch = None
+        with self._lock:
+            self._pending.append(op)
+            if self._flushers < self.pool_size:
+                self._flushers += 1
+                batch = self._take()
+        if batch:
+            self._flush(batch)
+        op.done.wait()
+        if op.handoff is not None:
+            # woken up to send the batch starting with this operation
+            batch, op.handoff = op.handoff, None
+            self._flush(batch)
+        self.stats.record(op.kind, time.time() - start)
+        if op.error is not None:
+            raise op.error
+        return op.result
+
+    def _flush(self, batch):
+        """Send ``batch``, then hand the queue over to a waiting thread.
+
+        Operations queued while every flusher was busy are passed to the
+        thread owning the first of them instead of being sent by this one,
+        so no thread keeps flushing for others under sustained load.
+        """
+        self.stats.record_batch(len(batch))
+        try:
+            self._execute(batch)
+        except Exception as e:
+            log.exception('store batch of %d operations failed', len(batch))
+            for op in batch:
+                op.error = e
+        for op in batch:
+            op.done.set()
+        with self._lock:
+            batch = self._take()
+            if batch:
+                batch[0].handoff = batch
+            else:
+                self._flushers -= 1
+        if batch:
+            batch[0].done.set()
+
+    def _execute_sequential(self, batch):
+        backend = self.backend
+        for op in batch:
+            try:
+                if op.kind == RETRIEVE:
+                    op.result = backend.retrieve(op.key)
+                elif op.kind == STORE:
+                    backend.store(op.key, op.value, expires=op.expires)
+                else:
+                    backend.delete(op.key)
+            except Exception as e:
+                op.error = e
+
+    def _execute_redis(self, batch):
+        prefix = self.backend.key_prefix
+        pipe = self._redis.pipeline(transaction=False)
+        for op in batch:
+            key = '%s%s' % (prefix, op.key)
+            if op.kind == RETRIEVE:
+                pipe.get(key)
+            elif op.kind == STORE:
+                seconds = None
+                if op.expires is not None:
+                    # redis rejects an expiry of 0
+                    seconds = max(1, int(math.ceil(
+                        coerce_timedelta(op.expires).total_seconds())))
+                pipe.set(key,
+                         pickle.dumps(op.value,
+                                      protocol=pickle.HIGHEST_PROTOCOL),
+                         ex=seconds)
+            else:
+                pipe.delete(key)
+        results = pipe.execute(raise_on_error=False)
+        for op, result in zip(batch, results):
+            if isinstance(result, Exception):
+                op.error = result
+            elif op.kind == RETRIEVE:
+                if result is None:
+                    op.error = KeyError(op.key)
+                else:
+                    op.result = pickle.loads(result)
+
+    def retrieve(self, key):
+        return self._submit(_Op(RETRIEVE, key))
+
+    def store(self, key, value, expires=None):
+        self._submit(_Op(STORE, key, value, expires))
+
+    def delete(self, key):
+        self._submit(_Op(DELETE, key))
+
+    def purge_expired(self):
+        self.backend.purge_expired()
+
+backend = PipelinedStore
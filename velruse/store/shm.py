@@ -0,0 +1,279 @@
+"""Shared memory store
+
+A fixed-size hash table living in a memory mapped file. Every process on the
+host that opens the same file sees the same entries, which makes it possible
+to share tokens between pre-forked workers without running a separate
+service.
+
+The table is split into stripes. A key always lives in the stripe selected by
+its hash and is placed with linear probing inside that stripe. Writers take a
+per-stripe lock (a thread lock plus an ``fcntl`` byte-range lock for other
+processes). Readers never lock: every slot carries a sequence counter which
+is odd while a write is in progress, and a read is retried when the counter
+changed underneath it.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from anykeystore.compat import pickle
+from anykeystore.interfaces import KeyValueStore
+from anykeystore.utils import coerce_timedelta
+
+
+MAGIC = b'VLRSHM01'
+
+# magic, stripes, slots per stripe, slot size
+HEADER = struct.Struct('<8sIII')
+
+# sequence, state, expires, key length, value length
+SLOT = struct.Struct('<IBdHI')
+SEQ = struct.Struct('<I')
+
+KEY_SIZE = 64
+
+EMPTY = 0
+USED = 1
+DELETED = 2
+
+# number of optimistic read attempts before falling back to the stripe lock
+MAX_SPINS = 100
+
+# byte used to serialize creation of the file, well past the stripe locks
+INIT_LOCK = 1 << 30
+
+
+def default_path():
+    base = '/dev/shm'
+    if not os.path.isdir(base):
+        base = tempfile.gettempdir()
+    return os.path.join(base, 'velruse-store')
+
+
+class SharedMemoryStore(KeyValueStore):
+    """ Storage shared between processes through a memory mapped file.
+
+    :param path: The file backing the table. Every process sharing the
+                 store must use the same path and geometry. Defaults to
+                 ``/dev/shm/velruse-store``.
+    :param slots: Total number of entries the table can hold.
+    :param stripes: Number of independently locked regions.
+    :param slot_size: Size in bytes of a single entry, including its
+                      pickled value.
+    """
+
+    def __init__(self, path=None, slots=8192, stripes=16, slot_size=2048,
+                 backend_api=None):
+        self.path = path or default_path()
+        self.stripes = int(stripes)
+        self.slots_per_stripe = max(int(slots) // self.stripes, 1)
+        self.slot_size = int(slot_size)
+        self.value_size = self.slot_size - SLOT.size - KEY_SIZE
+        if self.value_size <= 0:
+            raise ValueError('slot_size %d is too small' % self.slot_size)
+        self.backend_api = backend_api
+        self._locks = [threading.Lock() for i in range(self.stripes)]
+
+        self.size = (HEADER.size +
+                     self.stripes * self.slots_per_stripe * self.slot_size)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, INIT_LOCK)
+        try:
+            self._init_file()
+            self._mm = mmap.mmap(self._fd, self.size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, INIT_LOCK)
+
+    @classmethod
+    def backend_api(cls):
+        return mmap
+
+    def _init_file(self):
+        header = HEADER.pack(MAGIC, self.stripes, self.slots_per_stripe,
+                             self.slot_size)
+        if os.fstat(self._fd).st_size == 0:
+            os.ftruncate(self._fd, self.size)
+            os.write(self._fd, header)
+            return
+        existing = os.read(self._fd, HEADER.size)
+        if existing != header:
+            raise ValueError(
+                'shared memory store at "%s" was created with a different '
+                'geometry' % self.path)
+
+    def _locate(self, key):
+        h = zlib.crc32(key) & 0xffffffff
+        stripe = h % self.stripes
+        home = (h // self.stripes) % self.slots_per_stripe
+        return stripe, home
+
+    def _offset(self, stripe, index):
+        index = (stripe * self.slots_per_stripe +
+                 index % self.slots_per_stripe)
+        return HEADER.size + index * self.slot_size
+
+    @contextmanager
+    def _locked(self, stripe):
+        with self._locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def _read_key(self, offset, klen):
+        start = offset + SLOT.size
+        return self._mm[start:start + klen]
+
+    def _read_value(self, offset, vlen):
+        start = offset + SLOT.size + KEY_SIZE
+        return self._mm[start:start + vlen]
+
+    def _write(self, offset, state, expires=0.0, key=b'', value=b''):
+        mm = self._mm
+        seq = SEQ.unpack_from(mm, offset)[0]
+        busy = (seq + 1) & 0xffffffff
+        SEQ.pack_into(mm, offset, busy)
+        if key:
+            start = offset + SLOT.size
+            mm[start:start + len(key)] = key
+        if value:
+            start = offset + SLOT.size + KEY_SIZE
+            mm[start:start + len(value)] = value
+        SLOT.pack_into(mm, offset, busy, state, expires, len(key), len(value))
+        SEQ.pack_into(mm, offset, (busy + 1) & 0xffffffff)
+
+    def _snapshot(self, offset, key):
+        """Return ``(state, expires, value)`` for the slot at ``offset``.
+
+        ``value`` is only read when the slot holds ``key``, otherwise it is
+        ``None``. The snapshot is taken without locking and is retried while
+        a writer is modifying the slot.
+        """
+        mm = self._mm
+        for i in range(MAX_SPINS):
+            seq, state, expires, klen, vlen = SLOT.unpack_from(mm, offset)
+            if seq & 1:
+                continue
+            value = None
+            if state == USED and self._read_key(offset, klen) == key:
+                value = self._read_value(offset, vlen)
+            if SEQ.unpack_from(mm, offset)[0] == seq:
+                return state, expires, value
+        return None
+
+    def _find(self, key, stripe, home):
+        for i in range(self.slots_per_stripe):
+            offset = self._offset(stripe, home + i)
+            snapshot = self._snapshot(offset, key)
+            if snapshot is None:
+                # a writer is stuck on this slot, wait for it to finish
+                with self._locked(stripe):
+                    snapshot = self._snapshot(offset, key)
+                if snapshot is None:
+                    continue
+            state, expires, value = snapshot
+            if state == EMPTY:
+                break
+            if value is not None:
+                return expires, value
+        raise KeyError
+
+    def retrieve(self, key):
+        key = key.encode('utf-8')
+        stripe, home = self._locate(key)
+        expires, value = self._find(key, stripe, home)
+        if expires and expires <= time.time():
+            raise KeyError
+        return pickle.loads(value)
+
+    def store(self, key, value, expires=None):
+        key = key.encode('utf-8')
+        if len(key) > KEY_SIZE:
+            raise ValueError('key is longer than %d bytes' % KEY_SIZE)
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(value) > self.value_size:
+            raise ValueError(
+                'value of %d bytes does not fit in a %d byte slot' % (
+                    len(value), self.slot_size))
+        expiration = 0.0
+        if expires is not None:
+            expiration = time.time() + \
+                    coerce_timedelta(expires).total_seconds()
+
+        stripe, home = self._locate(key)
+        mm = self._mm
+        now = time.time()
+        with self._locked(stripe):
+            target = None
+            for i in range(self.slots_per_stripe):
+                offset = self._offset(stripe, home + i)
+                seq, state, slot_expires, klen, vlen = \
+                        SLOT.unpack_from(mm, offset)
+                if state == EMPTY:
+                    if target is None:
+                        target = offset
+                    break
+                if state == USED and self._read_key(offset, klen) == key:
+                    target = offset
+                    break
+                if target is None and (
+                        state == DELETED or
+                        (slot_expires and slot_expires <= now)):
+                    target = offset
+            if target is None:
+                raise ValueError('shared memory store is full')
+            self._write(target, USED, expiration, key, value)
+
+    def delete(self, key):
+        key = key.encode('utf-8')
+        stripe, home = self._locate(key)
+        mm = self._mm
+        with self._locked(stripe):
+            for i in range(self.slots_per_stripe):
+                offset = self._offset(stripe, home + i)
+                seq, state, expires, klen, vlen = SLOT.unpack_from(mm, offset)
+                if state == EMPTY:
+                    return
+                if state == USED and self._read_key(offset, klen) == key:
+                    self._write(offset, DELETED)
+                    return
+
+    def purge_expired(self):
+        mm = self._mm
+        n = self.slots_per_stripe
+        for stripe in range(self.stripes):
+            with self._locked(stripe):
+                now = time.time()
+                empty = None
+                for i in range(n):
+                    offset = self._offset(stripe, i)
+                    seq, state, expires, klen, vlen = \
+                            SLOT.unpack_from(mm, offset)
+                    if state == USED and expires and expires <= now:
+                        self._write(offset, DELETED)
+                    elif state == EMPTY:
+                        empty = i
+                if empty is None:
+                    continue
+                # Tombstones directly in front of an empty slot never sit
+                # between a key and its home slot, so they can be emptied.
+                # Walking backwards from an empty slot clears whole runs.
+                follows_empty = True
+                for i in range(empty - 1, empty - n, -1):
+                    offset = self._offset(stripe, i)
+                    state = SLOT.unpack_from(mm, offset)[1]
+                    if state == EMPTY:
+                        follows_empty = True
+                    elif state == DELETED and follows_empty:
+                        self._write(offset, EMPTY)
+                    else:
+                        follows_empty = False
+
+backend = SharedMemoryStore
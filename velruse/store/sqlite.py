@@ -0,0 +1,143 @@
+"""SQLite store
+
+A durable store for single host deployments that do not want to run a
+separate service. The database runs in WAL mode so readers are not blocked
+by writers, statements are kept prepared in each connection's statement
+cache, and expired rows are removed in large batches by a background thread
+using an index on the expiry column.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from anykeystore.compat import pickle
+from anykeystore.interfaces import KeyValueStore
+from anykeystore.utils import coerce_timedelta
+
+
+class SQLiteStore(KeyValueStore):
+    """ Storage in a SQLite database.
+
+    :param path: Path of the database file.
+    :param table: Name of the table, created automatically.
+    :param purge_interval: Seconds between two background purges of
+                           expired rows. ``0`` disables the purge thread.
+    :param purge_batch: Maximum number of rows deleted per statement.
+    :param timeout: Seconds to wait for a lock held by another connection.
+    """
+
+    def __init__(self, path='velruse.db', table='velruse_store',
+                 purge_interval=60, purge_batch=1000, timeout=5,
+                 backend_api=None):
+        self.path = path
+        self.table = table
+        self.purge_interval = float(purge_interval)
+        self.purge_batch = int(purge_batch)
+        self.timeout = float(timeout)
+        self.backend_api = backend_api or sqlite3
+
+        self._select = (
+            'SELECT value, expires FROM %s WHERE key = ?' % table)
+        self._insert = (
+            'INSERT OR REPLACE INTO %s (key, value, expires) '
+            'VALUES (?, ?, ?)' % table)
+        self._delete = 'DELETE FROM %s WHERE key = ?' % table
+        self._purge = (
+            'DELETE FROM %s WHERE rowid IN ('
+            'SELECT rowid FROM %s WHERE expires <= ? LIMIT ?)' % (
+                table, table))
+
+        self._local = threading.local()
+        self._purger = None
+        self._purger_pid = None
+        self._purger_lock = threading.Lock()
+
+        conn = self._get_conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'key TEXT PRIMARY KEY NOT NULL, '
+            'value BLOB NOT NULL, '
+            'expires REAL)' % table)
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS %s_expires ON %s (expires)' % (
+                table, table))
+
+    @classmethod
+    def backend_api(cls):
+        return sqlite3
+
+    def _get_conn(self):
+        """The connection owned by the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            api = self.backend_api
+            conn = api.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, cached_statements=16)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_purger(self):
+        """Start the purge thread in the current process.
+
+        Threads do not survive a fork, so the thread is started lazily by
+        the first write in each worker rather than when the store is
+        created.
+        """
+        if self.purge_interval <= 0 or self._purger_pid == os.getpid():
+            return
+        with self._purger_lock:
+            if self._purger_pid == os.getpid():
+                return
+            self._purger = t = threading.Thread(target=self._purge_loop,
+                                                name='velruse-sqlite-purge')
+            t.daemon = True
+            self._purger_pid = os.getpid()
+            t.start()
+
+    def _purge_loop(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                self.purge_expired()
+            except self.backend_api.Error:
+                pass
+
+    def retrieve(self, key):
+        row = self._get_conn().execute(self._select, (key,)).fetchone()
+        if row:
+            value, expires = row
+            if expires is None or time.time() < expires:
+                return pickle.loads(bytes(value))
+        raise KeyError
+
+    def store(self, key, value, expires=None):
+        self._ensure_purger()
+        expiration = None
+        if expires is not None:
+            expiration = time.time() + \
+                    coerce_timedelta(expires).total_seconds()
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._get_conn().execute(
+            self._insert, (key, self.backend_api.Binary(data), expiration))
+
+    def delete(self, key):
+        self._get_conn().execute(self._delete, (key,))
+
+    def purge_expired(self):
+        """Delete expired rows, ``purge_batch`` rows per transaction.
+
+        Keeping every transaction short lets concurrent writers interleave
+        with a large purge instead of waiting for all of it.
+        """
+        conn = self._get_conn()
+        now = time.time()
+        while True:
+            cursor = conn.execute(self._purge, (now, self.purge_batch))
+            if cursor.rowcount < self.purge_batch:
+                break
+
+backend = SQLiteStore
@@ -0,0 +1,256 @@
+"""Tiered store
+
+Writes go to a primary backend with a tight timeout. When the primary is
+slow or failing the value is written to a local backend instead and the key
+returned by :meth:`TieredStore.store_routed` carries a hint saying so. Reads
+of hinted keys check the local tier first, so a stalled primary adds at most
+``timeout`` seconds to a login instead of failing it.
+
+After a primary timeout the primary is skipped for ``retry_interval``
+seconds so that requests stop paying the timeout while it recovers.
+
+The local tier defaults to a bounded in-process store. With several worker
+processes the callback and the ``auth_info`` request may be served by
+different workers, in which case the ``shm`` backend should be used as the
+local tier.
+
+Example settings for the standalone app:
+
+.. code-block:: ini
+
+    store = tiered
+    store.primary = redis
+    store.primary.host = localhost
+    store.timeout = 0.05
+    store.local = shm
+    store.local.path = /dev/shm/velruse-fallback
+"""
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+from pyramid.compat import PY3
+
+if PY3:
+    from queue import Full, Queue
+else:
+    from Queue import Full, Queue
+
+from anykeystore import create_store
+from anykeystore.interfaces import KeyValueStore
+from anykeystore.utils import coerce_timedelta
+
+
+log = logging.getLogger(__name__)
+
+# not part of the token alphabet, so hinted keys never collide with tokens
+LOCAL_HINT = '_'
+
+
+class PrimaryUnavailable(Exception):
+    """Raised when the primary tier did not answer in time"""
+
+
+class BoundedMemoryStore(KeyValueStore):
+    """ In-memory storage keeping at most ``max_entries`` values.
+
+    The oldest entries are evicted first once the store is full.
+    """
+
+    def __init__(self, max_entries=10000, backend_api=None):
+        self.max_entries = int(max_entries)
+        self.backend_api = backend_api
+        self._lock = threading.Lock()
+        self._store = OrderedDict()
+
+    @classmethod
+    def backend_api(cls):
+        return OrderedDict
+
+    def retrieve(self, key):
+        data = self._store.get(key)
+        if data:
+            value, expires = data
+            if expires is None or time.time() < expires:
+                return value
+        raise KeyError
+
+    def store(self, key, value, expires=None):
+        expiration = None
+        if expires is not None:
+            expiration = time.time() + \
+                    coerce_timedelta(expires).total_seconds()
+        with self._lock:
+            self._store.pop(key, None)
+            self._store[key] = (value, expiration)
+            while len(self._store) > self.max_entries:
+                self._store.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._store.pop(key, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (v, e) in self._store.items()
+                       if e is not None and e <= now]
+            for key in expired:
+                del self._store[key]
+
+
+class _Call(object):
+    __slots__ = ('fn', 'args', 'kw', 'result', 'error', 'done')
+
+    def __init__(self, fn, args, kw):
+        self.fn = fn
+        self.args = args
+        self.kw = kw
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class TieredStore(KeyValueStore):
+    """ Primary storage with a local fallback.
+
+    :param primary: Name of the primary anykeystore backend, configured
+                    with ``primary.`` prefixed settings.
+    :param local: Optional name of the local backend, configured with
+                  ``local.`` prefixed settings. Defaults to a
+                  :class:`BoundedMemoryStore`.
+    :param timeout: Seconds to wait for the primary.
+    :param retry_interval: Seconds to skip the primary after a timeout.
+    :param workers: Number of threads talking to the primary.
+    """
+
+    def __init__(self, primary, local=None, timeout=0.05, retry_interval=1,
+                 workers=4, backend_api=None, **kw):
+        self.primary = create_store(primary, **self._options('primary.', kw))
+        local_options = self._options('local.', kw)
+        if local is None:
+            self.local = BoundedMemoryStore(**local_options)
+        else:
+            self.local = create_store(local, **local_options)
+        self.timeout = float(timeout)
+        self.retry_interval = float(retry_interval)
+        self.workers = int(workers)
+        self.backend_api = backend_api
+
+        self._down_until = 0
+        self._calls = None
+        self._workers_pid = None
+        self._workers_lock = threading.Lock()
+
+    @classmethod
+    def backend_api(cls):
+        return None
+
+    @staticmethod
+    def _options(prefix, kw):
+        return dict((k[len(prefix):], v) for k, v in kw.items()
+                    if k.startswith(prefix))
+
+    def _ensure_workers(self):
+        """Start the threads talking to the primary in this process.
+
+        Threads do not survive a fork, so every worker process starts its
+        own threads and queue on first use.
+        """
+        if self._workers_pid == os.getpid():
+            return
+        with self._workers_lock:
+            if self._workers_pid == os.getpid():
+                return
+            calls = Queue(maxsize=self.workers * 16)
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, args=(calls,),
+                                     name='velruse-tiered-%d' % i)
+                t.daemon = True
+                t.start()
+            self._calls = calls
+            self._workers_pid = os.getpid()
+
+    def _work(self, calls):
+        while True:
+            call = calls.get()
+            try:
+                call.result = call.fn(*call.args, **call.kw)
+            except Exception as e:
+                call.error = e
+            call.done.set()
+
+    def _call_primary(self, fn, *args, **kw):
+        if time.time() < self._down_until:
+            raise PrimaryUnavailable('primary store marked unavailable')
+        self._ensure_workers()
+        call = _Call(fn, args, kw)
+        try:
+            self._calls.put_nowait(call)
+        except Full:
+            raise PrimaryUnavailable('primary store queue is full')
+        if not call.done.wait(self.timeout):
+            self._down_until = time.time() + self.retry_interval
+            log.warn('primary store did not answer within %.3fs, using the '
+                     'local tier for %.1fs', self.timeout,
+                     self.retry_interval)
+            raise PrimaryUnavailable('primary store timed out')
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def store_routed(self, key, value, expires=None):
+        """Store ``value`` and return the key it can be retrieved with.
+
+        The returned key is ``key`` itself when the primary accepted the
+        write, or ``key`` with a local tier hint when it fell back.
+        """
+        try:
+            self._call_primary(self.primary.store, key, value,
+                               expires=expires)
+            return key
+        except PrimaryUnavailable:
+            pass
+        except Exception:
+            log.warn('primary store failed, falling back to the local '
+                     'store', exc_info=True)
+        self.local.store(key, value, expires=expires)
+        return LOCAL_HINT + key
+
+    def store(self, key, value, expires=None):
+        self.store_routed(key, value, expires=expires)
+
+    def retrieve(self, key):
+        if key.startswith(LOCAL_HINT):
+            key = key[len(LOCAL_HINT):]
+            try:
+                return self.local.retrieve(key)
+            except KeyError:
+                pass
+        try:
+            return self._call_primary(self.primary.retrieve, key)
+        except (KeyError, PrimaryUnavailable):
+            pass
+        except Exception:
+            self._down_until = time.time() + self.retry_interval
+            log.warn('primary store failed, using the local tier for %.1fs',
+                     self.retry_interval, exc_info=True)
+        # stored without a hint while the primary was unavailable
+        return self.local.retrieve(key)
+
+    def delete(self, key):
+        if key.startswith(LOCAL_HINT):
+            key = key[len(LOCAL_HINT):]
+        self.local.delete(key)
+        try:
+            self._call_primary(self.primary.delete, key)
+        except PrimaryUnavailable:
+            pass
+
+    def purge_expired(self):
+        self.local.purge_expired()
+        self.primary.purge_expired()
+
+backend = TieredStore
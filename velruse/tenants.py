@@ -0,0 +1,328 @@
+"""Providers with per-tenant credentials
+
+A single route pair per provider type serves every tenant, for example
+``/login/{tenant}/github`` and ``/login/{tenant}/github/callback``. The
+credentials of a tenant are loaded at request time from a credential
+source and the provider object built from them is kept in a bounded LRU
+cache for ``tenants.cache_ttl`` seconds. Adding or changing a tenant needs
+neither new routes nor a restart; :meth:`TenantProviders.invalidate` drops
+cached entries early.
+
+The login contexts of tenant providers have a ``tenant`` attribute, which
+the standalone app adds to the result.
+
+Example settings:
+
+.. code-block:: ini
+
+    tenants.providers = github facebook
+    tenants.source = settings
+    tenants.cache_size = 1000
+    tenants.cache_ttl = 300
+
+    tenant.acme.github.consumer_key = ...
+    tenant.acme.github.consumer_secret = ...
+
+Credential sources, selected by ``tenants.source``:
+
+``settings`` (default)
+    ``tenant.<tenant>.<provider>.consumer_key``, ``consumer_secret`` and
+    ``scope`` settings, see :class:`SettingsSource`.
+
+``store``
+    A dict per tenant and provider in a key/value store of its own, see
+    :class:`StoreSource`. The :mod:`anykeystore` backend is configured
+    with ``tenants.store.store`` and further ``tenants.store.*`` settings,
+    like the velruse store with ``store.*``. It must not be the velruse
+    store, whose keys ``auth_info`` hands out to anyone holding a token.
+
+``sql``
+    A table queried over a DB-API connection, see :class:`SQLSource`.
+    ``tenants.sql.connect`` is the dotted name of a callable returning a
+    new connection.
+"""
+from collections import OrderedDict
+import json
+import threading
+import time
+
+from anykeystore import create_store_from_settings
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.path import DottedNameResolver
+from pyramid.security import NO_PERMISSION_REQUIRED
+from pyramid.settings import aslist
+
+
+# provider classes by implementation
+provider_classes = {
+    'bitbucket': 'velruse.providers.bitbucket.BitbucketProvider',
+    'douban': 'velruse.providers.douban.DoubanProvider',
+    'facebook': 'velruse.providers.facebook.FacebookProvider',
+    'github': 'velruse.providers.github.GithubProvider',
+    'lastfm': 'velruse.providers.lastfm.LastfmProvider',
+    'linkedin': 'velruse.providers.linkedin.LinkedInProvider',
+    'live': 'velruse.providers.live.LiveProvider',
+    'qq': 'velruse.providers.qq.QQProvider',
+    'renren': 'velruse.providers.renren.RenrenProvider',
+    'taobao': 'velruse.providers.taobao.TaobaoProvider',
+    'twitter': 'velruse.providers.twitter.TwitterProvider',
+    'weibo': 'velruse.providers.weibo.WeiboProvider',
+}
+
+
+class SettingsSource(object):
+    """Load credentials from ``<prefix><tenant>.<provider>.*`` settings"""
+
+    def __init__(self, settings, prefix='tenant.'):
+        self.settings = settings
+        self.prefix = prefix
+
+    def load(self, tenant, provider):
+        prefix = '%s%s.%s.' % (self.prefix, tenant, provider)
+        key = self.settings.get(prefix + 'consumer_key')
+        if key is None:
+            return None
+        return {
+            'consumer_key': key,
+            'consumer_secret': self.settings.get(prefix + 'consumer_secret'),
+            'scope': self.settings.get(prefix + 'scope'),
+        }
+
+
+class StoreSource(object):
+    """Load credentials from a key/value store.
+
+    The value at ``<key_prefix><tenant>:<provider>`` is a dict, or its JSON
+    encoding, with ``consumer_key``, ``consumer_secret`` and optionally
+    ``scope``.
+    """
+
+    def __init__(self, store, key_prefix='velruse_tenant:'):
+        self.store = store
+        self.key_prefix = key_prefix
+
+    def load(self, tenant, provider):
+        try:
+            data = self.store.retrieve(
+                '%s%s:%s' % (self.key_prefix, tenant, provider))
+        except KeyError:
+            return None
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if not isinstance(data, dict):
+            data = json.loads(data)
+        return data
+
+
+class SQLSource(object):
+    """Load credentials from a table with ``tenant``, ``provider``,
+    ``consumer_key``, ``consumer_secret`` and ``scope`` columns.
+
+    ``connect`` returns a new DB-API connection, one is opened per thread.
+    ``paramstyle`` is the placeholder style of the database module.
+    """
+
+    placeholders = {
+        'qmark': ('?', '?'),
+        'format': ('%s', '%s'),
+        'pyformat': ('%(tenant)s', '%(provider)s'),
+        'named': (':tenant', ':provider'),
+        'numeric': (':1', ':2'),
+    }
+
+    def __init__(self, connect, table='velruse_tenants', paramstyle='qmark'):
+        self.connect = connect
+        self.paramstyle = paramstyle
+        self.query = (
+            'SELECT consumer_key, consumer_secret, scope FROM %s '
+            'WHERE tenant = %s AND provider = %s'
+            % ((table,) + self.placeholders[paramstyle]))
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    def load(self, tenant, provider):
+        if self.paramstyle in ('pyformat', 'named'):
+            params = {'tenant': tenant, 'provider': provider}
+        else:
+            params = (tenant, provider)
+        cursor = self._connection().cursor()
+        try:
+            cursor.execute(self.query, params)
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        if row is None:
+            return None
+        return {
+            'consumer_key': row[0],
+            'consumer_secret': row[1],
+            'scope': row[2],
+        }
+
+
+class TenantProviders(object):
+    """Build and cache the provider objects of each tenant.
+
+    At most ``max_entries`` providers are cached, the least recently used
+    are evicted first. Entries expire after ``ttl`` seconds; unknown tenants
+    are cached as well so they do not hit the source on every request.
+    """
+
+    def __init__(self, source, max_entries=1000, ttl=300):
+        self.source = source
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._classes = {}
+        self._resolver = DottedNameResolver()
+
+    def _create(self, tenant, impl, credentials):
+        cls = self._classes.get(impl)
+        if cls is None:
+            cls = self._classes[impl] = \
+                    self._resolver.resolve(provider_classes[impl])
+        args = [tenant_provider_name(impl), credentials['consumer_key'],
+                credentials['consumer_secret']]
+        # the OAuth2 providers take a scope
+        if hasattr(cls, 'default_scope'):
+            args.append(credentials.get('scope'))
+        return cls(*args)
+
+    def get(self, tenant, impl):
+        """Return the provider of ``tenant`` or ``None`` if it has none"""
+        key = (tenant, impl)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is not None and now < entry[1]:
+                self._cache[key] = entry
+                return entry[0]
+
+        credentials = self.source.load(tenant, impl)
+        provider = None
+        if credentials:
+            provider = self._create(tenant, impl, credentials)
+
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (provider, now + self.ttl)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return provider
+
+    def invalidate(self, tenant=None, impl=None):
+        """Drop the cached providers of ``tenant`` and/or ``impl``.
+
+        Without arguments the whole cache is cleared.
+        """
+        with self._lock:
+            for key in list(self._cache):
+                if (tenant is None or key[0] == tenant) and \
+                        (impl is None or key[1] == impl):
+                    del self._cache[key]
+
+
+def tenant_provider_name(impl):
+    return 'tenant-%s' % impl
+
+
+def tenant_pregenerator(request, elements, kw):
+    """Fill in the tenant of the current request when generating URLs"""
+    if 'tenant' not in kw and request.matchdict:
+        kw['tenant'] = request.matchdict.get('tenant')
+    return elements, kw
+
+
+def tenant_login_url(request, impl, tenant):
+    """Generate the login URL of ``tenant`` for a provider."""
+    route = 'velruse.%s-login' % tenant_provider_name(impl)
+    return request.route_url(route, tenant=tenant)
+
+
+def _tenant_provider(request, impl):
+    tenant = request.matchdict['tenant']
+    provider = request.registry.velruse_tenants.get(tenant, impl)
+    if provider is None:
+        raise HTTPNotFound('unknown tenant "%s"' % tenant)
+    return tenant, provider
+
+
+def add_tenant_login(config, impl,
+                     login_path='/login/{tenant}/%s',
+                     callback_path='/login/{tenant}/%s/callback'):
+    """Add the routes serving ``impl`` logins for every tenant."""
+    if impl not in provider_classes:
+        raise ConfigurationError('unknown provider "%s"' % impl)
+    if '%s' in login_path:
+        login_path = login_path % impl
+    if '%s' in callback_path:
+        callback_path = callback_path % impl
+    name = tenant_provider_name(impl)
+
+    def login(request):
+        tenant, provider = _tenant_provider(request, impl)
+        return provider.login(request)
+
+    def callback(request):
+        tenant, provider = _tenant_provider(request, impl)
+        context = provider.callback(request)
+        context.tenant = tenant
+        return context
+
+    login_route = 'velruse.%s-login' % name
+    config.add_route(login_route, login_path,
+                     pregenerator=tenant_pregenerator)
+    config.add_view(login, route_name=login_route,
+                    permission=NO_PERMISSION_REQUIRED)
+
+    config.add_route('velruse.%s-callback' % name, callback_path,
+                     use_global_views=True,
+                     factory=callback,
+                     pregenerator=tenant_pregenerator)
+
+
+def create_source(config):
+    settings = config.registry.settings
+    source = settings.get('tenants.source', 'settings')
+    if source == 'settings':
+        return SettingsSource(settings)
+    if source == 'store':
+        if not settings.get('tenants.store.store'):
+            raise ConfigurationError(
+                'missing required setting "tenants.store.store"')
+        options = dict((k, v) for k, v in settings.items()
+                       if k.startswith('tenants.store.')
+                       and k != 'tenants.store.key_prefix')
+        store = create_store_from_settings(options, prefix='tenants.store.')
+        return StoreSource(store,
+                           settings.get('tenants.store.key_prefix',
+                                        'velruse_tenant:'))
+    if source == 'sql':
+        connect = settings.get('tenants.sql.connect')
+        if not connect:
+            raise ConfigurationError(
+                'missing required setting "tenants.sql.connect"')
+        return SQLSource(config.maybe_dotted(connect),
+                         settings.get('tenants.sql.table', 'velruse_tenants'),
+                         settings.get('tenants.sql.paramstyle', 'qmark'))
+    raise ConfigurationError('unknown tenant source "%s"' % source)
+
+
+def includeme(config):
+    """Serve the providers listed in ``tenants.providers`` for tenants."""
+    settings = config.registry.settings
+    config.add_directive('add_tenant_login', add_tenant_login)
+    config.registry.velruse_tenants = TenantProviders(
+        create_source(config),
+        max_entries=settings.get('tenants.cache_size', 1000),
+        ttl=settings.get('tenants.cache_ttl', 300))
+    for impl in aslist(settings.get('tenants.providers', '')):
+        config.add_tenant_login(impl)
@@ -1,4 +1,8 @@
 """Utilities for the auth functionality"""
+import hmac
+from bisect import bisect_left
+from hashlib import md5
+
 from pyramid.compat import PY3
 if PY3:
     from urllib.parse import urlencode
@@ -10,3 +14,155 @@ def flat_url(url, **kw):
     """Creates a URL with the query param encoded"""
     url += '?' + urlencode(kw)
     return url
+
+
+try:
+    compare_digest = hmac.compare_digest
+except AttributeError:  # pragma: no cover
+    def compare_digest(a, b):
+        """Compare two byte strings in constant time"""
+        if len(a) != len(b):
+            return False
+        result = 0
+        for x, y in zip(bytearray(a), bytearray(b)):
+            result |= x ^ y
+        return result == 0
+
+
+class RouteURLCache(object):
+    """Cache of generated route URLs
+
+    The URL of a route without replacement markers only depends on the
+    scheme, host and script name of the request, i.e. on
+    ``request.application_url``. Routes with a pregenerator, such as the
+    tenant routes, are additionally keyed by the matchdict of the request.
+
+    The Host header is chosen by the client, so the cache is emptied once
+    it holds ``max_entries`` URLs rather than growing without bounds.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = int(max_entries)
+        self.urls = {}
+        self._keyed_by_match = {}
+
+    def _by_match(self, request, route_name):
+        by_match = self._keyed_by_match.get(route_name)
+        if by_match is None:
+            from pyramid.interfaces import IRoutesMapper
+            mapper = request.registry.getUtility(IRoutesMapper)
+            route = mapper.get_route(route_name)
+            by_match = route is not None and route.pregenerator is not None
+            self._keyed_by_match[route_name] = by_match
+        return by_match
+
+    def get(self, key, create):
+        """Return the value cached for ``key``, calling ``create`` to make
+        it when missing"""
+        try:
+            return self.urls[key]
+        except KeyError:
+            pass
+        value = create()
+        if len(self.urls) >= self.max_entries:
+            self.urls = {}
+        self.urls[key] = value
+        return value
+
+    def route_url(self, request, route_name):
+        key = (route_name, request.application_url)
+        if request.matchdict and self._by_match(request, route_name):
+            key += tuple(sorted(request.matchdict.items()))
+        return self.get(key, lambda: request.route_url(route_name))
+
+    def clear(self):
+        self.urls = {}
+
+
+def url_cache(registry):
+    """Return the :class:`RouteURLCache` of ``registry``"""
+    cache = getattr(registry, 'velruse_url_cache', None)
+    if cache is None:
+        settings = registry.settings or {}
+        cache = RouteURLCache(settings.get('url_cache_size', 1000))
+        registry.velruse_url_cache = cache
+    return cache
+
+
+def cached_route_url(request, route_name):
+    """Return ``request.route_url(route_name)``, cached per host"""
+    return url_cache(request.registry).route_url(request, route_name)
+
+
+class URLTemplate(object):
+    """A URL whose unchanging query parameters are encoded once
+
+    ``static`` parameters are encoded when the template is created, calling
+    the template only encodes the parameters passed to the call::
+
+        authorize_url = URLTemplate('https://example.com/authorize',
+                                    client_id='abc', response_type='code')
+        authorize_url(state=state)
+    """
+
+    def __init__(self, url, **static):
+        self.url = url
+        if static:
+            self.prefix = url + '?' + urlencode(static)
+            self.separator = '&'
+        else:
+            self.prefix = url
+            self.separator = '?'
+
+    def __call__(self, **kw):
+        if not kw:
+            return self.prefix
+        return self.prefix + self.separator + urlencode(kw)
+
+
+class MD5Signer(object):
+    """Sign API calls with the md5 of their sorted parameters
+
+    The signature is the hex md5 of ``prefix``, the ``key + value`` of every
+    parameter sorted by key and ``suffix``. The ``static`` parameters are
+    sorted and encoded once, and the hash state after ``prefix`` and each
+    leading static parameter is kept, so a call only hashes the parameters
+    from its first own key onwards::
+
+        sign = MD5Signer(prefix=secret, suffix=secret, app_key='abc')
+        sign(session=token, timestamp=now)
+
+    Parameters passed to the call replace static parameters of the same
+    name.
+    """
+
+    def __init__(self, prefix='', suffix='', upper=False, **static):
+        self.static = [(k, ('%s%s' % (k, v)).encode('utf-8'))
+                       for k, v in sorted(static.items())]
+        self.keys = [k for k, pair in self.static]
+        self.suffix = suffix.encode('utf-8')
+        self.upper = upper
+        hasher = md5(prefix.encode('utf-8'))
+        self.primed = [hasher.copy()]
+        for k, pair in self.static:
+            hasher.update(pair)
+            self.primed.append(hasher.copy())
+
+    def __call__(self, **params):
+        static = self.static
+        n = len(static)
+        params = sorted(params.items())
+        i = bisect_left(self.keys, params[0][0]) if params else n
+        hasher = self.primed[i].copy()
+        for k, v in params:
+            while i < n and static[i][0] < k:
+                hasher.update(static[i][1])
+                i += 1
+            if i < n and static[i][0] == k:
+                i += 1
+            hasher.update(('%s%s' % (k, v)).encode('utf-8'))
+        for k, pair in static[i:]:
+            hasher.update(pair)
+        hasher.update(self.suffix)
+        digest = hasher.hexdigest()
+        return digest.upper() if self.upper else digest